@@ -1,4 +1,4 @@
-from antiabuse.normalize import normalize_string
+from antiabuse.normalize import normalize_string_variants
 from antiabuse.normalize.normalizationlists import chat
 import re
 
@@ -16,8 +16,7 @@ _rude_matcher = re.compile(_rude_pattern, re.IGNORECASE)
 
 
 def is_rude(s: str) -> bool:
-    return \
-            bool(_rude_matcher.search(
-                normalize_string(s, chat, do_remove_modifiers=False))) or \
-            bool(_rude_matcher.search(
-                normalize_string(s, chat, do_remove_modifiers=True)))
+    return any(
+        _rude_matcher.search(normalized)
+        for normalized in normalize_string_variants(s, chat)
+    )
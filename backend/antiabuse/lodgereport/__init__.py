@@ -1,6 +1,7 @@
 from database import (
     api_tx,
     row_bool,
+    row_int,
     row_str,
     row_str_list,
     row_value,
@@ -21,6 +22,8 @@ from antiabuse.lodgereport.constants import (
     TRUSTWORTHY_MIN_PEOPLE_MESSAGED,
     TRUSTWORTHY_MIN_QUESTIONS_ANSWERED,
 )
+from chatauthcache import invalidate_shadow_banned, invalidate_skipped
+from chatratelimit import record_report
 from smtp import aws_smtp
 import traceback
 import threading
@@ -266,10 +269,9 @@ def skip_by_uuid(subject_uuid: str, object_uuid: str, reason: str) -> None:
     is_shadow_banned = False
 
     with api_tx() as tx:
-        is_automoded_bot = row_bool(
-            tx.require_one(Q_INSERT_SKIPPED, params=params),
-            'is_automoded_bot',
-        )
+        skipped = tx.require_one(Q_INSERT_SKIPPED, params=params)
+
+        is_automoded_bot = row_bool(skipped, 'is_automoded_bot')
 
         if reason:
             row = tx.require_one(
@@ -294,6 +296,17 @@ def skip_by_uuid(subject_uuid: str, object_uuid: str, reason: str) -> None:
             if is_shadow_banned:
                 tx.execute(Q_SHADOW_BAN, params=params)
 
+    subject_person_id = row_int(skipped, 'subject_person_id')
+    object_person_id = row_int(skipped, 'object_person_id')
+
+    invalidate_skipped(subject_person_id, object_person_id)
+
+    if row_bool(skipped, 'is_rate_limiting_report'):
+        record_report(object_person_id, subject_person_id)
+
+    if is_shadow_banned:
+        invalidate_shadow_banned(object_person_id)
+
     if reason:
         lodge_report(
             subject_uuid=subject_uuid,
@@ -1,16 +1,32 @@
 from confusable_homoglyphs import confusables
 import re
 import unicodedata
-from functools import cache
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from functools import cache, lru_cache
 from typing import Callable
 import spacy
 from spacy.tokens import Token
 
-_spacy_nlp = spacy.load("en_core_web_sm")
 
+# `remove_modifiers` only needs parts of speech, which come from the tagger
+# and the attribute ruler (which maps the tagger's tags onto `Token.pos_`).
+_SPACY_EXCLUDED_COMPONENTS = [
+    "lemmatizer",
+    "ner",
+    "parser",
+]
 
+
+@cache
+def _spacy_nlp() -> spacy.language.Language:
+    return spacy.load("en_core_web_sm", exclude=_SPACY_EXCLUDED_COMPONENTS)
+
+
+@lru_cache(maxsize=4096)
 def remove_modifiers(text: str) -> str:
-    document = _spacy_nlp(text)
+    document = _spacy_nlp()(text)
     modifier_pos = {"ADJ", "ADV"}
     was_last_token_dropped = False
 
@@ -274,7 +290,14 @@ def char_to_regex(c: str, is_initial: bool, is_final: bool, is_short: bool) -> s
     return rf'[{re_chars}]{re_quantifier}'
 
 
-def suffix_class_instance_to_regex(suffix_class_instance: str) -> str:
+def _group(capture: bool) -> str:
+    return '(' if capture else '(?:'
+
+
+def suffix_class_instance_to_regex(
+    suffix_class_instance: str,
+    capture: bool = True,
+) -> str:
     suffix_class_instance_with_elision = ''.join(
         c
         for i, c in enumerate(suffix_class_instance)
@@ -285,7 +308,7 @@ def suffix_class_instance_to_regex(suffix_class_instance: str) -> str:
 
     is_short = len(suffix_class_instance_with_elision) <= 3
 
-    return '(' + ''.join(
+    return _group(capture) + ''.join(
         char_to_regex(
             c=c,
             is_initial=i == 0,
@@ -296,14 +319,17 @@ def suffix_class_instance_to_regex(suffix_class_instance: str) -> str:
     ) + ')'
 
 
-def suffix_class_to_regex(suffix_class: list[str]) -> str:
-    return '(' + '|'.join(
-        suffix_class_instance_to_regex(suffix_class_instance)
+def suffix_class_to_regex(suffix_class: list[str], capture: bool = True) -> str:
+    return _group(capture) + '|'.join(
+        suffix_class_instance_to_regex(suffix_class_instance, capture)
         for suffix_class_instance in suffix_class
     ) + ')'
 
 
-def word_class_instance_to_regex(word_class_instance: str) -> str:
+def word_class_instance_to_regex(
+    word_class_instance: str,
+    capture: bool = True,
+) -> str:
     for suffix in _closed_class_slang_suffixes:
         if word_class_instance.endswith(suffix):
             without_suffix = word_class_instance[:-len(suffix)]
@@ -313,29 +339,31 @@ def word_class_instance_to_regex(word_class_instance: str) -> str:
                 for suffix_class_instance in _closed_class_slang_suffixes[suffix]
             ]
 
-            return suffix_class_to_regex([word_class_instance] + with_suffixes)
+            return suffix_class_to_regex(
+                    [word_class_instance] + with_suffixes, capture)
 
-    return suffix_class_to_regex([word_class_instance])
+    return suffix_class_to_regex([word_class_instance], capture)
 
 
 
-def word_class_to_regex(word_class: list[str]) -> str:
-    return '(' + '|'.join(
-        word_class_instance_to_regex(word_class_instance)
+def word_class_to_regex(word_class: list[str], capture: bool = True) -> str:
+    return _group(capture) + '|'.join(
+        word_class_instance_to_regex(word_class_instance, capture)
         for word_class_instance in word_class
     ) + ')'
 
 
-def word_to_regex(word: str) -> str:
+def word_to_regex(word: str, capture: bool = True) -> str:
     if word in _closed_class_slang_words:
-        return word_class_to_regex([word] + _closed_class_slang_words[word])
+        return word_class_to_regex(
+                [word] + _closed_class_slang_words[word], capture)
     else:
-        return word_class_to_regex([word])
+        return word_class_to_regex([word], capture)
 
 
-def phrase_to_regex(phrase: str) -> str:
-    return '(' + '[ -]?'.join(
-            word_to_regex(word) for word in phrase.split(' ')
+def phrase_to_regex(phrase: str, capture: bool = True) -> str:
+    return _group(capture) + '[ -]?'.join(
+            word_to_regex(word, capture) for word in phrase.split(' ')
     ) + ')'
 
 
@@ -350,13 +378,34 @@ def phrase_to_pattern(phrase: str) -> re.Pattern[str]:
             re.IGNORECASE)
 
 
+def phrases_to_pattern(phrases: Sequence[str]) -> re.Pattern[str]:
+    """
+    A single pattern which matches wherever any of `phrases` would match.
+
+    The alternatives don't capture: Python's `re` slows down by an order of
+    magnitude when an alternation carries thousands of capturing groups.
+    """
+    needle = '|'.join(phrase_to_regex(phrase, capture=False) for phrase in phrases)
+
+    return re.compile(
+            r'(?:(?<=[^a-z0-9])|^)'
+            f'(?:{needle})'
+            r'(?:(?=[^a-z0-9])|$)',
+            re.IGNORECASE)
+
+
+_safe_phrase_patterns = [
+    re.compile(re_safe_phrase, re.IGNORECASE)
+    for re_safe_phrase in _closed_class_safe_phrases
+]
+
+
 @cache
 def make_sub_unless_safe(phrase: str) -> Callable[[re.Match[str]], str]:
     def sub_unless_safe(match: re.Match[str]) -> str:
         matched_text = match.group(0)
 
-        for re_safe_phrase in _closed_class_safe_phrases:
-            safe_pattern = re.compile(re_safe_phrase, re.IGNORECASE)
+        for safe_pattern in _safe_phrase_patterns:
             if safe_pattern.fullmatch(matched_text):
                 return matched_text
 
@@ -365,13 +414,69 @@ def make_sub_unless_safe(phrase: str) -> Callable[[re.Match[str]], str]:
     return sub_unless_safe
 
 
+# How many phrases share one combined pattern when a haystack needs rewriting
+_PHRASE_BLOCK_SIZE = 16
+
+
+@dataclass(frozen=True)
+class _PhraseBlock:
+    pattern: re.Pattern[str]
+    phrases: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class _SpellingNormalizer:
+    pattern: re.Pattern[str]
+    blocks: tuple[_PhraseBlock, ...]
+
+
+@cache
+def _spelling_normalizer(phrases: tuple[str, ...]) -> _SpellingNormalizer:
+    blocks = tuple(
+        _PhraseBlock(
+            pattern=phrases_to_pattern(block_phrases),
+            phrases=block_phrases,
+        )
+        for i in range(0, len(phrases), _PHRASE_BLOCK_SIZE)
+        for block_phrases in [phrases[i:i + _PHRASE_BLOCK_SIZE]]
+    )
+
+    return _SpellingNormalizer(
+        pattern=phrases_to_pattern(phrases),
+        blocks=blocks,
+    )
+
+
 def _normalize_spelling(haystack: str, normalizeable_phrases: list[str]) -> str:
-    for phrase in normalizeable_phrases:
-        sub_unless_safe = make_sub_unless_safe(phrase)
+    """
+    Substitutes each phrase in `normalizeable_phrases`, in order, for its
+    misspellings in `haystack`.
+
+    Most haystacks contain none of the phrases, so one combined pattern rules
+    that out before any per-phrase work happens. Otherwise, phrases are
+    substituted one at a time, as a later phrase can match text produced by an
+    earlier substitution. But a block of phrases whose combined pattern
+    doesn't match the current haystack can't change it, so it's skipped
+    whole.
+    """
+    if not normalizeable_phrases:
+        return haystack
+
+    normalizer = _spelling_normalizer(tuple(normalizeable_phrases))
+
+    if not normalizer.pattern.search(haystack):
+        return haystack
 
-        pattern = phrase_to_pattern(phrase)
+    for block in normalizer.blocks:
+        if not block.pattern.search(haystack):
+            continue
 
-        haystack = pattern.sub(sub_unless_safe, haystack)
+        for phrase in block.phrases:
+            sub_unless_safe = make_sub_unless_safe(phrase)
+
+            pattern = phrase_to_pattern(phrase)
+
+            haystack = pattern.sub(sub_unless_safe, haystack)
 
     return haystack
 
@@ -380,11 +485,7 @@ def _remove_zero_width_characters(s: str) -> str:
     return _zero_width_chars.sub('', s)
 
 
-def normalize_string(
-    s: str,
-    normalizeable_phrases: list[str],
-    do_remove_modifiers: bool = False
-) -> str:
+def _normalize_characters(s: str) -> str:
     normalized_input = unicodedata.normalize('NFKD', s)
     normalized_input = ''.join(
         char for char in normalized_input if not unicodedata.combining(char)
@@ -403,6 +504,16 @@ def normalize_string(
     # Remove zero width characters
     normalized_input = _remove_zero_width_characters(normalized_input)
 
+    return normalized_input
+
+
+def normalize_string(
+    s: str,
+    normalizeable_phrases: list[str],
+    do_remove_modifiers: bool = False
+) -> str:
+    normalized_input = _normalize_characters(s)
+
     # Remove adverbs and adjectives
     if do_remove_modifiers:
         normalized_input = remove_modifiers(normalized_input)
@@ -411,3 +522,80 @@ def normalize_string(
     normalized_input = _normalize_spelling(normalized_input, normalizeable_phrases)
 
     return normalized_input
+
+
+def _word_to_skeleton_regex(word: str) -> str:
+    # A spelling which spans several tokens (e.g. "your self") might have had
+    # a modifier between them, so anything goes
+    if any(' ' in slang for slang in _closed_class_slang_words.get(word, [])):
+        return ''
+
+    return word_to_regex(word, capture=False)
+
+
+@cache
+def _phrase_skeleton_pattern(phrases: tuple[str, ...]) -> re.Pattern[str]:
+    """
+    A pattern which matches the tokens of a string wherever removing some of
+    them could leave one of `phrases` behind. That is, wherever the words of
+    a phrase occur in order, with anything at all between them.
+
+    Phrases are grouped by their first word because Python's `re` tries every
+    branch of an alternation at every position.
+    """
+    rests_by_first_word: defaultdict[str, set[str]] = defaultdict(set)
+
+    for phrase in phrases:
+        first_word, *rest_words = phrase.split(' ')
+
+        rests_by_first_word[first_word].add(''.join(
+            '.*?' + _word_to_skeleton_regex(word) for word in rest_words
+        ))
+
+    needle = '|'.join(
+        _word_to_skeleton_regex(first_word) + '(?:' + '|'.join(sorted(rests)) + ')'
+        for first_word, rests in rests_by_first_word.items()
+    )
+
+    return re.compile(
+            r'(?:(?<=[^a-z0-9])|^)'
+            f'(?:{needle})'
+            r'(?:(?=[^a-z0-9])|$)',
+            re.IGNORECASE | re.DOTALL)
+
+
+def _could_remove_modifiers_reveal_phrase(
+    normalized_input: str,
+    normalizeable_phrases: list[str],
+) -> bool:
+    # `remove_modifiers` only ever drops whole tokens and joins those left
+    # with spaces, so any phrase it reveals has its words, in order, in the
+    # tokens it started with. Tokenizing is cheap; tagging isn't.
+    tokens = ' '.join(token.text for token in _spacy_nlp().tokenizer(normalized_input))
+
+    pattern = _phrase_skeleton_pattern(tuple(normalizeable_phrases))
+
+    return bool(pattern.search(tokens))
+
+
+def normalize_string_variants(
+    s: str,
+    normalizeable_phrases: list[str],
+) -> Iterator[str]:
+    """
+    Yields `s` normalized as by `normalize_string`, first without removing
+    modifiers and then with. The second variant is only yielded when removing
+    modifiers could reveal one of `normalizeable_phrases`, which is rare.
+    Callers searching for phrases should stop at the first variant which
+    matches, so that spaCy is only run when it might change the answer.
+    """
+    normalized_input = _normalize_characters(s)
+
+    yield _normalize_spelling(normalized_input, normalizeable_phrases)
+
+    if not _could_remove_modifiers_reveal_phrase(
+            normalized_input, normalizeable_phrases):
+        return
+
+    yield _normalize_spelling(
+            remove_modifiers(normalized_input), normalizeable_phrases)
@@ -0,0 +1,99 @@
+"""
+Times `_normalize_spelling` over the strings in the antirude test corpora,
+against the one-`pattern.sub`-per-phrase loop it replaced, and checks that
+both give identical output.
+
+    python3 -m antiabuse.normalize.benchmark
+"""
+
+import ast
+import time
+from pathlib import Path
+from typing import Callable
+from antiabuse.normalize import (
+    _normalize_spelling,
+    make_sub_unless_safe,
+    phrase_to_pattern,
+)
+from antiabuse.normalize.normalizationlists import (
+    chat,
+    display_name,
+    profile,
+)
+
+_ANTIRUDE_DIR = Path(__file__).parent.parent / 'antirude'
+
+_REPETITIONS = 3
+
+
+def _corpus() -> list[str]:
+    return [
+        node.value
+        for test_file in sorted(_ANTIRUDE_DIR.glob('*/test_init.py'))
+        for node in ast.walk(ast.parse(test_file.read_text()))
+        if isinstance(node, ast.Constant) and isinstance(node.value, str)
+    ]
+
+
+def _sequential_normalize_spelling(
+    haystack: str,
+    normalizeable_phrases: list[str],
+) -> str:
+    for phrase in normalizeable_phrases:
+        pattern = phrase_to_pattern(phrase)
+        haystack = pattern.sub(make_sub_unless_safe(phrase), haystack)
+    return haystack
+
+
+def _microseconds_per_string(
+    corpus: list[str],
+    normalizeable_phrases: list[str],
+    normalize_spelling: Callable[[str, list[str]], str],
+) -> float:
+    # Warm the pattern caches so that compilation isn't timed
+    for haystack in corpus:
+        normalize_spelling(haystack, normalizeable_phrases)
+
+    start = time.perf_counter()
+    for _ in range(_REPETITIONS):
+        for haystack in corpus:
+            normalize_spelling(haystack, normalizeable_phrases)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / _REPETITIONS / len(corpus) * 1e6
+
+
+def main() -> None:
+    corpus = _corpus()
+
+    print(f'{len(corpus)} strings')
+
+    lists = dict(
+        chat=chat,
+        display_name=display_name,
+        profile=profile,
+    )
+
+    for name, normalizeable_phrases in lists.items():
+        identical = all(
+            _normalize_spelling(haystack, normalizeable_phrases) ==
+            _sequential_normalize_spelling(haystack, normalizeable_phrases)
+            for haystack in corpus
+        )
+
+        before = _microseconds_per_string(
+            corpus, normalizeable_phrases, _sequential_normalize_spelling)
+        after = _microseconds_per_string(
+            corpus, normalizeable_phrases, _normalize_spelling)
+
+        print(
+            f'{name}: {len(normalizeable_phrases)} phrases, '
+            f'identical={identical}, '
+            f'sequential={before:.0f}us, '
+            f'combined={after:.0f}us, '
+            f'speedup={before / after:.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
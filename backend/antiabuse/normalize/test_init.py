@@ -1,7 +1,12 @@
 import unittest
 from antiabuse.normalize import (
+    _normalize_spelling,
+    make_sub_unless_safe,
     normalize_string,
+    normalize_string_variants,
+    phrase_to_pattern,
 )
+from antiabuse.normalize.normalizationlists import chat
 
 class TestNormalizeString(unittest.TestCase):
     def test_normalize_string(self) -> None:
@@ -29,5 +34,46 @@ class TestNormalizeString(unittest.TestCase):
                 "I'm gonna rape you")
 
 
+class TestNormalizeSpelling(unittest.TestCase):
+    def test_matches_sequential_substitution(self) -> None:
+        def reference(haystack: str) -> str:
+            for phrase in chat:
+                pattern = phrase_to_pattern(phrase)
+                haystack = pattern.sub(make_sub_unless_safe(phrase), haystack)
+            return haystack
+
+        haystacks = [
+            "",
+            "hey, how's your day going?",
+            "I'm gonna fck you",
+            "wanna see my d1ck?",
+            "u r a b1tch and a wh0re",
+            "I'd kil u, jk",
+            "hello. s3nd nudes pls",
+            "Assume nothing",
+        ]
+
+        for haystack in haystacks:
+            self.assertEqual(
+                    _normalize_spelling(haystack, chat),
+                    reference(haystack))
+
+
+class TestNormalizeStringVariants(unittest.TestCase):
+    def test_modifiers_are_only_removed_when_they_might_hide_a_phrase(self) -> None:
+        normalizeable_phrases = [
+            "kill you",
+        ]
+
+        self.assertEqual(
+                list(normalize_string_variants("hi", normalizeable_phrases)),
+                ["hi"])
+
+        self.assertEqual(
+                list(normalize_string_variants(
+                    "I will brutally kill you", normalizeable_phrases)),
+                ["I will brutally kill you", "I will kill you"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -230,14 +230,30 @@ WITH subject_person_id AS (
         %(reported)s,
         %(report_reason)s
     ) ON CONFLICT DO NOTHING
+    RETURNING
+        reported
 ), q2 AS (
-    DELETE FROM search_cache
+    -- Blanks out, rather than removes, each person from the other's search
+    -- results, so that later results keep their positions
+    UPDATE
+        search_cache
+    SET
+        prospect_person_ids = array_replace(
+            prospect_person_ids,
+            CASE
+                WHEN searcher_person_id = (SELECT id FROM subject_person_id)
+                THEN (SELECT id FROM object_person_id)
+                ELSE (SELECT id FROM subject_person_id)
+            END,
+            NULL
+        ),
+        updated_at = NOW()
     WHERE
         searcher_person_id = (SELECT id FROM subject_person_id) AND
-        prospect_person_id = (SELECT id FROM object_person_id)
+        (SELECT id FROM object_person_id) = ANY(prospect_person_ids)
     OR
         searcher_person_id = (SELECT id FROM object_person_id) AND
-        prospect_person_id = (SELECT id FROM subject_person_id)
+        (SELECT id FROM subject_person_id) = ANY(prospect_person_ids)
 ), q3 AS (
     UPDATE
         person
@@ -252,9 +268,28 @@ WITH subject_person_id AS (
     RETURNING
         1
 )
-SELECT EXISTS (
-    SELECT * FROM q3
-) AS is_automoded_bot
+SELECT
+    (SELECT id FROM subject_person_id) AS subject_person_id,
+    (SELECT id FROM object_person_id) AS object_person_id,
+    EXISTS (
+        SELECT * FROM q3
+    ) AS is_automoded_bot,
+    -- Whether this is a new report which counts towards the reported person's
+    -- rate limit. Reports from bots don't.
+    EXISTS (
+        SELECT
+            1
+        FROM
+            q1
+        JOIN
+            person AS reporter
+        ON
+            reporter.uuid = uuid_or_null(%(subject_uuid)s::TEXT)
+        WHERE
+            q1.reported
+        AND
+            NOT reporter.roles @> ARRAY['bot']
+    ) AS is_rate_limiting_report
 """
 
 Q_TRUSTWORTHY_REPORTS = """
@@ -107,3 +107,178 @@ class Batcher(Generic[T]):
 
     def stop(self) -> None:
         self._stop_event.set()
+
+
+class AsyncBatcher(Generic[T]):
+    """
+    A `Batcher` for asyncio services. Batches are collected by a task on the
+    running event loop instead of a thread, and `process_fn` is a coroutine
+    function, so it can use `database.asyncdatabase` rather than holding a
+    synchronous connection of its own.
+
+    `start` can be called before the event loop is running (e.g. at import
+    time). The task is then started by the first `enqueue` made on the loop.
+    """
+
+    def __init__(
+        self,
+        process_fn: Callable[[list[T]], Awaitable[None]],
+        flush_interval: float,
+        min_batch_size: int = 1,
+        max_batch_size: int = 100,
+        retry: bool = False
+    ):
+        self._queue: asyncio.Queue[tuple[float, BatchItem[T]]] = asyncio.Queue()
+        self._process_fn = process_fn
+        self._flush_interval = flush_interval
+        self._min_batch_size = min_batch_size
+        self._max_batch_size = max_batch_size
+        self._retry = retry
+        self._is_started = False
+        self._task: asyncio.Task[None] | None = None
+        self._callback_tasks: set[asyncio.Task[None]] = set()
+
+        self._batches = 0
+        self._items = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def enqueue(
+        self,
+        item: T,
+        callback: Callable[[], None] | Callable[[], Awaitable[None]] | None = None
+    ) -> None:
+        self._queue.put_nowait((time.monotonic(), BatchItem(item, callback)))
+        self._maybe_start_task()
+
+    def set_flush_interval(self, flush_interval: float) -> None:
+        self._flush_interval = flush_interval
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict[str, float]:
+        """
+        Counters since the last call, plus the current queue depth. A flush
+        takes `flush_seconds` to run `process_fn`, and items wait up to
+        `max_wait_seconds` between being enqueued and being flushed.
+        """
+        stats = dict(
+            queue_depth=float(self.queue_depth()),
+            batches=float(self._batches),
+            items=float(self._items),
+            last_flush_seconds=self._last_flush_seconds,
+            max_flush_seconds=self._max_flush_seconds,
+            max_wait_seconds=self._max_wait_seconds,
+        )
+
+        self._batches = 0
+        self._items = 0
+        self._max_flush_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+        return stats
+
+    async def _wait_for_next_batch(self) -> list[tuple[float, BatchItem[T]]]:
+        batch: list[tuple[float, BatchItem[T]]] = []
+        deadline = time.monotonic() + self._flush_interval
+
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and len(batch) >= self._min_batch_size:
+                break
+
+            timeout = remaining if remaining >= 0 else None
+
+            try:
+                queued = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                continue
+
+            batch.append(queued)
+
+        return batch
+
+    def _run_callback(
+        self,
+        callback: Callable[[], None] | Callable[[], Awaitable[None]],
+    ) -> None:
+        if inspect.iscoroutinefunction(callback):
+            # asyncio.create_task requires some manual memory management!
+            # https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
+            task = asyncio.create_task(callback())
+            self._callback_tasks.add(task)
+            task.add_done_callback(self._callback_tasks.discard)
+            task.add_done_callback(
+                lambda t:
+                    print(t.exception())
+                    if not t.cancelled() and t.exception()
+                    else None
+            )
+        else:
+            callback()
+
+    async def _process_batch(
+        self,
+        batch: list[tuple[float, BatchItem[T]]],
+    ) -> None:
+        start = time.monotonic()
+
+        try:
+            await self._process_fn([bi.item for _, bi in batch])
+        except Exception:
+            print(traceback.format_exc())
+            if self._retry:
+                for queued in batch:
+                    self._queue.put_nowait(queued)
+            return
+        finally:
+            end = time.monotonic()
+            self._batches += 1
+            self._items += len(batch)
+            self._last_flush_seconds = end - start
+            self._max_flush_seconds = max(
+                    self._max_flush_seconds, end - start)
+            self._max_wait_seconds = max(
+                    self._max_wait_seconds,
+                    *(end - enqueued_at for enqueued_at, _ in batch))
+
+        for _, bi in batch:
+            if not bi.callback:
+                continue
+
+            try:
+                self._run_callback(bi.callback)
+            except Exception:
+                print(traceback.format_exc())
+
+    async def _process_batches_forever(self) -> None:
+        while True:
+            batch = await self._wait_for_next_batch()
+            if batch:
+                await self._process_batch(batch)
+
+    def _maybe_start_task(self) -> None:
+        if not self._is_started:
+            return
+
+        if self._task is not None and not self._task.done():
+            return
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        self._task = asyncio.create_task(self._process_batches_forever())
+
+    def start(self) -> None:
+        self._is_started = True
+        self._maybe_start_task()
+
+    def stop(self) -> None:
+        self._is_started = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -1,7 +1,8 @@
 import unittest
-from unittest.mock import MagicMock, call
+from unittest.mock import AsyncMock, MagicMock, call
+import asyncio
 import time
-from batcher import Batcher
+from batcher import AsyncBatcher, Batcher
 
 class TestBatcher(unittest.TestCase):
 
@@ -186,5 +187,115 @@ class TestBatcher(unittest.TestCase):
         # Ensure process_fn was called once with non-empty batch
         self.process_fn.assert_called_once_with([1])
 
+
+class TestAsyncBatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.process_fn = AsyncMock()
+
+    async def asyncTearDown(self) -> None:
+        if hasattr(self, 'batcher'):
+            self.batcher.stop()
+
+    async def test_enqueue_and_process(self) -> None:
+        self.batcher = AsyncBatcher(
+            process_fn=self.process_fn,
+            flush_interval=0.1,
+            min_batch_size=1,
+            max_batch_size=10,
+            retry=False
+        )
+        self.batcher.start()
+
+        await asyncio.sleep(0.15)
+
+        self.batcher.enqueue(1)
+        self.batcher.enqueue(2)
+
+        await asyncio.sleep(0.2)
+
+        self.process_fn.assert_has_awaits([call([1]), call([2])])
+
+    async def test_max_batch_size_respected(self) -> None:
+        self.batcher = AsyncBatcher(
+            process_fn=self.process_fn,
+            flush_interval=10.0,  # Long flush interval so we rely on batch size
+            min_batch_size=1,
+            max_batch_size=3,
+            retry=False
+        )
+        self.batcher.start()
+
+        for i in range(1, 5):
+            self.batcher.enqueue(i)
+
+        await asyncio.sleep(0.1)
+
+        self.process_fn.assert_awaited_once_with([1, 2, 3])
+
+    async def test_started_before_event_loop(self) -> None:
+        self.batcher = AsyncBatcher(
+            process_fn=self.process_fn,
+            flush_interval=0.1,
+        )
+
+        # Like a module-level batcher, started at import time
+        await asyncio.to_thread(self.batcher.start)
+
+        self.batcher.enqueue(1)
+
+        await asyncio.sleep(0.2)
+
+        self.process_fn.assert_awaited_once_with([1])
+
+    async def test_retry_on_failure(self) -> None:
+        self.process_fn.side_effect = [Exception("Simulated failure"), None]
+
+        self.batcher = AsyncBatcher(
+            process_fn=self.process_fn,
+            flush_interval=0.1,
+            min_batch_size=1,
+            max_batch_size=10,
+            retry=True
+        )
+        self.batcher.start()
+
+        self.batcher.enqueue(1)
+
+        await asyncio.sleep(0.3)
+
+        self.process_fn.assert_has_awaits([call([1]), call([1])])
+
+    async def test_callbacks_and_stats(self) -> None:
+        sync_callback = MagicMock()
+        async_callback = AsyncMock()
+
+        self.batcher = AsyncBatcher(
+            process_fn=self.process_fn,
+            flush_interval=0.1,
+            min_batch_size=2,
+            max_batch_size=10,
+            retry=False
+        )
+        self.batcher.start()
+
+        self.batcher.enqueue(1, sync_callback)
+        self.batcher.enqueue(2, async_callback)
+
+        await asyncio.sleep(0.2)
+
+        self.process_fn.assert_awaited_once_with([1, 2])
+        sync_callback.assert_called_once_with()
+        async_callback.assert_awaited_once_with()
+
+        stats = self.batcher.stats()
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['batches'], 1)
+        self.assertEqual(stats['items'], 2)
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.1)
+
+        self.assertEqual(self.batcher.stats()['batches'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
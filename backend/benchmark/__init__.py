@@ -0,0 +1,123 @@
+"""
+A repeatable load test of search, the feed and chat, run against a database of
+synthetic people. `benchmark.generate` fills the database and `benchmark.run`
+drives the API and chat services with concurrent clients, printing each
+scenario's throughput and latency percentiles as JSON:
+
+    python3 -m benchmark.generate --reset --persons 100000 --seed 0
+    python3 -m benchmark.run --seconds 30 --concurrency 16 --seed 0
+
+`test/performance/benchmark.sh` runs both inside the API container.
+"""
+
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+
+
+# Synthetic people have emails at this domain and synthetic clubs have names
+# starting with this prefix, so that they can be told apart from real ones and
+# deleted
+EMAIL_DOMAIN = 'benchmark.duolicious.app'
+
+CLUB_PREFIX = 'benchmark-club-'
+
+EMAIL_PATTERN = f'%@{EMAIL_DOMAIN}'
+
+CLUB_PATTERN = f'{CLUB_PREFIX}%'
+
+
+def summarize(
+    latencies: Sequence[float],
+    errors: int,
+    seconds: float,
+) -> dict[str, object]:
+    """
+    Summarizes the successful requests' latencies, which are in seconds. The
+    percentiles are in milliseconds and are `None` if nothing succeeded.
+    """
+    if latencies:
+        p50, p95, p99 = (
+            round(float(p) * 1000, 3)
+            for p in numpy.percentile(latencies, [50, 95, 99])
+        )
+    else:
+        p50, p95, p99 = None, None, None
+
+    return dict(
+        requests=len(latencies),
+        errors=errors,
+        seconds=round(seconds, 3),
+        requests_per_second=round(len(latencies) / seconds, 3) if seconds else 0,
+        p50_ms=p50,
+        p95_ms=p95,
+        p99_ms=p99,
+    )
+
+
+class Recorder:
+    """Collects the latency of each request made until `seconds` pass"""
+
+    def __init__(self, seconds: float) -> None:
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._deadline = self._start + seconds
+        self._latencies: list[float] = []
+        self._errors = 0
+        self._first_error: str | None = None
+
+    def running(self) -> bool:
+        return time.perf_counter() < self._deadline
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def error(self, e: BaseException) -> None:
+        with self._lock:
+            self._errors += 1
+            if self._first_error is None:
+                self._first_error = repr(e)
+
+    def summary(self) -> dict[str, object]:
+        with self._lock:
+            summary = summarize(
+                self._latencies,
+                self._errors,
+                time.perf_counter() - self._start,
+            )
+
+            if self._first_error is not None:
+                summary['first_error'] = self._first_error
+
+            return summary
+
+
+def measure(
+    seconds: float,
+    concurrency: int,
+    request: Callable[[int], None],
+) -> dict[str, object]:
+    """
+    Calls `request(worker)` in a loop from each of `concurrency` threads for
+    `seconds`. A request fails if it raises.
+    """
+    recorder = Recorder(seconds)
+
+    def work(worker: int) -> None:
+        while recorder.running():
+            start = time.perf_counter()
+            try:
+                request(worker)
+            except Exception as e:
+                recorder.error(e)
+            else:
+                recorder.record(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in executor.map(work, range(concurrency)):
+            pass
+
+    return recorder.summary()
@@ -0,0 +1,900 @@
+"""
+Fills the database with synthetic people for `benchmark.run`, along with their
+answers, photos, clubs, search preferences, skips and chat history. The same
+seed and sizes always generate the same people:
+
+    python3 -m benchmark.generate [--reset] [--persons N] [--seed S] ...
+
+Each chunk of people is written in its own transaction with `COPY`, so the
+database's triggers run as they would for real people. Everyone is written
+before anyone's skips and messages, which can refer to anyone else.
+"""
+
+import argparse
+import time
+import uuid
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import numpy
+import numpy.typing as npt
+from benchmark import CLUB_PATTERN, CLUB_PREFIX, EMAIL_DOMAIN, EMAIL_PATTERN
+from chatprotocol.jid import LSERVER
+from database import Tx, api_tx, row_int, row_str
+from qanda import personality
+from search.sql import Q_PUBLIC_SEARCH_INDEX_QUESTIONS
+from service.chat.messagestorage.mam import microseconds_to_mam_message_id
+
+
+Q_DELETE_INBOXES = """
+DELETE FROM
+    inbox
+WHERE
+    luser IN (
+        SELECT
+            uuid::TEXT
+        FROM
+            person
+        WHERE
+            email LIKE %(email_pattern)s
+    )
+"""
+
+
+Q_DELETE_PERSONS = """
+DELETE FROM
+    person
+WHERE
+    email LIKE %(email_pattern)s
+"""
+
+
+Q_DELETE_SESSIONS = """
+DELETE FROM
+    duo_session
+WHERE
+    email LIKE %(email_pattern)s
+"""
+
+
+Q_DELETE_CLUBS = """
+DELETE FROM
+    club
+WHERE
+    name LIKE %(club_pattern)s
+"""
+
+
+Q_RESERVE_PERSON_IDS = """
+SELECT
+    nextval('person_id_seq') AS id
+FROM
+    generate_series(1, %(count)s)
+"""
+
+
+Q_LOCATIONS = """
+SELECT
+    coordinates::TEXT AS coordinates,
+    short_friendly,
+    long_friendly,
+    country
+FROM
+    location
+ORDER BY
+    id
+"""
+
+
+Q_GENDERS = """
+SELECT
+    id
+FROM
+    gender
+ORDER BY
+    id
+"""
+
+
+Q_UNITS = """
+SELECT
+    id,
+    name
+FROM
+    unit
+"""
+
+
+Q_INSERT_CLUBS = """
+INSERT INTO club (
+    name
+)
+SELECT
+    unnest(%(names)s::TEXT[])
+ON CONFLICT DO NOTHING
+"""
+
+
+# The search preferences which `Q_FINISH_ONBOARDING` doesn't ask the onboardee
+# about, set as it sets them
+Q_INSERT_DEFAULT_SEARCH_PREFERENCES = """
+WITH new_person AS (
+    SELECT unnest(%(person_ids)s::INT[]) AS id
+), p2 AS (
+    INSERT INTO search_preference_orientation (person_id, orientation_id)
+    SELECT new_person.id, orientation.id
+    FROM new_person, orientation
+), p5 AS (
+    INSERT INTO search_preference_height_cm (person_id, min_height_cm, max_height_cm)
+    SELECT new_person.id, NULL, NULL
+    FROM new_person
+), p6 AS (
+    INSERT INTO search_preference_has_profile_picture (person_id, has_profile_picture_id)
+    SELECT new_person.id, yes_no.id
+    FROM new_person, yes_no
+), p7 AS (
+    INSERT INTO search_preference_looking_for (person_id, looking_for_id)
+    SELECT new_person.id, looking_for.id
+    FROM new_person, looking_for
+), p8 AS (
+    INSERT INTO search_preference_smoking (person_id, smoking_id)
+    SELECT new_person.id, yes_no_optional.id
+    FROM new_person, yes_no_optional
+), p9 AS (
+    INSERT INTO search_preference_drinking (person_id, drinking_id)
+    SELECT new_person.id, frequency.id
+    FROM new_person, frequency
+), p10 AS (
+    INSERT INTO search_preference_drugs (person_id, drugs_id)
+    SELECT new_person.id, yes_no_optional.id
+    FROM new_person, yes_no_optional
+), p11 AS (
+    INSERT INTO search_preference_long_distance (person_id, long_distance_id)
+    SELECT new_person.id, yes_no_optional.id
+    FROM new_person, yes_no_optional
+), p12 AS (
+    INSERT INTO search_preference_relationship_status (person_id, relationship_status_id)
+    SELECT new_person.id, relationship_status.id
+    FROM new_person, relationship_status
+), p13 AS (
+    INSERT INTO search_preference_has_kids (person_id, has_kids_id)
+    SELECT new_person.id, yes_no_optional.id
+    FROM new_person, yes_no_optional
+), p14 AS (
+    INSERT INTO search_preference_wants_kids (person_id, wants_kids_id)
+    SELECT new_person.id, yes_no_maybe.id
+    FROM new_person, yes_no_maybe
+), p15 AS (
+    INSERT INTO search_preference_exercise (person_id, exercise_id)
+    SELECT new_person.id, frequency.id
+    FROM new_person, frequency
+), p16 AS (
+    INSERT INTO search_preference_religion (person_id, religion_id)
+    SELECT new_person.id, religion.id
+    FROM new_person, religion
+), p17 AS (
+    INSERT INTO search_preference_star_sign (person_id, star_sign_id)
+    SELECT new_person.id, star_sign.id
+    FROM new_person, star_sign
+), p18 AS (
+    INSERT INTO search_preference_messaged (person_id, messaged_id)
+    SELECT new_person.id, yes_no.id
+    FROM new_person, yes_no
+    WHERE yes_no.name = 'Yes'
+), p19 AS (
+    INSERT INTO search_preference_skipped (person_id, skipped_id)
+    SELECT new_person.id, yes_no.id
+    FROM new_person, yes_no
+    WHERE yes_no.name = 'No'
+), p20 AS (
+    INSERT INTO search_preference_ethnicity (person_id, ethnicity_id)
+    SELECT new_person.id, ethnicity.id
+    FROM new_person, ethnicity
+)
+SELECT 1
+"""
+
+
+# Two people might both start a conversation with each other, or skip the same
+# person twice, so interactions are staged and de-duplicated on insertion
+Q_CREATE_STAGING_TABLES = """
+CREATE TEMPORARY TABLE staged_messaged (LIKE messaged INCLUDING DEFAULTS) ON COMMIT DROP;
+CREATE TEMPORARY TABLE staged_skipped (LIKE skipped INCLUDING DEFAULTS) ON COMMIT DROP;
+CREATE TEMPORARY TABLE staged_mam_message (LIKE mam_message INCLUDING DEFAULTS) ON COMMIT DROP;
+CREATE TEMPORARY TABLE staged_inbox (LIKE inbox INCLUDING DEFAULTS) ON COMMIT DROP;
+"""
+
+
+Q_INSERT_STAGED = """
+INSERT INTO messaged SELECT * FROM staged_messaged ON CONFLICT DO NOTHING;
+INSERT INTO skipped SELECT * FROM staged_skipped ON CONFLICT DO NOTHING;
+INSERT INTO mam_message SELECT * FROM staged_mam_message ON CONFLICT DO NOTHING;
+INSERT INTO inbox SELECT * FROM staged_inbox ON CONFLICT DO NOTHING;
+"""
+
+
+Q_UPDATE_CLUB_COUNTS = """
+UPDATE
+    club
+SET
+    count_members = (
+        SELECT
+            COUNT(*)
+        FROM
+            person_club
+        WHERE
+            club_name = club.name
+    )
+WHERE
+    name LIKE %(club_pattern)s
+"""
+
+
+Q_ANALYZE = """
+ANALYZE person;
+ANALYZE answer;
+ANALYZE photo;
+ANALYZE person_club;
+ANALYZE messaged;
+ANALYZE skipped;
+ANALYZE mam_message;
+ANALYZE inbox;
+"""
+
+
+_PERSON_COLUMNS = (
+    'id',
+    'uuid',
+    'email',
+    'normalized_email',
+    'name',
+    'url_slug',
+    'date_of_birth',
+    'coordinates',
+    'gender_id',
+    'about',
+    'location_short_friendly',
+    'location_long_friendly',
+    'unit_id',
+    'personality',
+    'presence_score',
+    'absence_score',
+    'count_answers',
+    'verification_level_id',
+    'public_profile',
+    'sign_up_time',
+    'last_online_time',
+    'last_event_time',
+)
+
+_BLURHASH = 'LEHV6nWB2yk8pyo0adR*.7kCMdnj'
+
+# People are spread over this many cities, the biggest getting the most people
+_NUM_CITIES = 200
+
+# The chances of answering yes, answering no and skipping a question
+_ANSWER_PROBABILITIES = [0.45, 0.45, 0.1]
+
+# The chances of having each number of photos
+_PHOTO_COUNT_PROBABILITIES = [0.15, 0.25, 0.25, 0.2, 0.15]
+
+_MAX_AGE = 80
+
+_SEARCH_DISTANCES = [10, 25, 50, 100, 250, 500, 1000]
+
+_MESSAGE_HISTORY = timedelta(days=90)
+
+
+@dataclass(frozen=True)
+class Config:
+    persons: int
+    seed: int
+    chunk_size: int
+    answers: int
+    clubs: int
+    clubs_per_person: int
+    conversations: int
+    messages: int
+    skips: int
+
+
+@dataclass(frozen=True)
+class _Lookups:
+    # Each row has a location's coordinates and names
+    cities: list[dict[str, str]]
+    city_probabilities: npt.NDArray[numpy.float64]
+    gender_ids: list[int]
+    gender_probabilities: npt.NDArray[numpy.float64]
+    unit_id_by_country: dict[str, int]
+    default_unit_id: int
+    question_ids: npt.NDArray[numpy.int64]
+    # What answering each question adds to the presence and absence scores.
+    # See `personality.fold`.
+    yes_presence: npt.NDArray[numpy.int64]
+    yes_absence: npt.NDArray[numpy.int64]
+    no_presence: npt.NDArray[numpy.int64]
+    no_absence: npt.NDArray[numpy.int64]
+
+
+@dataclass(frozen=True)
+class _People:
+    ids: list[int]
+    uuids: list[str]
+
+
+def _email(i: int) -> str:
+    return f'person{i}@{EMAIL_DOMAIN}'
+
+
+def _club_name(i: int) -> str:
+    return f'{CLUB_PREFIX}{i}'
+
+
+def _copy(
+    tx: Tx,
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[object]],
+) -> None:
+    with tx.connection.cursor() as cur:
+        with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def _score_contributions(
+    given_presence: npt.NDArray[numpy.int64],
+    given_absence: npt.NDArray[numpy.int64],
+) -> tuple[npt.NDArray[numpy.int64], npt.NDArray[numpy.int64]]:
+    excess = numpy.minimum(given_presence, given_absence)
+    return given_presence - excess, given_absence - excess
+
+
+def _lookups(tx: Tx, rng: numpy.random.Generator) -> _Lookups:
+    locations = tx.execute(Q_LOCATIONS).fetchall()
+    gender_ids = [row_int(row, 'id') for row in tx.execute(Q_GENDERS).fetchall()]
+    units = {
+        row_str(row, 'name'): row_int(row, 'id')
+        for row in tx.execute(Q_UNITS).fetchall()
+    }
+    questions = tx.execute(Q_PUBLIC_SEARCH_INDEX_QUESTIONS).fetchall()
+
+    cities = [
+        dict(
+            coordinates=row_str(locations[i], 'coordinates'),
+            short_friendly=row_str(locations[i], 'short_friendly'),
+            long_friendly=row_str(locations[i], 'long_friendly'),
+            country=row_str(locations[i], 'country'),
+        )
+        for i in rng.choice(
+            len(locations),
+            size=min(_NUM_CITIES, len(locations)),
+            replace=False,
+        )
+    ]
+
+    # Zipf's law
+    city_weights = 1 / numpy.arange(1, len(cities) + 1)
+
+    # Most people are men or women
+    gender_weights = numpy.array(
+        [8.0, 8.0] + [0.5] * (len(gender_ids) - 2))[:len(gender_ids)]
+
+    def scores(name: str) -> npt.NDArray[numpy.int64]:
+        return numpy.array(
+            [q[name] for q in questions],
+            dtype=numpy.int64,
+        ).reshape(len(questions), personality.TRAIT_COUNT)
+
+    yes_presence, yes_absence = _score_contributions(
+        scores('presence_given_yes'), scores('absence_given_yes'))
+    no_presence, no_absence = _score_contributions(
+        scores('presence_given_no'), scores('absence_given_no'))
+
+    return _Lookups(
+        cities=cities,
+        city_probabilities=city_weights / city_weights.sum(),
+        gender_ids=gender_ids,
+        gender_probabilities=gender_weights / gender_weights.sum(),
+        unit_id_by_country={
+            'United States': units['Imperial'],
+            'United Kingdom': units['Imperial'],
+        },
+        default_unit_id=units['Metric'],
+        question_ids=numpy.array(
+            [row_int(q, 'id') for q in questions], dtype=numpy.int64),
+        yes_presence=yes_presence,
+        yes_absence=yes_absence,
+        no_presence=no_presence,
+        no_absence=no_absence,
+    )
+
+
+def _reset(tx: Tx) -> None:
+    params = dict(email_pattern=EMAIL_PATTERN, club_pattern=CLUB_PATTERN)
+
+    tx.execute(Q_DELETE_INBOXES, params)
+    tx.execute(Q_DELETE_SESSIONS, params)
+    tx.execute(Q_DELETE_PERSONS, params)
+    tx.execute(Q_DELETE_CLUBS, params)
+
+
+def _write_people(
+    tx: Tx,
+    rng: numpy.random.Generator,
+    config: Config,
+    lookups: _Lookups,
+    people: _People,
+    first: int,
+    last: int,
+    now: datetime,
+) -> None:
+    n = last - first
+    ids = people.ids[first:last]
+    num_questions = len(lookups.question_ids)
+
+    # People answer questions in about the order the quiz asks them, so the
+    # first questions are the most answered
+    num_answers = numpy.minimum(rng.poisson(config.answers, n), num_questions)
+    question_order = numpy.argsort(
+        rng.random((n, num_questions)) * (numpy.arange(num_questions) + 100),
+        axis=1,
+    )
+    answer_kinds = rng.choice(
+        len(_ANSWER_PROBABILITIES),
+        size=(n, num_questions),
+        p=_ANSWER_PROBABILITIES,
+    )
+    answer_public = rng.random((n, num_questions)) < 0.5
+
+    yes = numpy.zeros((n, num_questions), dtype=numpy.int64)
+    no = numpy.zeros((n, num_questions), dtype=numpy.int64)
+    answer_rows: list[tuple[int, int, bool | None, bool]] = []
+
+    for row in range(n):
+        answered = question_order[row, :num_answers[row]]
+        kinds = answer_kinds[row, answered]
+
+        yes[row, answered] = kinds == 0
+        no[row, answered] = kinds == 1
+
+        answer_rows.extend(
+            (
+                ids[row],
+                int(lookups.question_ids[q]),
+                [True, False, None][kind],
+                bool(answer_public[row, q]),
+            )
+            for q, kind in zip(answered.tolist(), kinds.tolist())
+        )
+
+    presence = yes @ lookups.yes_presence + no @ lookups.no_presence
+    absence = yes @ lookups.yes_absence + no @ lookups.no_absence
+    count_answers = (yes + no).sum(axis=1)
+
+    city_indexes = rng.choice(
+        len(lookups.cities), size=n, p=lookups.city_probabilities)
+    gender_indexes = rng.choice(
+        len(lookups.gender_ids), size=n, p=lookups.gender_probabilities)
+    ages = 18 + numpy.minimum(rng.exponential(9, n), _MAX_AGE - 18)
+    verification_level_ids = rng.choice([1, 2, 3], size=n, p=[0.7, 0.1, 0.2])
+    public_profiles = rng.random(n) < 0.1
+    online_seconds_ago = rng.exponential(timedelta(days=7).total_seconds(), n)
+    member_seconds = rng.exponential(timedelta(days=120).total_seconds(), n)
+
+    person_rows = []
+    for row in range(n):
+        i = first + row
+        city = lookups.cities[city_indexes[row]]
+        last_online_time = now - timedelta(seconds=online_seconds_ago[row])
+        sign_up_time = last_online_time - timedelta(seconds=member_seconds[row])
+
+        person_rows.append((
+            ids[row],
+            people.uuids[i],
+            _email(i),
+            _email(i),
+            f'Person {i}',
+            f'benchmark-person-{i}',
+            (now - timedelta(days=ages[row] * 365.25)).date(),
+            city['coordinates'],
+            lookups.gender_ids[gender_indexes[row]],
+            f'Synthetic person number {i}',
+            city['short_friendly'],
+            city['long_friendly'],
+            lookups.unit_id_by_country.get(
+                city['country'], lookups.default_unit_id),
+            personality.to_pgvector(personality.personality_vector(
+                presence[row], absence[row], int(count_answers[row]))),
+            presence[row].tolist(),
+            absence[row].tolist(),
+            int(count_answers[row]),
+            int(verification_level_ids[row]),
+            bool(public_profiles[row]),
+            sign_up_time,
+            last_online_time,
+            sign_up_time,
+        ))
+
+    photo_rows = [
+        (
+            ids[row],
+            position,
+            rng.bytes(16).hex(),
+            _BLURHASH,
+            rng.bytes(32).hex(),
+        )
+        for row, num_photos in enumerate(rng.choice(
+            len(_PHOTO_COUNT_PROBABILITIES),
+            size=n,
+            p=_PHOTO_COUNT_PROBABILITIES,
+        ).tolist())
+        for position in range(1, num_photos + 1)
+    ]
+
+    # A few clubs are much more popular than the rest
+    club_rows = [
+        (ids[row], _club_name(club))
+        for row, num_clubs in enumerate(
+            rng.poisson(config.clubs_per_person, n).tolist()
+            if config.clubs else [0] * n)
+        for club in sorted(set(
+            numpy.minimum(rng.zipf(1.5, num_clubs) - 1, config.clubs - 1)
+            .tolist()))
+    ]
+
+    # Some people are open to every gender; the rest to one
+    gender_preference_rows = [
+        (ids[row], gender_id)
+        for row, every_gender in enumerate((rng.random(n) < 0.4).tolist())
+        for gender_id in (
+            lookups.gender_ids if every_gender else
+            [lookups.gender_ids[rng.choice(
+                len(lookups.gender_ids), p=lookups.gender_probabilities)]]
+        )
+    ]
+
+    age_preference_rows = [
+        (
+            ids[row],
+            max(18, int(ages[row]) - int(rng.integers(2, 15))),
+            None if rng.random() < 0.2 else
+            min(_MAX_AGE, int(ages[row]) + int(rng.integers(2, 20))),
+        )
+        for row in range(n)
+    ]
+
+    distance_preference_rows = [
+        (
+            ids[row],
+            None if rng.random() < 0.3 else
+            int(rng.choice(_SEARCH_DISTANCES)),
+        )
+        for row in range(n)
+    ]
+
+    _copy(tx, 'person', _PERSON_COLUMNS, person_rows)
+    _copy(
+        tx,
+        'answer',
+        ('person_id', 'question_id', 'answer', 'public_'),
+        answer_rows,
+    )
+    _copy(
+        tx,
+        'photo',
+        ('person_id', 'position', 'uuid', 'blurhash', 'hash'),
+        photo_rows,
+    )
+    _copy(tx, 'person_club', ('person_id', 'club_name'), club_rows)
+    _copy(
+        tx,
+        'search_preference_gender',
+        ('person_id', 'gender_id'),
+        gender_preference_rows,
+    )
+    _copy(
+        tx,
+        'search_preference_age',
+        ('person_id', 'min_age', 'max_age'),
+        age_preference_rows,
+    )
+    _copy(
+        tx,
+        'search_preference_distance',
+        ('person_id', 'distance'),
+        distance_preference_rows,
+    )
+    tx.execute(Q_INSERT_DEFAULT_SEARCH_PREFERENCES, dict(person_ids=ids))
+
+
+def _someone_else(rng: numpy.random.Generator, i: int, n: int) -> int:
+    j = int(rng.integers(n - 1))
+    return j + 1 if j >= i else j
+
+
+def _write_interactions(
+    tx: Tx,
+    rng: numpy.random.Generator,
+    config: Config,
+    people: _People,
+    first: int,
+    last: int,
+    now: datetime,
+) -> None:
+    n = len(people.ids)
+    now_microseconds = int(now.timestamp() * 1e6)
+    history_microseconds = int(_MESSAGE_HISTORY.total_seconds() * 1e6)
+
+    messaged_rows: list[tuple[int, int, datetime]] = []
+    skipped_rows: list[tuple[int, int, bool, str, datetime]] = []
+    mam_message_rows: list[tuple[int, str, str, str, int, None, str, str, None]] = []
+    inbox_rows: list[tuple[str, str, str, str, int, int, None, str, str]] = []
+
+    for i in range(first, last):
+        for _ in range(int(rng.poisson(config.skips))):
+            skipped_rows.append((
+                people.ids[i],
+                people.ids[_someone_else(rng, i, n)],
+                False,
+                '',
+                now - timedelta(seconds=rng.uniform(
+                    0, _MESSAGE_HISTORY.total_seconds())),
+            ))
+
+        # Each conversation is between two people, who start about half of
+        # them each
+        for _ in range(int(rng.poisson(config.conversations / 2))):
+            j = _someone_else(rng, i, n)
+
+            num_messages = 1 + int(rng.poisson(max(0, config.messages - 1)))
+
+            # The first message is from `i`
+            senders = numpy.where(rng.random(num_messages) < 0.5, i, j)
+            senders[0] = i
+
+            gaps = rng.exponential(3600e6, num_messages).astype(numpy.int64)
+            times = (
+                now_microseconds -
+                int(rng.integers(history_microseconds)) -
+                int(gaps.sum()) +
+                numpy.cumsum(gaps)
+            )
+
+            sender_list = senders.tolist()
+
+            for k, (sender, microseconds) in enumerate(
+                zip(sender_list, times.tolist())
+            ):
+                recipient = j if sender == i else i
+                mam_message_id = microseconds_to_mam_message_id(microseconds)
+                stanza_id = f'benchmark-{i}-{j}-{k}'
+                body = f'Message {k + 1} from person {sender}'
+
+                mam_message_rows.append((
+                    mam_message_id,
+                    '',
+                    people.uuids[recipient],
+                    'O',
+                    people.ids[sender],
+                    None,
+                    body,
+                    stanza_id,
+                    None,
+                ))
+
+                mam_message_rows.append((
+                    mam_message_id + 1,
+                    '',
+                    people.uuids[sender],
+                    'I',
+                    people.ids[recipient],
+                    None,
+                    body,
+                    stanza_id,
+                    None,
+                ))
+
+            sent_at = now - timedelta(
+                microseconds=now_microseconds - int(times[0]))
+
+            for subject in set(sender_list):
+                messaged_rows.append((
+                    people.ids[subject],
+                    people.ids[j if subject == i else i],
+                    sent_at,
+                ))
+
+            for owner, partner in [(i, j), (j, i)]:
+                last_sender = sender_list[-1]
+
+                unread_count = 0
+                for sender in reversed(sender_list):
+                    if sender == owner:
+                        break
+                    unread_count += 1
+
+                inbox_rows.append((
+                    people.uuids[owner],
+                    f'{people.uuids[partner]}@{LSERVER}',
+                    f'benchmark-{i}-{j}-{num_messages - 1}',
+                    'chats' if owner in sender_list else 'inbox',
+                    int(times[-1]),
+                    unread_count,
+                    None,
+                    f'Message {num_messages} from person {last_sender}',
+                    'O' if last_sender == owner else 'I',
+                ))
+
+    tx.execute(Q_CREATE_STAGING_TABLES)
+
+    _copy(
+        tx,
+        'staged_messaged',
+        ('subject_person_id', 'object_person_id', 'created_at'),
+        messaged_rows,
+    )
+    _copy(
+        tx,
+        'staged_skipped',
+        (
+            'subject_person_id',
+            'object_person_id',
+            'reported',
+            'report_reason',
+            'created_at',
+        ),
+        skipped_rows,
+    )
+    _copy(
+        tx,
+        'staged_mam_message',
+        (
+            'id',
+            'from_jid',
+            'remote_bare_jid',
+            'direction',
+            'person_id',
+            'audio_uuid',
+            'body',
+            'stanza_id',
+            'reaction',
+        ),
+        mam_message_rows,
+    )
+    _copy(
+        tx,
+        'staged_inbox',
+        (
+            'luser',
+            'remote_bare_jid',
+            'msg_id',
+            'box',
+            'timestamp',
+            'unread_count',
+            'displayed_at',
+            'body',
+            'direction',
+        ),
+        inbox_rows,
+    )
+
+    tx.execute(Q_INSERT_STAGED)
+
+
+def _chunks(config: Config) -> Iterable[tuple[int, int]]:
+    for first in range(0, config.persons, config.chunk_size):
+        yield first, min(first + config.chunk_size, config.persons)
+
+
+def _progress(what: str, last: int, config: Config, start: float) -> None:
+    print(
+        f'{what}: {last}/{config.persons} people '
+        f'({time.perf_counter() - start:.1f}s)',
+        flush=True,
+    )
+
+
+def generate(config: Config, reset: bool) -> None:
+    rng = numpy.random.default_rng(config.seed)
+
+    # Times are relative to when the people are generated, so that the same
+    # people are as recently online whenever they're generated
+    now = datetime.now(timezone.utc)
+
+    start = time.perf_counter()
+
+    with api_tx('READ COMMITTED') as tx:
+        tx.execute('SET LOCAL statement_timeout = 0')
+
+        if reset:
+            _reset(tx)
+
+        lookups = _lookups(tx, rng)
+
+        people = _People(
+            ids=[
+                row_int(row, 'id')
+                for row in tx.execute(
+                    Q_RESERVE_PERSON_IDS,
+                    dict(count=config.persons),
+                ).fetchall()
+            ],
+            uuids=[
+                str(uuid.UUID(bytes=rng.bytes(16), version=4))
+                for _ in range(config.persons)
+            ],
+        )
+
+        tx.execute(
+            Q_INSERT_CLUBS,
+            dict(names=[_club_name(i) for i in range(config.clubs)]),
+        )
+
+    for first, last in _chunks(config):
+        with api_tx('READ COMMITTED') as tx:
+            tx.execute('SET LOCAL statement_timeout = 0')
+            _write_people(tx, rng, config, lookups, people, first, last, now)
+        _progress('People', last, config, start)
+
+    for first, last in _chunks(config):
+        with api_tx('READ COMMITTED') as tx:
+            tx.execute('SET LOCAL statement_timeout = 0')
+            _write_interactions(tx, rng, config, people, first, last, now)
+        _progress('Skips and messages', last, config, start)
+
+    with api_tx('READ COMMITTED') as tx:
+        tx.execute('SET LOCAL statement_timeout = 0')
+        tx.execute(Q_UPDATE_CLUB_COUNTS, dict(club_pattern=CLUB_PATTERN))
+        tx.execute(Q_ANALYZE)
+
+    print(
+        f'Generated {config.persons} people in '
+        f'{time.perf_counter() - start:.1f}s',
+        flush=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python3 -m benchmark.generate',
+        description='Fills the database with synthetic people',
+    )
+    parser.add_argument('--reset', action='store_true',
+        help='delete the synthetic people from previous runs first')
+    parser.add_argument('--persons', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=1000,
+        help='people written per transaction')
+    parser.add_argument('--answers', type=int, default=50,
+        help='mean questions answered per person')
+    parser.add_argument('--clubs', type=int, default=1000)
+    parser.add_argument('--clubs-per-person', type=int, default=2,
+        help='mean clubs joined per person')
+    parser.add_argument('--conversations', type=int, default=4,
+        help='mean conversations per person')
+    parser.add_argument('--messages', type=int, default=6,
+        help='mean messages per conversation')
+    parser.add_argument('--skips', type=int, default=5,
+        help='mean people skipped per person')
+
+    args = parser.parse_args()
+
+    generate(
+        Config(
+            persons=args.persons,
+            seed=args.seed,
+            chunk_size=args.chunk_size,
+            answers=args.answers,
+            clubs=args.clubs,
+            clubs_per_person=args.clubs_per_person,
+            conversations=args.conversations,
+            messages=args.messages,
+            skips=args.skips,
+        ),
+        reset=args.reset,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,466 @@
+"""
+Load tests the API and chat services as the synthetic people which
+`benchmark.generate` made, then prints a JSON report of each scenario's
+throughput and latency percentiles. Each client is signed in as a different
+person, using a session which is deleted afterwards:
+
+    python3 -m benchmark.run [--seconds S] [--concurrency C] [--users U] \\
+        [--seed S] [--scenario NAME ...]
+
+The scenarios run one after the other, in the order given. `search-cached`
+pages through the results which `search-uncached` leaves behind, so it should
+come after it.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import secrets
+import sys
+import time
+import urllib.request
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import ConnectionClosed
+from websockets.typing import Subprotocol
+from benchmark import EMAIL_PATTERN, Recorder, measure
+from chatprotocol.jid import LSERVER
+from database import api_tx, require_row, row_int, row_str
+from duohash import sha512
+
+
+API_URL = os.environ.get(
+    'DUO_BENCHMARK_API_URL',
+    'http://localhost:5000',
+)
+
+CHAT_URL = os.environ.get(
+    'DUO_BENCHMARK_CHAT_URL',
+    'ws://chat:5443',
+)
+
+_TIMEOUT_SECONDS = 30
+
+
+# People who have someone to chat with, along with one of them
+Q_USERS = """
+SELECT
+    person.id AS person_id,
+    person.uuid::TEXT AS person_uuid,
+    person.email,
+    partner.uuid::TEXT AS partner_uuid
+FROM
+    person
+JOIN LATERAL (
+    SELECT
+        object_person_id
+    FROM
+        messaged
+    WHERE
+        subject_person_id = person.id
+    ORDER BY
+        object_person_id
+    LIMIT
+        1
+) AS messaged
+ON
+    TRUE
+JOIN
+    person AS partner
+ON
+    partner.id = messaged.object_person_id
+WHERE
+    person.email LIKE %(email_pattern)s
+AND
+    person.activated
+ORDER BY
+    md5(person.id::TEXT || %(seed)s::TEXT)
+LIMIT
+    %(limit)s
+"""
+
+
+Q_PROSPECTS = """
+SELECT
+    uuid::TEXT AS uuid
+FROM
+    person
+WHERE
+    email LIKE %(email_pattern)s
+AND
+    activated
+ORDER BY
+    md5(id::TEXT || %(seed)s::TEXT)
+LIMIT
+    %(limit)s
+"""
+
+
+Q_COUNT_PERSONS = """
+SELECT
+    COUNT(*) AS count
+FROM
+    person
+WHERE
+    email LIKE %(email_pattern)s
+"""
+
+
+Q_INSERT_SESSIONS = """
+INSERT INTO duo_session (
+    session_token_hash,
+    person_id,
+    email,
+    signed_in
+)
+SELECT
+    session_token_hash,
+    person_id,
+    email,
+    TRUE
+FROM
+    unnest(
+        %(session_token_hashes)s::TEXT[],
+        %(person_ids)s::INT[],
+        %(emails)s::TEXT[]
+    ) AS session(
+        session_token_hash,
+        person_id,
+        email
+    )
+"""
+
+
+Q_DELETE_SESSIONS = """
+DELETE FROM
+    duo_session
+WHERE
+    session_token_hash = ANY(%(session_token_hashes)s::TEXT[])
+"""
+
+
+_NS_INBOX = 'erlang-solutions.com:xmpp:inbox:0'
+_NS_MAM = 'urn:xmpp:mam:2'
+_NS_RSM = 'http://jabber.org/protocol/rsm'
+
+
+@dataclass(frozen=True)
+class User:
+    person_uuid: str
+    partner_uuid: str
+    session_token: str
+
+
+def _get(user: User, path: str) -> None:
+    request = urllib.request.Request(
+        f'{API_URL}{path}',
+        headers={'Authorization': f'Bearer {user.session_token}'},
+    )
+
+    with urllib.request.urlopen(request, timeout=_TIMEOUT_SECONDS) as response:
+        response.read()
+
+
+_HttpPath = Callable[[User, random.Random, list[str]], str]
+
+
+_HTTP_SCENARIOS: dict[str, _HttpPath] = {
+    'search-uncached': lambda user, rng, prospects:
+        '/search?n=10&o=0',
+    'search-cached': lambda user, rng, prospects:
+        f'/search?n=10&o={10 * rng.randint(1, 4)}',
+    'feed': lambda user, rng, prospects:
+        '/feed',
+    'prospect-profile': lambda user, rng, prospects:
+        f'/prospect-profile/{rng.choice(prospects)}',
+}
+
+
+async def _send(ws: ClientConnection, stanza: object) -> None:
+    await ws.send(json.dumps(stanza))
+
+
+async def _reply(ws: ClientConnection, id: str) -> str:
+    """
+    Waits for the stanza whose id is `id`, ignoring the rest, such as messages
+    from other clients. Returns the stanza's name.
+    """
+    while True:
+        reply = json.loads(await ws.recv())
+
+        if not isinstance(reply, dict) or len(reply) != 1:
+            continue
+
+        (name, attributes), = reply.items()
+
+        if isinstance(attributes, dict) and attributes.get('@id') == id:
+            return str(name)
+
+
+async def _auth(ws: ClientConnection, user: User) -> None:
+    auth = f'\0{user.person_uuid}\0{user.session_token}'.encode()
+
+    await _send(ws, {'auth': {
+        '@xmlns': 'urn:ietf:params:xml:ns:xmpp-sasl',
+        '@mechanism': 'PLAIN',
+        '#text': base64.b64encode(auth).decode(),
+    }})
+
+    while True:
+        reply = json.loads(await ws.recv())
+
+        if isinstance(reply, dict) and 'success' in reply:
+            return
+
+        if isinstance(reply, dict) and 'failure' in reply:
+            raise Exception(f'Chat authentication failed: {reply}')
+
+
+async def _chat_send(ws: ClientConnection, user: User) -> None:
+    id = str(uuid.uuid4())
+
+    await _send(ws, {'message': {
+        '@type': 'chat',
+        '@from': f'{user.person_uuid}@{LSERVER}',
+        '@to': f'{user.partner_uuid}@{LSERVER}',
+        '@id': id,
+        '@xmlns': 'jabber:client',
+        'body': f'Benchmark message {id}',
+        'request': {'@xmlns': 'urn:xmpp:receipts'},
+    }})
+
+    name = await _reply(ws, id)
+
+    if name != 'duo_message_delivered':
+        raise Exception(f'Message not delivered: {name}')
+
+
+async def _chat_inbox(ws: ClientConnection, user: User) -> None:
+    id = str(uuid.uuid4())
+
+    await _send(ws, {'iq': {
+        '@type': 'set',
+        '@id': id,
+        'inbox': {
+            '@xmlns': _NS_INBOX,
+            '@queryid': id,
+            'set': {'@xmlns': _NS_RSM, 'max': '50'},
+        },
+    }})
+
+    name = await _reply(ws, id)
+
+    if name != 'iq':
+        raise Exception(f'Unexpected reply to inbox query: {name}')
+
+
+async def _chat_mam(ws: ClientConnection, user: User) -> None:
+    id = str(uuid.uuid4())
+
+    await _send(ws, {'iq': {
+        '@type': 'set',
+        '@id': id,
+        'query': {
+            '@xmlns': _NS_MAM,
+            '@queryid': id,
+            'x': {
+                '@xmlns': 'jabber:x:data',
+                '@type': 'submit',
+                'field': [
+                    {'@var': 'FORM_TYPE', 'value': _NS_MAM},
+                    {'@var': 'with', 'value': f'{user.partner_uuid}@{LSERVER}'},
+                ],
+            },
+            'set': {'@xmlns': _NS_RSM, 'max': '50'},
+        },
+    }})
+
+    name = await _reply(ws, id)
+
+    if name != 'iq':
+        raise Exception(f'Unexpected reply to MAM query: {name}')
+
+
+_ChatRequest = Callable[[ClientConnection, User], Awaitable[None]]
+
+
+_CHAT_SCENARIOS: dict[str, _ChatRequest] = {
+    'chat-send': _chat_send,
+    'chat-inbox': _chat_inbox,
+    'chat-mam': _chat_mam,
+}
+
+
+SCENARIOS = [*_HTTP_SCENARIOS, *_CHAT_SCENARIOS]
+
+
+async def _chat_client(
+    recorder: Recorder,
+    user: User,
+    request: _ChatRequest,
+) -> None:
+    # Connecting and signing in aren't timed
+    async with connect(CHAT_URL, subprotocols=[Subprotocol('json')]) as ws:
+        await asyncio.wait_for(_auth(ws, user), _TIMEOUT_SECONDS)
+
+        while recorder.running():
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(request(ws, user), _TIMEOUT_SECONDS)
+            except ConnectionClosed as e:
+                recorder.error(e)
+                return
+            except Exception as e:
+                recorder.error(e)
+            else:
+                recorder.record(time.perf_counter() - start)
+
+
+async def _measure_chat(
+    seconds: float,
+    users: list[User],
+    request: _ChatRequest,
+) -> dict[str, object]:
+    recorder = Recorder(seconds)
+
+    async def client(user: User) -> None:
+        try:
+            await _chat_client(recorder, user, request)
+        except Exception as e:
+            recorder.error(e)
+
+    await asyncio.gather(*(client(user) for user in users))
+
+    return recorder.summary()
+
+
+def _sign_in(seed: int, limit: int) -> list[User]:
+    with api_tx('READ COMMITTED') as tx:
+        rows = tx.execute(
+            Q_USERS,
+            dict(email_pattern=EMAIL_PATTERN, seed=seed, limit=limit),
+        ).fetchall()
+
+        session_tokens = [secrets.token_hex(64) for _ in rows]
+
+        tx.execute(Q_INSERT_SESSIONS, dict(
+            session_token_hashes=[sha512(t) for t in session_tokens],
+            person_ids=[row_int(row, 'person_id') for row in rows],
+            emails=[row_str(row, 'email') for row in rows],
+        ))
+
+    return [
+        User(
+            person_uuid=row_str(row, 'person_uuid'),
+            partner_uuid=row_str(row, 'partner_uuid'),
+            session_token=session_token,
+        )
+        for row, session_token in zip(rows, session_tokens)
+    ]
+
+
+def _sign_out(users: list[User]) -> None:
+    with api_tx('READ COMMITTED') as tx:
+        tx.execute(Q_DELETE_SESSIONS, dict(
+            session_token_hashes=[sha512(u.session_token) for u in users],
+        ))
+
+
+def run(
+    scenarios: list[str],
+    seconds: float,
+    concurrency: int,
+    num_users: int,
+    seed: int,
+) -> dict[str, object]:
+    with api_tx('READ COMMITTED') as tx:
+        params = dict(email_pattern=EMAIL_PATTERN, seed=seed, limit=10000)
+
+        persons = row_int(
+            require_row(tx.execute(Q_COUNT_PERSONS, params).fetchone()),
+            'count',
+        )
+
+        prospects = [
+            row_str(row, 'uuid')
+            for row in tx.execute(Q_PROSPECTS, params).fetchall()
+        ]
+
+    users = _sign_in(seed, max(num_users, concurrency))
+
+    if len(users) < concurrency:
+        raise Exception(
+            f'Found {len(users)} synthetic people who have chatted, but '
+            f'{concurrency} are needed. Run `benchmark.generate` first.')
+
+    results: dict[str, object] = {}
+
+    try:
+        for scenario in scenarios:
+            print(f'Running {scenario}...', file=sys.stderr, flush=True)
+
+            if scenario in _HTTP_SCENARIOS:
+                path = _HTTP_SCENARIOS[scenario]
+                rngs = [random.Random(seed + w) for w in range(concurrency)]
+
+                def request(worker: int) -> None:
+                    rng = rngs[worker]
+                    user = rng.choice(users)
+                    _get(user, path(user, rng, prospects))
+
+                results[scenario] = measure(seconds, concurrency, request)
+            else:
+                # Each chat client is a different person
+                results[scenario] = asyncio.run(_measure_chat(
+                    seconds,
+                    users[:concurrency],
+                    _CHAT_SCENARIOS[scenario],
+                ))
+    finally:
+        _sign_out(users)
+
+    return dict(
+        persons=persons,
+        users=len(users),
+        concurrency=concurrency,
+        seconds=seconds,
+        seed=seed,
+        scenarios=results,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python3 -m benchmark.run',
+        description='Load tests search, the feed and chat',
+    )
+    parser.add_argument('--seconds', type=float, default=30,
+        help='how long to run each scenario for')
+    parser.add_argument('--concurrency', type=int, default=16,
+        help='clients making requests at once')
+    parser.add_argument('--users', type=int, default=1000,
+        help='people to sign in as')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+        help='a scenario to run; can be repeated. Runs them all by default.')
+
+    args = parser.parse_args()
+
+    report = run(
+        scenarios=args.scenario or SCENARIOS,
+        seconds=args.seconds,
+        concurrency=args.concurrency,
+        num_users=args.users,
+        seed=args.seed,
+    )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import unittest
+from benchmark import measure, summarize
+
+
+class TestSummarize(unittest.TestCase):
+    def test_percentiles_are_in_milliseconds(self) -> None:
+        summary = summarize(
+            [i / 1000 for i in range(1, 101)],
+            errors=2,
+            seconds=4,
+        )
+
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['errors'], 2)
+        self.assertEqual(summary['requests_per_second'], 25)
+        self.assertEqual(summary['p50_ms'], 50.5)
+        self.assertEqual(summary['p95_ms'], 95.05)
+        self.assertEqual(summary['p99_ms'], 99.01)
+
+    def test_nothing_succeeded(self) -> None:
+        summary = summarize([], errors=3, seconds=1)
+
+        self.assertEqual(summary['requests'], 0)
+        self.assertEqual(summary['requests_per_second'], 0)
+        self.assertIsNone(summary['p50_ms'])
+        self.assertIsNone(summary['p99_ms'])
+
+
+class TestMeasure(unittest.TestCase):
+    def test_counts_requests_and_errors(self) -> None:
+        def request(worker: int) -> None:
+            if worker == 1:
+                raise ValueError('failed')
+
+        summary = measure(seconds=0.05, concurrency=2, request=request)
+
+        self.assertNotEqual(summary['requests'], 0)
+        self.assertNotEqual(summary['errors'], 0)
+        self.assertEqual(summary['first_error'], "ValueError('failed')")
+
+
+if __name__ == '__main__':
+    unittest.main()
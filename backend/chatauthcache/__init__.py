@@ -0,0 +1,152 @@
+"""
+Keys and invalidation for the chat service's authorization cache.
+
+Before relaying a message, the chat service checks whether either person has
+skipped the other, whether the sender is shadow banned, and so on (see
+`service.chat.chatutil`). Each answer is cached in two tiers: an LRU in every
+chat worker (`service.chat.authcache`), in front of an entry in Redis which all
+the workers share. So only the first worker to ask goes to Postgres.
+
+Both tiers are keyed by the strings that the functions below build. The API
+writes the rows behind those answers, so after committing it calls one of the
+`invalidate_*` functions. They delete the shared entries and publish their keys
+on `INVALIDATION_CHANNEL`, which each chat worker listens to so that it can
+drop its own copies:
+
+  * skip / unskip / report    -> `invalidate_skipped`
+  * automatic shadow ban      -> `invalidate_shadow_banned`
+  * public profile setting    -> `invalidate_public`
+  * gold bought or expired    -> `invalidate_gold`
+  * account deletion / ban    -> `invalidate_person`
+
+Invalidating a key also increments its version (see `version_key`). A chat
+worker reads the version alongside the entry, before it queries Postgres, and
+only writes its answer to Redis if the version is still the same (see
+`SET_IF_VERSION_UNCHANGED`). Otherwise, a worker which read the old row just
+before the API committed could write it back just after the API invalidated
+it, where it'd stay until it expired.
+
+Because of this, the entries can live for `CHAT_AUTH_CACHE_TTL_SECONDS`. The
+TTL is the backstop for the cases invalidation misses: a Redis error while
+invalidating, and a chat worker that's reconnecting to Redis when the event is
+published.
+
+Like `sessioncache`, Redis is treated as a best-effort accelerator: errors are
+swallowed here and become cache misses in the chat service.
+"""
+
+import json
+import os
+from collections.abc import Iterable
+
+from redisclient import make_redis_client
+
+
+CHAT_AUTH_CACHE_TTL_SECONDS = int(os.environ.get(
+    'DUO_CHAT_AUTH_CACHE_TTL_SECONDS',
+    str(60 * 60),  # 1 hour
+))
+
+INVALIDATION_CHANNEL = 'chat-auth-invalidate'
+
+# Versions only need to outlive the time between a chat worker reading one and
+# writing its answer back, which is one Postgres query
+_VERSION_TTL_SECONDS = 5 * 60  # 5 minutes
+
+# KEYS: entry, its version. ARGV: the version read before querying Postgres
+# ('' if there wasn't one), the answer, its TTL
+SET_IF_VERSION_UNCHANGED = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+"""
+
+_KEY_PREFIX = 'chat_auth:'
+
+# Dedicated synchronous client (see `redisclient.make_redis_client`)
+_redis = make_redis_client()
+
+
+def skipped_key(person_id_a: int, person_id_b: int) -> str:
+    # Skipping goes both ways, so the key doesn't depend on the order
+    lo, hi = sorted([person_id_a, person_id_b])
+    return f'{_KEY_PREFIX}skipped:{lo}:{hi}'
+
+
+def person_id_key(username: str) -> str:
+    return f'{_KEY_PREFIX}person_id:{username}'
+
+
+def shadow_banned_key(person_id: int) -> str:
+    return f'{_KEY_PREFIX}shadow_banned:{person_id}'
+
+
+def public_key(person_id: int) -> str:
+    return f'{_KEY_PREFIX}public:{person_id}'
+
+
+def gold_key(username: str) -> str:
+    return f'{_KEY_PREFIX}gold:{username}'
+
+
+def version_key(key: str) -> str:
+    return f'{_KEY_PREFIX}version:{key}'
+
+
+def invalidate(keys: Iterable[str]) -> None:
+    """
+    Drop `keys` from Redis and from every chat worker. Call this after the
+    transaction which changed the rows behind them commits.
+    """
+    keys = list(keys)
+
+    if not keys:
+        return
+
+    try:
+        # A transaction, so that no chat worker's write lands between deleting
+        # an entry and incrementing its version
+        pipe = _redis.pipeline(transaction=True)
+        pipe.delete(*keys)
+        for key in keys:
+            pipe.incr(version_key(key))
+            pipe.expire(version_key(key), _VERSION_TTL_SECONDS)
+        pipe.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def invalidate_skipped(person_id_a: int, person_id_b: int) -> None:
+    invalidate([skipped_key(person_id_a, person_id_b)])
+
+
+def invalidate_shadow_banned(person_id: int) -> None:
+    invalidate([shadow_banned_key(person_id)])
+
+
+def invalidate_public(person_id: int) -> None:
+    invalidate([public_key(person_id)])
+
+
+def invalidate_gold(usernames: Iterable[str]) -> None:
+    invalidate(gold_key(username) for username in usernames)
+
+
+def invalidate_person(
+    person_ids: Iterable[int],
+    usernames: Iterable[str],
+) -> None:
+    """Drop everything cached about people who were deleted or banned"""
+    invalidate([
+        *(
+            key
+            for person_id in person_ids
+            for key in (shadow_banned_key(person_id), public_key(person_id))
+        ),
+        *(
+            key
+            for username in usernames
+            for key in (person_id_key(username), gold_key(username))
+        ),
+    ])
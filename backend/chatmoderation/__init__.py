@@ -0,0 +1,77 @@
+"""
+The CPU-bound checks which the chat service runs on incoming messages: whether
+a message is spam, and the hash of its normalized text which intros are checked
+for uniqueness by.
+
+These run in the chat worker's moderation processes (see
+`service.chat.moderation`), which are spawned and so import whatever module
+the checks live in. Importing anything under `service.chat` runs the chat
+service's `__init__`, which starts its threads and opens its pools and Redis
+clients, so the checks live here, with as few dependencies as possible.
+"""
+
+import time
+from dataclasses import dataclass
+import duohash
+import regex
+from antiabuse.antispam.urldetector import has_url, UrlType
+
+
+NON_ALPHANUMERIC_RE = regex.compile(r'[^\p{L}\p{N}]')
+REPEATED_CHARACTERS_RE = regex.compile(r'(.)\1{1,}')
+
+
+@dataclass(frozen=True)
+class Moderation:
+    is_spam: bool
+    intro_hash: str
+    # Seconds taken by each check
+    timings: dict[str, float]
+
+
+def is_spam(text: str) -> bool:
+    result = has_url(text, include_safe=True, do_normalize=False)
+
+    if result == [(UrlType.VERY_SAFE, text)]:
+        return False
+    else:
+        return bool(has_url(text))
+
+
+def normalize_message(message_str: str) -> str:
+    message_str = message_str.lower()
+
+    # Remove everything but non-alphanumeric characters
+    message_str = NON_ALPHANUMERIC_RE.sub('', message_str)
+
+    # Remove repeated characters
+    message_str = REPEATED_CHARACTERS_RE.sub(r'\1', message_str)
+
+    return message_str
+
+
+def moderate(text: str) -> Moderation:
+    timings: dict[str, float] = {}
+
+    start = time.perf_counter()
+    is_spam_ = is_spam(text)
+    timings['is_spam'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    intro_hash = duohash.md5(normalize_message(text))
+    timings['intro_hash'] = time.perf_counter() - start
+
+    return Moderation(
+        is_spam=is_spam_,
+        intro_hash=intro_hash,
+        timings=timings,
+    )
+
+
+def warm_up() -> None:
+    """Compiles the checks' regexes ahead of the first message"""
+    moderate('warm up https://example.com')
+
+
+def no_op() -> None:
+    pass
@@ -0,0 +1,26 @@
+import unittest
+import duohash
+from chatmoderation import (
+    moderate,
+    normalize_message,
+)
+
+
+class TestModerate(unittest.TestCase):
+    def test_normalize_message(self) -> None:
+        self.assertEqual(normalize_message("Heyyy, how're you?!"), "heyhowreyou")
+
+    def test_moderate(self) -> None:
+        moderation = moderate("look at this https://mycoolsite.com")
+
+        self.assertTrue(moderation.is_spam)
+        self.assertEqual(
+                moderation.intro_hash,
+                duohash.md5("lokathishtpsmycolsitecom"))
+        self.assertEqual(set(moderation.timings), {'is_spam', 'intro_hash'})
+
+        self.assertFalse(moderate("I am therapist").is_spam)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -88,6 +88,12 @@ class MamQuery:
 @dataclass(frozen=True)
 class InboxQuery:
     query_id: str
+    # Result set management: fetch at most `max` conversations, older than the
+    # `before` cursor returned by the previous page
+    max: str | None = None
+    before: str | None = None
+    # Only fetch conversations which changed after this ISO 8601 timestamp
+    start: str | None = None
 
 
 @dataclass(frozen=True)
@@ -296,7 +302,27 @@ def _try_inbox(el: Element) -> InboxQuery | None:
     if not query_id:
         return None
 
-    return InboxQuery(query_id=query_id)
+    start = None
+    for field in inbox.descendants('field'):
+        if field.get('var') == 'start':
+            value = field.find('value')
+            if value is not None and value.text:
+                start = value.text
+
+    before_el = inbox.descendant('before')
+    max_el = inbox.descendant('max')
+
+    before = (
+        before_el.text if before_el is not None and before_el.text else None
+    )
+    max_ = max_el.text if max_el is not None and max_el.text else None
+
+    return InboxQuery(
+        query_id=query_id,
+        max=max_,
+        before=before,
+        start=start,
+    )
 
 
 def _try_mark_displayed(el: Element) -> MarkDisplayed | None:
@@ -40,6 +40,7 @@ NS_DELAY = 'urn:xmpp:delay'
 NS_FORWARD = 'urn:xmpp:forward:0'
 NS_MAM = 'urn:xmpp:mam:2'
 NS_INBOX = 'erlang-solutions.com:xmpp:inbox:0'
+NS_RSM = 'http://jabber.org/protocol/rsm'
 NS_CHAT_MARKERS = 'urn:xmpp:chat-markers:0'
 NS_STREAMS = 'http://etherx.jabber.org/streams'
 NS_TLS = 'urn:ietf:params:xml:ns:xmpp-tls'
@@ -570,12 +571,25 @@ class InboxResult(Outbound):
 @dataclass(frozen=True)
 class InboxFin(Outbound):
     query_id: str
+    # The server's time when the query ran, for use as the `start` of the next
+    # incremental query. Only sent in reply to paginated or incremental queries.
+    stamp: str | None = None
+    # The `before` cursor for the next, older, page. Absent on the last page.
+    first: str | None = None
 
     def canonical(self) -> dict:
+        fin: dict = {}
+
+        if self.stamp is not None:
+            fin['@stamp'] = self.stamp
+
+        if self.first is not None:
+            fin['set'] = {'@xmlns': NS_RSM, 'first': self.first}
+
         return {'iq': {
             '@id': self.query_id,
             '@type': 'result',
-            'fin': None,
+            'fin': fin or None,
         }}
 
 
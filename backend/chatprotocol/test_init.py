@@ -142,6 +142,10 @@ OUTBOUND_SAMPLES = [
         inner_to_username=U1, body='hi', stamp='2020-01-01T00:00:00.000000Z',
         unread_count=2, box='inbox', query_id='q1', muted_until=0),
     InboxFin(query_id='q1'),
+    InboxFin(query_id='q1', stamp='2020-01-01T00:00:00.000000Z'),
+    InboxFin(
+        query_id='q1', stamp='2020-01-01T00:00:00.000000Z',
+        first=f'1577836800000000:{U2}'),
     StreamOpenResponse(version='1.0', id='oid', from_=LSERVER),
     StreamFeatures(authenticated=False),
     StreamFeatures(authenticated=True),
@@ -359,6 +363,24 @@ class TestInboundParsing(unittest.TestCase):
         x = parse_incoming(xml, 'xmpp')
         self.assertEqual(x, InboxQuery(query_id='5'))
 
+    def test_inbox_query_paginated(self) -> None:
+        xml = (
+            "<iq type='set' id='5'>"
+            "<inbox xmlns='erlang-solutions.com:xmpp:inbox:0' queryid='5'>"
+            "<x xmlns='jabber:x:data' type='form'>"
+            "<field var='start'><value>2020-01-01T00:00:00.000000Z</value></field>"
+            "</x>"
+            "<set xmlns='http://jabber.org/protocol/rsm'>"
+            f"<max>50</max><before>1577836800000000:{U2}</before></set>"
+            "</inbox></iq>")
+        x = parse_incoming(xml, 'xmpp')
+        self.assertEqual(x, InboxQuery(
+            query_id='5',
+            max='50',
+            before=f'1577836800000000:{U2}',
+            start='2020-01-01T00:00:00.000000Z',
+        ))
+
     def test_iq_bind(self) -> None:
         xml = (
             "<iq xmlns='jabber:client' type='set' id='b1'>"
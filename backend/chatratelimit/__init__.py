@@ -0,0 +1,81 @@
+"""
+Redis keys for the events which the chat service's intro rate limit counts (see
+`service.chat.ratelimit`), and the API's half of keeping them up to date.
+
+Each kind of event is a sorted set per person, scored by the time it happened,
+so that counting the events in a sliding window is one `ZCOUNT`:
+
+  * intros sent       -> member: recipient's person id  (written by chat)
+  * reports received  -> member: reporter's person id   (written here)
+  * rude messages     -> member: when it was sent       (only reconciled)
+
+The sets are corrected from Postgres at most once per
+`RATE_LIMIT_RECONCILE_SECONDS` per person, so events which are missed here,
+such as reports which are removed when the reporter's account is deleted, only
+cause drift until then.
+
+Like `sessioncache`, Redis is treated as a best-effort accelerator: errors are
+swallowed here, and the chat service falls back to Postgres when it can't read
+the sets.
+"""
+
+import os
+import time
+
+from redisclient import make_redis_client
+
+
+INTRO_WINDOW_SECONDS = 24 * 60 * 60  # 24 hours
+
+REPORT_WINDOW_SECONDS = 7 * 24 * 60 * 60  # 7 days
+
+RUDE_MESSAGE_WINDOW_SECONDS = 24 * 60 * 60  # 24 hours
+
+RATE_LIMIT_RECONCILE_SECONDS = int(os.environ.get(
+    'DUO_RATE_LIMIT_RECONCILE_SECONDS',
+    str(60 * 60),  # 1 hour
+))
+
+_KEY_PREFIX = 'chat_rate_limit:'
+
+# Dedicated synchronous client (see `redisclient.make_redis_client`)
+_redis = make_redis_client()
+
+
+def intros_key(person_id: int) -> str:
+    return f'{_KEY_PREFIX}intros:{person_id}'
+
+
+def reports_key(person_id: int) -> str:
+    return f'{_KEY_PREFIX}reports:{person_id}'
+
+
+def rude_messages_key(person_id: int) -> str:
+    return f'{_KEY_PREFIX}rude_messages:{person_id}'
+
+
+def reconciled_key(person_id: int) -> str:
+    return f'{_KEY_PREFIX}reconciled:{person_id}'
+
+
+def record_report(object_person_id: int, subject_person_id: int) -> None:
+    """Counts a report of `object_person_id` which rate limits their intros"""
+    now = time.time()
+    key = reports_key(object_person_id)
+
+    try:
+        pipe = _redis.pipeline(transaction=False)
+        pipe.zadd(key, {str(subject_person_id): now}, nx=True)
+        pipe.zremrangebyscore(key, '-inf', now - REPORT_WINDOW_SECONDS)
+        pipe.expire(key, REPORT_WINDOW_SECONDS)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def forget_report(object_person_id: int, subject_person_id: int) -> None:
+    """Stops counting a report which was withdrawn by unskipping"""
+    try:
+        _redis.zrem(reports_key(object_person_id), str(subject_person_id))
+    except Exception:
+        pass
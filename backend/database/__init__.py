@@ -10,6 +10,7 @@ from database._row import (
     row_str_or_none,
     row_value,
 )
+from psycopg_pool import ConnectionPool, PoolTimeout
 import os
 import psycopg
 import random
@@ -22,6 +23,24 @@ DB_PORT = os.environ['DUO_DB_PORT']
 DB_USER = os.environ['DUO_DB_USER']
 DB_PASS = os.environ['DUO_DB_PASS']
 
+# Each isolation level gets its own pool, so these bounds apply per level. A
+# process only opens the pools for the levels it actually uses.
+DB_POOL_MIN_SIZE = int(os.environ.get(
+    'DUO_DB_POOL_MIN_SIZE',
+    str(1),
+))
+
+DB_POOL_MAX_SIZE = int(os.environ.get(
+    'DUO_DB_POOL_MAX_SIZE',
+    str(8),
+))
+
+# How long `api_tx` waits for a free connection before giving up
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get(
+    'DUO_DB_POOL_TIMEOUT_SECONDS',
+    str(30),
+))
+
 _valid_isolation_levels = [
     'SERIALIZABLE',
     'REPEATABLE READ',
@@ -35,17 +54,23 @@ _coninfo_args = dict(
     port=DB_PORT,
     user=DB_USER,
     password=DB_PASS,
-    options=(
-        f" -c default_transaction_isolation=" +
-            _default_transaction_isolation.replace(' ', '\\ ') +
-        f" -c idle_session_timeout=0"
-        f" -c statement_timeout=5000"
-    ),
 )
 
-_api_conninfo = psycopg.conninfo.make_conninfo(
-    **(_coninfo_args | dict(dbname='duo_api'))
-)
+
+def _api_conninfo(isolation_level: str) -> str:
+    # The isolation level is baked into each pooled connection as its session
+    # default, so a transaction never needs a `SET TRANSACTION` round trip.
+    return psycopg.conninfo.make_conninfo(
+        **(_coninfo_args | dict(
+            dbname='duo_api',
+            options=(
+                f" -c default_transaction_isolation=" +
+                    isolation_level.replace(' ', '\\ ') +
+                f" -c idle_session_timeout=0"
+                f" -c statement_timeout=5000"
+            ),
+        ))
+    )
 
 CursorQuery = str | bytes | psycopg.sql.SQL | psycopg.sql.Composed
 Row = psycopg.rows.DictRow
@@ -164,9 +189,52 @@ class TxCursor:
         self._cur.close()
 
 
-_api_conn: psycopg.Connection[Row] | None = None
+ApiPool = ConnectionPool[psycopg.Connection[Row]]
+
+_api_pools: dict[str, ApiPool] = {}
+
+_api_pools_lock = threading.Lock()
+
+
+def _api_pool(isolation_level: str) -> ApiPool:
+    pool = _api_pools.get(isolation_level)
+    if pool is not None:
+        return pool
+
+    with _api_pools_lock:
+        pool = _api_pools.get(isolation_level)
+        if pool is not None:
+            return pool
+
+        pool = ConnectionPool(
+            conninfo=_api_conninfo(isolation_level),
+            connection_class=psycopg.Connection[Row],
+            kwargs=dict(row_factory=psycopg.rows.dict_row),
+            min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT_SECONDS,
+            name=f'api_tx {isolation_level}',
+            open=True,
+        )
+
+        _api_pools[isolation_level] = pool
+
+        return pool
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """
+    Returns the counters of each open pool, keyed by isolation level. Of note
+    are `requests_waiting` (callers currently blocked on a connection),
+    `requests_queued` (callers which had to wait at all), `requests_wait_ms`
+    (total time callers spent waiting) and `requests_errors` (callers which
+    timed out). Counters cover the time since the last pool health check.
+    """
+    return {
+        isolation_level: pool.get_stats()
+        for isolation_level, pool in list(_api_pools.items())
+    }
 
-_api_conn_lock  = threading.Lock()
 
 class api_tx:
     def __init__(self, isolation_level: str = _default_transaction_isolation) -> None:
@@ -177,38 +245,26 @@ class api_tx:
 
         self.isolation_level = normalized_isolation_level
 
+        self.pool: ApiPool
         self.conn: psycopg.Connection[Row]
         self.cur: Tx
 
     def __enter__(self) -> Tx:
-        _api_conn_lock.acquire()
+        self.pool = _api_pool(self.isolation_level)
 
-        global _api_conn
-        conn = _api_conn
-        if conn is None or conn.closed:
-            try:
-                conn = psycopg.Connection.connect(
-                    conninfo=_api_conninfo,
-                    row_factory=psycopg.rows.dict_row,
-                )
-                _api_conn = conn
-            except:
-                _api_conn_lock.release()
-                print(traceback.format_exc())
-                raise
+        try:
+            self.conn = self.pool.getconn()
+        except PoolTimeout:
+            print(traceback.format_exc())
+            raise
 
-        self.conn = conn
-        self.cur = TxCursor(conn.cursor())
+        try:
+            self.cur = TxCursor(self.conn.cursor())
+        except:
+            self.pool.putconn(self.conn)
+            print(traceback.format_exc())
+            raise
 
-        if self.isolation_level != _default_transaction_isolation:
-            try:
-                self.cur.execute(
-                    f'SET TRANSACTION ISOLATION LEVEL {self.isolation_level}'
-                )
-            except:
-                _api_conn_lock.release()
-                print(traceback.format_exc())
-                raise
         return self.cur
 
     def __exit__(
@@ -230,7 +286,9 @@ class api_tx:
             except:
                 print(traceback.format_exc())
 
-        _api_conn_lock.release()
+            # The pool rolls back anything left open and discards the
+            # connection if it's broken.
+            self.pool.putconn(self.conn)
 
 def fetchall_sets(tx: Tx) -> list[Row]:
     result: list[Row] = []
@@ -241,13 +299,19 @@ def fetchall_sets(tx: Tx) -> list[Row]:
             break
     return result
 
-def _check_api_connection_forever() -> None:
+def _check_api_pools_forever() -> None:
     while True:
-        try:
-            with api_tx() as tx:
-                tx.execute('SELECT 1')
-        except:
-            print(traceback.format_exc())
         time.sleep(random.randint(30, 90))
 
-threading.Thread(target=_check_api_connection_forever,  daemon=True).start()
+        for isolation_level, pool in list(_api_pools.items()):
+            try:
+                # Replaces idle connections which the server has dropped
+                pool.check()
+
+                stats = pool.pop_stats()
+                if stats.get('requests_queued') or stats.get('requests_errors'):
+                    print(f'api_tx pool ({isolation_level}) is saturated:', stats)
+            except:
+                print(traceback.format_exc())
+
+threading.Thread(target=_check_api_pools_forever, daemon=True).start()
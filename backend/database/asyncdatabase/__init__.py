@@ -3,8 +3,9 @@ import os
 import psycopg
 import random
 import traceback
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 from types import TracebackType
-from typing import Protocol
+from typing import Literal, Protocol
 from collections.abc import Iterable
 from database._row import (
     require_row,
@@ -21,6 +22,31 @@ DB_PORT = os.environ['DUO_DB_PORT']
 DB_USER = os.environ['DUO_DB_USER']
 DB_PASS = os.environ['DUO_DB_PASS']
 
+# Each isolation level gets its own pool, so these bounds apply per level. A
+# process only opens the pools for the levels it actually uses.
+DB_POOL_MIN_SIZE = int(os.environ.get(
+    'DUO_DB_ASYNC_POOL_MIN_SIZE',
+    str(1),
+))
+
+DB_POOL_MAX_SIZE = int(os.environ.get(
+    'DUO_DB_ASYNC_POOL_MAX_SIZE',
+    str(8),
+))
+
+# How long `api_tx` queues for a free connection before giving up
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get(
+    'DUO_DB_ASYNC_POOL_TIMEOUT_SECONDS',
+    str(30),
+))
+
+# Connections in each pool which low-priority callers may never hold, so that
+# batch work can't starve interactive queries of connections
+DB_POOL_HIGH_PRIORITY_RESERVE = int(os.environ.get(
+    'DUO_DB_ASYNC_POOL_HIGH_PRIORITY_RESERVE',
+    str(2),
+))
+
 _valid_isolation_levels = [
     'SERIALIZABLE',
     'REPEATABLE READ',
@@ -34,23 +60,33 @@ _coninfo_args = dict(
     port=DB_PORT,
     user=DB_USER,
     password=DB_PASS,
-    options=(
-        f" -c default_transaction_isolation=" +
-            _default_transaction_isolation.replace(' ', '\\ ') +
-        f" -c idle_session_timeout=0"
-        f" -c statement_timeout=5000"
-    ),
 )
 
-_api_conninfo = psycopg.conninfo.make_conninfo(
-    **(_coninfo_args | dict(dbname='duo_api'))
-)
+
+def _api_conninfo(isolation_level: str) -> str:
+    # The isolation level is baked into each pooled connection as its session
+    # default, so a transaction never needs a `SET TRANSACTION` round trip.
+    return psycopg.conninfo.make_conninfo(
+        **(_coninfo_args | dict(
+            dbname='duo_api',
+            options=(
+                f" -c default_transaction_isolation=" +
+                    isolation_level.replace(' ', '\\ ') +
+                f" -c idle_session_timeout=0"
+                f" -c statement_timeout=5000"
+            ),
+        ))
+    )
 
 CursorQuery = str | bytes | psycopg.sql.SQL | psycopg.sql.Composed
 Row = psycopg.rows.DictRow
 
 
 class Tx(Protocol):
+    @property
+    def connection(self) -> psycopg.AsyncConnection[psycopg.rows.DictRow]:
+        ...
+
     @property
     def rowcount(self) -> int:
         ...
@@ -90,6 +126,10 @@ class TxCursor:
     def __init__(self, cur: psycopg.AsyncCursor[Row]) -> None:
         self._cur = cur
 
+    @property
+    def connection(self) -> psycopg.AsyncConnection[Row]:
+        return self._cur.connection
+
     @property
     def rowcount(self) -> int:
         return self._cur.rowcount
@@ -127,51 +167,124 @@ class TxCursor:
         await self._cur.close()
 
 
-_api_conn: psycopg.AsyncConnection[Row] | None = None
+# 'high' is for work someone is waiting on, like answering a chat client.
+# 'low' is for batch work, like cron jobs and background writes, which is
+# capped so that it always leaves `DB_POOL_HIGH_PRIORITY_RESERVE` connections
+# free for 'high' callers.
+Priority = Literal['high', 'low']
+
+ApiPool = AsyncConnectionPool[psycopg.AsyncConnection[Row]]
+
+_api_pools: dict[str, ApiPool] = {}
+
+_low_priority_slots: dict[str, asyncio.Semaphore] = {}
+
+_api_pools_lock = asyncio.Lock()
+
+
+async def _api_pool(isolation_level: str) -> ApiPool:
+    pool = _api_pools.get(isolation_level)
+    if pool is not None:
+        return pool
+
+    async with _api_pools_lock:
+        pool = _api_pools.get(isolation_level)
+        if pool is not None:
+            return pool
+
+        pool = AsyncConnectionPool(
+            conninfo=_api_conninfo(isolation_level),
+            connection_class=psycopg.AsyncConnection[Row],
+            kwargs=dict(row_factory=psycopg.rows.dict_row),
+            min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            max_size=DB_POOL_MAX_SIZE,
+            timeout=DB_POOL_TIMEOUT_SECONDS,
+            name=f'async api_tx {isolation_level}',
+            open=False,
+        )
+
+        await pool.open()
+
+        _low_priority_slots[isolation_level] = asyncio.Semaphore(
+            max(1, DB_POOL_MAX_SIZE - DB_POOL_HIGH_PRIORITY_RESERVE))
+
+        _api_pools[isolation_level] = pool
+
+        return pool
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """
+    Returns the counters of each open pool, keyed by isolation level. Of note
+    are `requests_waiting` (callers currently queued for a connection),
+    `requests_queued` (callers which had to queue at all), `requests_wait_ms`
+    (total time callers spent queued) and `requests_errors` (callers which
+    timed out). Counters cover the time since the last pool health check.
+    """
+    return {
+        isolation_level: pool.get_stats()
+        for isolation_level, pool in list(_api_pools.items())
+    }
 
-_api_conn_lock = asyncio.Lock()
 
 class api_tx:
-    def __init__(self, isolation_level: str = _default_transaction_isolation) -> None:
+    def __init__(
+        self,
+        isolation_level: str = _default_transaction_isolation,
+        priority: Priority = 'high',
+    ) -> None:
         normalized_isolation_level = isolation_level.upper()
 
         if normalized_isolation_level not in _valid_isolation_levels:
             raise ValueError(isolation_level)
 
         self.isolation_level = normalized_isolation_level
+        self.priority = priority
 
+        self.pool: ApiPool
+        self.slot: asyncio.Semaphore | None = None
         self.conn: psycopg.AsyncConnection[Row]
         self.cur: Tx
 
+    async def _acquire_slot(self) -> None:
+        if self.priority != 'low':
+            return
+
+        slot = _low_priority_slots[self.isolation_level]
+
+        try:
+            await asyncio.wait_for(slot.acquire(), DB_POOL_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(
+                f"couldn't get a low-priority slot after "
+                f"{DB_POOL_TIMEOUT_SECONDS:.2f} sec") from None
+
+        self.slot = slot
+
+    def _release_slot(self) -> None:
+        if self.slot is not None:
+            self.slot.release()
+            self.slot = None
+
     async def __aenter__(self) -> Tx:
-        await _api_conn_lock.acquire()
+        self.pool = await _api_pool(self.isolation_level)
 
-        global _api_conn
-        conn = _api_conn
-        if conn is None or conn.closed:
-            try:
-                conn = await psycopg.AsyncConnection.connect(
-                    conninfo=_api_conninfo,
-                    row_factory=psycopg.rows.dict_row,
-                )
-                _api_conn = conn
-            except:
-                _api_conn_lock.release()
-                print(traceback.format_exc())
-                raise
+        try:
+            await self._acquire_slot()
+            self.conn = await self.pool.getconn()
+        except:
+            self._release_slot()
+            print(traceback.format_exc())
+            raise
 
-        self.conn = conn
-        self.cur = TxCursor(conn.cursor())
+        try:
+            self.cur = TxCursor(self.conn.cursor())
+        except:
+            await self.pool.putconn(self.conn)
+            self._release_slot()
+            print(traceback.format_exc())
+            raise
 
-        if self.isolation_level != _default_transaction_isolation:
-            try:
-                await self.cur.execute(
-                    f'SET TRANSACTION ISOLATION LEVEL {self.isolation_level}'
-                )
-            except:
-                _api_conn_lock.release()
-                print(traceback.format_exc())
-                raise
         return self.cur
 
     async def __aexit__(
@@ -193,16 +306,29 @@ class api_tx:
             except:
                 print(traceback.format_exc())
 
-        _api_conn_lock.release()
+            # The pool rolls back anything left open and discards the
+            # connection if it's broken.
+            try:
+                await self.pool.putconn(self.conn)
+            finally:
+                self._release_slot()
 
-async def _check_api_connection_forever() -> None:
+async def _check_api_pools_forever() -> None:
     while True:
-        try:
-            async with api_tx() as tx:
-                await tx.execute('SELECT 1')
-        except:
-            print(traceback.format_exc())
         await asyncio.sleep(random.randint(30, 90))
 
+        for isolation_level, pool in list(_api_pools.items()):
+            try:
+                # Replaces idle connections which the server has dropped
+                await pool.check()
+
+                stats = pool.pop_stats()
+                if stats.get('requests_queued') or stats.get('requests_errors'):
+                    print(
+                        f'async api_tx pool ({isolation_level}) is saturated:',
+                        stats)
+            except:
+                print(traceback.format_exc())
+
 async def check_connections_forever() -> None:
-    await _check_api_connection_forever()
+    await _check_api_pools_forever()
@@ -21,3 +21,603 @@ BEGIN
     END IF;
 END;
 $$ LANGUAGE plpgsql;
+
+CREATE INDEX IF NOT EXISTS
+    idx__inbox__luser__displayed_at
+    ON inbox(luser, displayed_at);
+
+ALTER TABLE inbox
+    ADD COLUMN IF NOT EXISTS relation_changed_at TIMESTAMP;
+
+-- Lets inbox queries find conversations whose place in the inbox changed
+-- since a given time, without a new message: one of its people skipped the
+-- other, unskipped them, or deleted their account (see `Q_DELETE_ACCOUNT`).
+-- Clients learn where such conversations now belong from `/inbox-info`.
+CREATE INDEX IF NOT EXISTS
+    idx__inbox__luser__relation_changed_at
+    ON inbox(luser, relation_changed_at);
+
+CREATE OR REPLACE FUNCTION
+    touch_inbox_on_skipped()
+RETURNS TRIGGER AS $$
+DECLARE
+    subject_uuid TEXT;
+    object_uuid TEXT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT uuid::TEXT INTO subject_uuid
+        FROM person WHERE id = OLD.subject_person_id;
+
+        SELECT uuid::TEXT INTO object_uuid
+        FROM person WHERE id = OLD.object_person_id;
+    ELSE
+        SELECT uuid::TEXT INTO subject_uuid
+        FROM person WHERE id = NEW.subject_person_id;
+
+        SELECT uuid::TEXT INTO object_uuid
+        FROM person WHERE id = NEW.object_person_id;
+    END IF;
+
+    UPDATE
+        inbox
+    SET
+        relation_changed_at = NOW()
+    WHERE
+        luser = subject_uuid AND
+        split_part(remote_bare_jid, '@', 1) = object_uuid
+    OR
+        luser = object_uuid AND
+        split_part(remote_bare_jid, '@', 1) = subject_uuid;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER
+    trigger_touch_inbox_on_skipped
+AFTER INSERT OR DELETE ON
+    skipped
+FOR EACH ROW EXECUTE FUNCTION
+    touch_inbox_on_skipped();
+
+ALTER TABLE person
+    ADD COLUMN IF NOT EXISTS search_index_time TIMESTAMP NOT NULL DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx__person__search_index_time
+    ON person(search_index_time);
+
+CREATE OR REPLACE FUNCTION
+    touch_person_search_index_time()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF
+        OLD.activated IS DISTINCT FROM NEW.activated OR
+        OLD.shadow_banned_at IS DISTINCT FROM NEW.shadow_banned_at OR
+        OLD.gender_id IS DISTINCT FROM NEW.gender_id OR
+        OLD.coordinates IS DISTINCT FROM NEW.coordinates OR
+        OLD.personality IS DISTINCT FROM NEW.personality
+    THEN
+        NEW.search_index_time = NOW();
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER
+    trigger_touch_person_search_index_time
+BEFORE UPDATE OF
+    activated,
+    shadow_banned_at,
+    gender_id,
+    coordinates,
+    personality
+ON
+    person
+FOR EACH ROW EXECUTE FUNCTION
+    touch_person_search_index_time();
+
+-- `search_cache` used to hold one wide row per search result. It's unlogged and
+-- refilled by the next search, so the old layout is dropped rather than
+-- converted.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT
+            1
+        FROM
+            information_schema.columns
+        WHERE
+            table_name = 'search_cache'
+        AND
+            column_name = 'position'
+    ) THEN
+        DROP TABLE search_cache;
+    END IF;
+END $$;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS search_cache (
+    searcher_person_id INT REFERENCES person(id) ON DELETE CASCADE ON UPDATE CASCADE,
+    prospect_person_ids INT[] NOT NULL,
+    match_percentages SMALLINT[] NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (searcher_person_id)
+);
+
+ALTER TABLE search_cache
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT NOW();
+
+ALTER TABLE search_cache
+ADD COLUMN IF NOT EXISTS warmed_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx__duo_session__last_online_time
+    ON duo_session(last_online_time);
+
+-- One row per person, holding the cards `Q_FEED` shows them with: `online_card`
+-- while they were recently online, or `event_card` otherwise. `online_card` is
+-- NULL for people who'd be shown with their last event either way. Kept up to
+-- date by `refresh_feed_card`, so that the feed doesn't look up photos and
+-- events on every request. When someone was last online is read from
+-- `person.last_online_time` instead, so that online pings don't write here.
+CREATE TABLE IF NOT EXISTS feed_card (
+    person_id INT REFERENCES person(id) ON DELETE CASCADE ON UPDATE CASCADE,
+    last_event_time TIMESTAMP NOT NULL,
+    online_card JSONB,
+    event_card JSONB NOT NULL,
+    PRIMARY KEY (person_id)
+);
+
+-- One row per person, holding what search results and visitor lists show of
+-- them: their name, age, profile photo and verification levels. Kept up to date
+-- by `refresh_prospect_card`, so that a page of results is hydrated with one
+-- lookup per prospect instead of reading `person` and `photo` for each.
+CREATE TABLE IF NOT EXISTS prospect_card (
+    person_id INT REFERENCES person(id) ON DELETE CASCADE ON UPDATE CASCADE,
+    uuid UUID NOT NULL,
+    url_slug TEXT NOT NULL,
+    name TEXT NOT NULL,
+    date_of_birth DATE NOT NULL,
+    show_my_age BOOLEAN NOT NULL,
+    verification_level_id SMALLINT NOT NULL,
+    privacy_verification_level_id SMALLINT NOT NULL,
+    profile_photo_uuid TEXT,
+    profile_photo_blurhash TEXT,
+    PRIMARY KEY (person_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx__feed_card__last_event_time
+    ON feed_card(last_event_time);
+
+CREATE OR REPLACE FUNCTION refresh_feed_card(p_person_id INT)
+RETURNS INTEGER AS $$
+    WITH prospect AS (
+        SELECT
+            person.id AS person_id,
+            person.last_event_time,
+            person.last_event_name,
+            person.last_event_data,
+            jsonb_build_object(
+                'person_uuid', person.uuid,
+                'url_slug', person.url_slug,
+                'name', person.name,
+                'photo_uuid', profile_photo.uuid,
+                'photo_blurhash', profile_photo.blurhash,
+                'is_verified', person.verification_level_id > 1,
+                'gender', gender.name,
+                'location', (
+                    SELECT person.location_short_friendly
+                    WHERE person.show_my_location
+                ),
+                -- Ads have been removed; this is kept as a constant so
+                -- existing native clients (which validate this field) keep
+                -- working
+                'advertiser_friendly', FALSE
+            ) AS card,
+            added_photo.uuid AS added_photo_uuid,
+            added_photo.blurhash AS added_photo_blurhash,
+            added_photo.extra_exts AS added_photo_extra_exts
+        FROM
+            person
+        JOIN
+            gender
+        ON
+            gender.id = person.gender_id
+        LEFT JOIN LATERAL (
+            SELECT
+                photo.uuid,
+                photo.blurhash
+            FROM
+                photo
+            WHERE
+                photo.person_id = person.id
+            ORDER BY
+                photo.position
+            LIMIT 1
+        ) AS profile_photo
+        ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT
+                photo.uuid,
+                photo.blurhash,
+                photo.extra_exts
+            FROM
+                photo
+            WHERE
+                photo.person_id = person.id
+            ORDER BY
+                '{}'::TEXT[] = extra_exts,
+                photo.uuid = profile_photo.uuid,
+                random()
+            LIMIT 1
+        ) AS added_photo
+        ON TRUE
+        WHERE
+            person.id = p_person_id
+    ), mapped_event AS (
+        SELECT
+            *,
+
+            -- How the person is shown while they were recently online
+            CASE
+
+            WHEN last_event_name = 'added-photo'
+            THEN 'recently-online-with-photo'
+
+            WHEN last_event_name = 'added-voice-bio'
+            THEN 'recently-online-with-voice-bio'
+
+            WHEN last_event_name = 'updated-bio'
+            THEN 'recently-online-with-bio'
+
+            WHEN added_photo_uuid IS NOT NULL
+            THEN 'recently-online-with-photo'
+
+            WHEN last_event_name = 'recently-online-with-photo'
+            THEN 'added-photo'
+
+            WHEN last_event_name = 'recently-online-with-voice-bio'
+            THEN 'added-voice-bio'
+
+            WHEN last_event_name = 'recently-online-with-bio'
+            THEN 'updated-bio'
+
+            ELSE last_event_name::TEXT
+
+            END AS online_event_name,
+
+            CASE
+
+            WHEN last_event_name IN (
+                'added-photo',
+                'added-voice-bio',
+                'updated-bio'
+            )
+            THEN last_event_data
+
+            WHEN added_photo_uuid IS NOT NULL
+            THEN jsonb_build_object(
+                'added_photo_uuid', added_photo_uuid,
+                'added_photo_blurhash', added_photo_blurhash,
+                'added_photo_extra_exts', added_photo_extra_exts
+            )
+
+            ELSE last_event_data
+
+            END AS online_event_data,
+
+            -- How the person is shown otherwise
+            CASE
+
+            WHEN last_event_name = 'recently-online-with-photo'
+            THEN 'added-photo'
+
+            WHEN last_event_name = 'recently-online-with-voice-bio'
+            THEN 'added-voice-bio'
+
+            WHEN last_event_name = 'recently-online-with-bio'
+            THEN 'updated-bio'
+
+            ELSE last_event_name::TEXT
+
+            END AS event_name
+        FROM
+            prospect
+    ), upserted AS (
+        INSERT INTO feed_card (
+            person_id,
+            last_event_time,
+            online_card,
+            event_card
+        )
+        SELECT
+            person_id,
+            last_event_time,
+            CASE
+                -- People who only joined are shown at the time they joined,
+                -- even if they were online since
+                WHEN online_event_name = 'joined'
+                THEN NULL
+                ELSE
+                    card
+                    || jsonb_build_object('type', online_event_name)
+                    || online_event_data
+            END,
+            card
+            || jsonb_build_object('type', event_name)
+            || last_event_data
+        FROM
+            mapped_event
+        ON CONFLICT (person_id) DO UPDATE SET
+            last_event_time = EXCLUDED.last_event_time,
+            online_card = EXCLUDED.online_card,
+            event_card = EXCLUDED.event_card
+        RETURNING
+            1
+    )
+    SELECT COUNT(*) FROM upserted;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION trigger_fn_refresh_feed_card_on_person()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF
+        TG_OP = 'INSERT' OR
+        OLD.uuid IS DISTINCT FROM NEW.uuid OR
+        OLD.url_slug IS DISTINCT FROM NEW.url_slug OR
+        OLD.name IS DISTINCT FROM NEW.name OR
+        OLD.verification_level_id IS DISTINCT FROM NEW.verification_level_id OR
+        OLD.gender_id IS DISTINCT FROM NEW.gender_id OR
+        OLD.show_my_location IS DISTINCT FROM NEW.show_my_location OR
+        OLD.location_short_friendly IS DISTINCT FROM NEW.location_short_friendly OR
+        OLD.last_event_time IS DISTINCT FROM NEW.last_event_time OR
+        OLD.last_event_name IS DISTINCT FROM NEW.last_event_name OR
+        OLD.last_event_data IS DISTINCT FROM NEW.last_event_data
+    THEN
+        PERFORM refresh_feed_card(NEW.id);
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER
+    trigger_refresh_feed_card_on_person
+AFTER INSERT OR UPDATE OF
+    uuid,
+    url_slug,
+    name,
+    verification_level_id,
+    gender_id,
+    show_my_location,
+    location_short_friendly,
+    last_event_time,
+    last_event_name,
+    last_event_data
+ON
+    person
+FOR EACH ROW EXECUTE FUNCTION
+    trigger_fn_refresh_feed_card_on_person();
+
+CREATE OR REPLACE FUNCTION trigger_fn_refresh_feed_card_on_photo()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM refresh_feed_card(OLD.person_id);
+        RETURN OLD;
+    ELSE
+        PERFORM refresh_feed_card(NEW.person_id);
+        RETURN NEW;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER
+    trigger_refresh_feed_card_on_photo
+AFTER INSERT OR DELETE OR UPDATE OF
+    uuid,
+    blurhash,
+    position,
+    extra_exts
+ON
+    photo
+FOR EACH ROW EXECUTE FUNCTION
+    trigger_fn_refresh_feed_card_on_photo();
+
+-- The feed only shows people whose last event was in the past month. Everyone
+-- else gets a card when their next event refreshes it.
+SELECT
+    refresh_feed_card(id)
+FROM
+    person
+WHERE
+    last_event_time > now() - interval '1 month'
+AND
+    NOT EXISTS (SELECT 1 FROM feed_card WHERE person_id = person.id);
+
+CREATE OR REPLACE FUNCTION refresh_prospect_card(p_person_id INT)
+RETURNS INTEGER AS $$
+    WITH upserted AS (
+        INSERT INTO prospect_card (
+            person_id,
+            uuid,
+            url_slug,
+            name,
+            date_of_birth,
+            show_my_age,
+            verification_level_id,
+            privacy_verification_level_id,
+            profile_photo_uuid,
+            profile_photo_blurhash
+        )
+        SELECT
+            person.id,
+            person.uuid,
+            person.url_slug,
+            person.name,
+            person.date_of_birth,
+            person.show_my_age,
+            person.verification_level_id,
+            person.privacy_verification_level_id,
+            profile_photo.uuid,
+            profile_photo.blurhash
+        FROM
+            person
+        LEFT JOIN LATERAL (
+            SELECT
+                uuid,
+                blurhash
+            FROM
+                photo
+            WHERE
+                person_id = person.id
+            ORDER BY
+                position
+            LIMIT 1
+        ) AS profile_photo
+        ON
+            TRUE
+        WHERE
+            person.id = p_person_id
+        ON CONFLICT (person_id) DO UPDATE SET
+            uuid = EXCLUDED.uuid,
+            url_slug = EXCLUDED.url_slug,
+            name = EXCLUDED.name,
+            date_of_birth = EXCLUDED.date_of_birth,
+            show_my_age = EXCLUDED.show_my_age,
+            verification_level_id = EXCLUDED.verification_level_id,
+            privacy_verification_level_id = EXCLUDED.privacy_verification_level_id,
+            profile_photo_uuid = EXCLUDED.profile_photo_uuid,
+            profile_photo_blurhash = EXCLUDED.profile_photo_blurhash
+        RETURNING
+            1
+    )
+    SELECT COUNT(*) FROM upserted;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION trigger_fn_refresh_prospect_card_on_person()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF
+        TG_OP = 'INSERT' OR
+        OLD.uuid IS DISTINCT FROM NEW.uuid OR
+        OLD.url_slug IS DISTINCT FROM NEW.url_slug OR
+        OLD.name IS DISTINCT FROM NEW.name OR
+        OLD.date_of_birth IS DISTINCT FROM NEW.date_of_birth OR
+        OLD.show_my_age IS DISTINCT FROM NEW.show_my_age OR
+        OLD.verification_level_id IS DISTINCT FROM NEW.verification_level_id OR
+        OLD.privacy_verification_level_id IS DISTINCT FROM NEW.privacy_verification_level_id
+    THEN
+        PERFORM refresh_prospect_card(NEW.id);
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER
+    trigger_refresh_prospect_card_on_person
+AFTER INSERT OR UPDATE OF
+    uuid,
+    url_slug,
+    name,
+    date_of_birth,
+    show_my_age,
+    verification_level_id,
+    privacy_verification_level_id
+ON
+    person
+FOR EACH ROW EXECUTE FUNCTION
+    trigger_fn_refresh_prospect_card_on_person();
+
+CREATE OR REPLACE FUNCTION trigger_fn_refresh_prospect_card_on_photo()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM refresh_prospect_card(OLD.person_id);
+        RETURN OLD;
+    ELSE
+        PERFORM refresh_prospect_card(NEW.person_id);
+        RETURN NEW;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER
+    trigger_refresh_prospect_card_on_photo
+AFTER INSERT OR DELETE OR UPDATE OF
+    uuid,
+    blurhash,
+    position
+ON
+    photo
+FOR EACH ROW EXECUTE FUNCTION
+    trigger_fn_refresh_prospect_card_on_photo();
+
+SELECT
+    refresh_prospect_card(id)
+FROM
+    person
+WHERE
+    NOT EXISTS (SELECT 1 FROM prospect_card WHERE person_id = person.id);
+
+CREATE OR REPLACE FUNCTION trigger_fn_unwarm_search_cache()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE search_cache
+        SET warmed_at = NULL
+        WHERE searcher_person_id = OLD.person_id
+        AND warmed_at IS NOT NULL;
+
+        RETURN OLD;
+    END IF;
+
+    -- Searches upsert the club preference even when it's unchanged
+    IF TG_OP = 'INSERT' OR OLD IS DISTINCT FROM NEW THEN
+        UPDATE search_cache
+        SET warmed_at = NULL
+        WHERE searcher_person_id = NEW.person_id
+        AND warmed_at IS NOT NULL;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    preference_table TEXT;
+BEGIN
+    FOREACH preference_table IN ARRAY ARRAY[
+        'search_preference_answer',
+        'search_preference_gender',
+        'search_preference_orientation',
+        'search_preference_ethnicity',
+        'search_preference_age',
+        'search_preference_distance',
+        'search_preference_height_cm',
+        'search_preference_has_profile_picture',
+        'search_preference_looking_for',
+        'search_preference_smoking',
+        'search_preference_drinking',
+        'search_preference_drugs',
+        'search_preference_long_distance',
+        'search_preference_relationship_status',
+        'search_preference_has_kids',
+        'search_preference_wants_kids',
+        'search_preference_exercise',
+        'search_preference_religion',
+        'search_preference_star_sign',
+        'search_preference_club',
+        'search_preference_messaged',
+        'search_preference_skipped'
+    ]
+    LOOP
+        EXECUTE format(
+            'CREATE OR REPLACE TRIGGER trigger_unwarm_search_cache '
+            'AFTER INSERT OR DELETE OR UPDATE ON %I '
+            'FOR EACH ROW EXECUTE FUNCTION trigger_fn_unwarm_search_cache()',
+            preference_table
+        );
+    END LOOP;
+END $$;
@@ -7,6 +7,13 @@ import duotypes as t
 import json
 import secrets
 import sessioncache
+from chatauthcache import (
+    invalidate_gold,
+    invalidate_person,
+    invalidate_public,
+    invalidate_skipped,
+)
+from chatratelimit import forget_report
 from duohash import sha512
 from PIL import Image
 import io
@@ -963,6 +970,10 @@ def post_unskip(s: t.SessionInfo, prospect_person_id: int) -> None:
     with api_tx() as tx:
         tx.execute(Q_DELETE_SKIPPED, params)
 
+    if s.person_id is not None:
+        invalidate_skipped(s.person_id, prospect_person_id)
+        forget_report(prospect_person_id, s.person_id)
+
 def post_unskip_by_uuid(s: t.SessionInfo, prospect_uuid: str) -> None:
     params = dict(
         subject_person_id=s.person_id,
@@ -970,7 +981,12 @@ def post_unskip_by_uuid(s: t.SessionInfo, prospect_uuid: str) -> None:
     )
 
     with api_tx() as tx:
-        tx.execute(Q_DELETE_SKIPPED_BY_UUID, params)
+        rows = tx.execute(Q_DELETE_SKIPPED_BY_UUID, params).fetchall()
+
+    if s.person_id is not None:
+        for row in rows:
+            invalidate_skipped(s.person_id, row['object_person_id'])
+            forget_report(row['object_person_id'], s.person_id)
 
 def get_compare_personalities(
     s: t.SessionInfo,
@@ -1088,6 +1104,15 @@ def delete_or_ban_account(
     for session_token_hash in session_token_hashes:
         sessioncache.delete_session(session_token_hash)
 
+    invalidate_person(
+        person_ids=person_ids,
+        usernames=[
+            str(r['person_uuid'])
+            for r in rows
+            if r['person_uuid'] is not None
+        ],
+    )
+
     return rows
 
 def post_deactivate(s: t.SessionInfo) -> None:
@@ -1647,6 +1672,9 @@ def patch_profile_info(req: t.PatchProfileInfo, s: t.SessionInfo) -> object:
         if q1: tx.execute(q1, params)
         if q2: tx.execute(q2, params)
 
+    if field_name == 'public_profile' and s.person_id is not None:
+        invalidate_public(s.person_id)
+
     if uuid and base64_file and crop_size:
         try:
             put_image_in_object_store(uuid, base64_file, crop_size)
@@ -2421,11 +2449,13 @@ def post_revenuecat(req: t.PostRevenuecat) -> object:
         updated_uuids = set(str(x['person_uuid']) for x in fetchall_sets(tx))
         ignored_uuids = all_uuids - updated_uuids
 
-        return dict(
-            all_uuids=sorted(all_uuids),
-            updated_uuids=sorted(updated_uuids),
-            ignored_uuids=sorted(ignored_uuids),
-        )
+    invalidate_gold(updated_uuids)
+
+    return dict(
+        all_uuids=sorted(all_uuids),
+        updated_uuids=sorted(updated_uuids),
+        ignored_uuids=sorted(ignored_uuids),
+    )
 
 def get_visitors(s: t.SessionInfo) -> object:
     with api_tx('READ COMMITTED') as tx:
@@ -1226,6 +1226,8 @@ AND
     person.uuid = uuid_or_null(%(prospect_uuid)s)
 AND
     subject_person_id = %(subject_person_id)s
+RETURNING
+    skipped.object_person_id
 """
 
 Q_ANSWER_COMPARISON = """
@@ -1479,6 +1481,20 @@ Q_DELETE_ACCOUNT = """
 WITH deleted_inbox AS (
     DELETE FROM inbox
     WHERE luser = %(person_uuid)s
+    RETURNING remote_bare_jid
+), touched_inbox AS (
+    -- The other side of each conversation, so that incremental inbox queries
+    -- send it again
+    UPDATE
+        inbox
+    SET
+        relation_changed_at = NOW()
+    FROM
+        deleted_inbox
+    WHERE
+        inbox.luser = split_part(deleted_inbox.remote_bare_jid, '@', 1)
+    AND
+        split_part(inbox.remote_bare_jid, '@', 1) = %(person_uuid)s::TEXT
 ), deleted_mam_message AS (
     DELETE FROM mam_message
     WHERE person_id = %(person_id)s
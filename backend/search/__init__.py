@@ -1,46 +1,129 @@
 import json
+import os
 import psycopg
+import threading
+import time
+import traceback
 import duotypes as t
 import sessioncache
 from qanda import personality
+from search import personalityindex, publicindex, quizrank
 from pydantic import ValidationError
-from database import Tx, api_tx, row_int
+from database import Tx, api_tx, require_row, row_int
 from qanda.question import Q_QUESTION_SCORE_VECTORS
 from rediscache import redis_cache
 from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal, Tuple
 from search.sql import (
     Q_CACHED_SEARCH,
+    Q_EXTEND_UNCACHED_SEARCH_2,
+    Q_EXTEND_UNCACHED_SEARCH_2_FROM_INDEX,
     Q_PUBLIC_SEARCH,
     Q_PUBLIC_SEARCH_WITH_ANSWERS,
     Q_QUIZ_SEARCH,
+    Q_SEARCH_CACHE_UPDATED_AT,
     Q_SEARCH_PREFERENCE,
-    Q_UNCACHED_SEARCH_1,
+    Q_TAKE_WARM_SEARCH_CACHE,
     Q_UNCACHED_SEARCH_2,
+    Q_UNCACHED_SEARCH_2_FROM_INDEX,
     Q_FEED,
+    Q_PARTIAL_UNCACHED_SEARCH_2,
 )
 from dataclasses import dataclass
 from datetime import datetime
 
 
+# How long a search request's statements may take, in all
+SEARCH_TIMEOUT_MS = 10000 # 10 seconds
+
+# How long an uncached search may take before its first page is served from
+# partial results instead
+SEARCH_TIME_BUDGET_MS = int(os.environ.get(
+    'DUO_SEARCH_TIME_BUDGET_MS',
+    str(6000),
+))
+
+# How many of the best candidates by personality the partial results are
+# chosen from. Searches left to Postgres choose from this many of the nearest
+# people instead.
+SEARCH_PARTIAL_CANDIDATES = int(os.environ.get(
+    'DUO_SEARCH_PARTIAL_CANDIDATES',
+    str(1000),
+))
+
+# How long the search which completes partial results may take
+SEARCH_BACKGROUND_TIMEOUT_MS = int(os.environ.get(
+    'DUO_SEARCH_BACKGROUND_TIMEOUT_MS',
+    str(60000),
+))
+
+# How old a search which the cron service warmed ahead of the searcher's visit
+# can be and still be served as their first page. Warmed searches are dropped
+# when the searcher changes, but not when the people they were chosen from do,
+# so this also bounds how long new, changed or departed prospects can go
+# unnoticed on a first page.
+SEARCH_WARM_MAX_AGE_SECONDS = int(os.environ.get(
+    'DUO_SEARCH_WARM_MAX_AGE_SECONDS',
+    str(12 * 60 * 60), # 12 hours
+))
+
+_background_search_executor = ThreadPoolExecutor(max_workers=1)
+
+# Searchers whose partial results are being extended. Each gets one background
+# search at a time.
+_extending_searcher_ids: set[int] = set()
+
+_degraded_search_lock = threading.Lock()
+
+# Uncached searches which ran out of time, and those of them whose partial
+# results ran out of time too, since the worker started. See `search_stats`.
+_degraded_search_count = 0
+
+_failed_degraded_search_count = 0
+
+
 @dataclass
 class ClubHttpArg:
     club: str | None
 
 
 def _quiz_search_results(tx: Tx, searcher_person_id: int) -> object:
+    best_prospect = quizrank.quiz_search(tx, searcher_person_id)
+
+    if best_prospect is None:
+        return []
+
     params = dict(
         searcher_person_id=searcher_person_id,
+        prospect_person_id=best_prospect.prospect_person_id,
+        match_percentage=best_prospect.match_percentage,
     )
 
     return tx.execute(Q_QUIZ_SEARCH, params).fetchall()
 
 
+def search_stats() -> dict[str, int]:
+    return dict(
+        degraded_searches=_degraded_search_count,
+        failed_degraded_searches=_failed_degraded_search_count,
+    )
+
+
+def _set_statement_timeout(tx: Tx, deadline: float) -> None:
+    """Limits each statement to the time left until `deadline`"""
+    milliseconds_left = int((deadline - time.monotonic()) * 1000)
+
+    # A timeout of zero would disable the limit
+    tx.execute(f'SET LOCAL statement_timeout = {max(1, milliseconds_left)}')
+
+
 def _uncached_search_results(
     tx: Tx,
     searcher_person_id: int,
     no: Tuple[int, int],
     gender_preference: list[int],
+    deadline: float,
 ) -> object:
     n, o = no
 
@@ -51,15 +134,148 @@ def _uncached_search_results(
         gender_preference=gender_preference,
     )
 
+    warm_search = tx.execute(
+        Q_TAKE_WARM_SEARCH_CACHE,
+        params | dict(max_age_seconds=SEARCH_WARM_MAX_AGE_SECONDS),
+    ).fetchone()
+
+    if warm_search is not None:
+        return tx.execute(Q_CACHED_SEARCH, params).fetchall()
+
+    candidates: personalityindex.Candidates | None = None
+
     try:
-        tx.execute(Q_UNCACHED_SEARCH_1, params)
-        tx.execute(Q_UNCACHED_SEARCH_2, params)
-        tx.execute(Q_CACHED_SEARCH, params)
-        return tx.fetchall()
+        # `SET LOCAL` in a savepoint is undone if the savepoint is rolled back,
+        # but outlives it if it's released, so the request's deadline is
+        # restored below
+        with tx.connection.transaction():
+            _set_statement_timeout(
+                tx,
+                min(deadline, time.monotonic() + SEARCH_TIME_BUDGET_MS / 1000))
+
+            candidates = personalityindex.candidates(
+                tx=tx,
+                searcher_person_id=searcher_person_id,
+                gender_preference=gender_preference)
+
+            if candidates is None:
+                tx.execute(Q_UNCACHED_SEARCH_2, params)
+            else:
+                tx.execute(
+                    Q_UNCACHED_SEARCH_2_FROM_INDEX,
+                    params | dict(prospect_ids=candidates.ids))
     except psycopg.errors.QueryCanceled:
         # The query probably timed-out because it was too specific
+        return _degraded_search_results(
+            tx=tx,
+            searcher_person_id=searcher_person_id,
+            params=params,
+            candidates=candidates,
+            deadline=deadline)
+
+    _set_statement_timeout(tx, deadline)
+
+    return tx.execute(Q_CACHED_SEARCH, params).fetchall()
+
+
+def _degraded_search_results(
+    tx: Tx,
+    searcher_person_id: int,
+    params: dict[str, object],
+    candidates: personalityindex.Candidates | None,
+    deadline: float,
+) -> object:
+    """
+    Serves the first page of a search which ran out of time from the best few
+    candidates by personality, then has the full search append the rest to
+    `search_cache` in the background. Searches left to Postgres have no
+    candidates to choose from, so they're ranked the same way as the full
+    search, but only among the nearest few people. Either way, the partial
+    search gets whatever's left of the request's time.
+    """
+    global _degraded_search_count, _failed_degraded_search_count
+
+    with _degraded_search_lock:
+        _degraded_search_count += 1
+
+    tier = 'postgres' if candidates is None else candidates.tier
+
+    try:
+        with tx.connection.transaction():
+            _set_statement_timeout(tx, deadline)
+
+            if candidates is None:
+                tx.execute(
+                    Q_PARTIAL_UNCACHED_SEARCH_2,
+                    params | dict(nearest=SEARCH_PARTIAL_CANDIDATES))
+            else:
+                tx.execute(
+                    Q_UNCACHED_SEARCH_2_FROM_INDEX,
+                    params | dict(
+                        prospect_ids=
+                            candidates.ids[:SEARCH_PARTIAL_CANDIDATES]))
+    except psycopg.errors.QueryCanceled:
+        with _degraded_search_lock:
+            _failed_degraded_search_count += 1
+
+        print(
+            f'Uncached search for person {searcher_person_id} timed out, even '
+            f'with partial results (tier: {tier})'
+        )
         return []
 
+    partial_updated_at = require_row(
+        tx.execute(Q_SEARCH_CACHE_UPDATED_AT, params).fetchone()
+    )['updated_at']
+
+    result = tx.execute(Q_CACHED_SEARCH, params).fetchall()
+
+    print(
+        f'Uncached search for person {searcher_person_id} timed out; served '
+        f'{len(result)} partial results (tier: {tier})'
+    )
+
+    with _degraded_search_lock:
+        is_extending = searcher_person_id in _extending_searcher_ids
+        _extending_searcher_ids.add(searcher_person_id)
+
+    if not is_extending:
+        _background_search_executor.submit(
+            _extend_search_results,
+            searcher_person_id=searcher_person_id,
+            params=params | dict(partial_updated_at=partial_updated_at),
+            prospect_ids=None if candidates is None else candidates.ids,
+        )
+
+    return result
+
+
+def _extend_search_results(
+    searcher_person_id: int,
+    params: dict[str, object],
+    prospect_ids: list[int] | None,
+) -> None:
+    """
+    Runs a search which timed out again, with more time, appending whatever
+    the partial results missed
+    """
+    try:
+        with api_tx('READ COMMITTED') as tx:
+            tx.execute(
+                f'SET LOCAL statement_timeout = {SEARCH_BACKGROUND_TIMEOUT_MS}')
+
+            if prospect_ids is None:
+                tx.execute(Q_EXTEND_UNCACHED_SEARCH_2, params)
+            else:
+                tx.execute(
+                    Q_EXTEND_UNCACHED_SEARCH_2_FROM_INDEX,
+                    params | dict(prospect_ids=prospect_ids))
+    except:
+        print(traceback.format_exc())
+    finally:
+        with _degraded_search_lock:
+            _extending_searcher_ids.discard(searcher_person_id)
+
 
 def _cached_search_results(tx: Tx, searcher_person_id: int, no: Tuple[int, int]) -> object:
     n, o = no
@@ -115,8 +331,10 @@ def get_search(
         do_modify=club is not None,
     )
 
+    deadline = time.monotonic() + SEARCH_TIMEOUT_MS / 1000
+
     with api_tx('READ COMMITTED') as tx:
-        tx.execute('SET LOCAL statement_timeout = 10000') # 10 seconds
+        tx.execute(f'SET LOCAL statement_timeout = {SEARCH_TIMEOUT_MS}')
 
         rows = tx.execute(Q_SEARCH_PREFERENCE, params).fetchall()
 
@@ -135,7 +353,8 @@ def get_search(
                 tx=tx,
                 searcher_person_id=s.person_id,
                 no=no,
-                gender_preference=gender_preference)
+                gender_preference=gender_preference,
+                deadline=deadline)
 
         elif search_type == 'cached-search':
             if no is None:
@@ -190,6 +409,18 @@ def _get_public_search() -> Sequence[object]:
 
 
 def _get_public_search_with_answers(req: t.PublicSearchRequest) -> object:
+    if publicindex.PUBLIC_SEARCH_INDEX:
+        try:
+            return publicindex.get().search(req.answers, n=req.n, o=req.o)
+        except:
+            print(traceback.format_exc())
+
+    return _get_public_search_with_answers_from_db(req)
+
+
+def _get_public_search_with_answers_from_db(
+    req: t.PublicSearchRequest,
+) -> object:
     with api_tx('READ COMMITTED') as tx:
         questions = {
             row_int(q, 'id'): q
@@ -223,7 +454,6 @@ def get_feed(s: t.SessionInfo, before: datetime) -> object:
 
     with api_tx('READ COMMITTED') as tx:
         tx.execute('SET LOCAL jit = off')
-        tx.execute("SET LOCAL work_mem = '32MB'")
 
         rows = tx.execute(Q_FEED, params).fetchall()
 
@@ -0,0 +1,474 @@
+"""
+An in-memory index of every searchable person's personality vector.
+
+`Q_UNCACHED_SEARCH_2` has Postgres compute `personality <#> ...` for every
+prospect in range of the searcher before it can keep the best 10,000. Instead,
+each API worker keeps the personality vectors in a float32 matrix, alongside
+each person's gender and location. A search masks out the rows which don't meet
+the searcher's gender and distance preferences, ranks the rest with one
+matrix-vector product and `argpartition`, and hands Postgres the ids of the
+best candidates to filter and hydrate (see `Q_UNCACHED_SEARCH_2_FROM_INDEX`).
+
+`person.search_index_time` is touched by a trigger whenever a column the index
+reads changes, so searches keep the index fresh by pulling in whatever changed
+since the last refresh. Deleted people are never reported as changes; they're
+dropped when the index is periodically rebuilt in the background. Until then,
+they're filtered out by Postgres like anyone else who no longer qualifies.
+
+Searchers in dense cities, and those who'll date anyone anywhere, can have
+hundreds of thousands of people in range. So the search is tiered: it widens
+through rings of `SEARCH_TIERS_METERS` around the searcher and stops at the
+first which holds `TIER_CANDIDATES` people of the right gender, ranking only
+those. Only when no ring does is everyone in range of the searcher's distance
+preference ranked. Which tier answered is reported with the candidates.
+
+Club searches are left to Postgres because club membership isn't indexed.
+"""
+
+import math
+import os
+import threading
+import time
+import traceback
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import TypeVar
+import numpy
+import numpy.typing as npt
+from database import Tx, api_tx
+from search.sql import (
+    Q_PERSONALITY_INDEX,
+    Q_PERSONALITY_INDEX_NOW,
+    Q_PERSONALITY_INDEX_SEARCHER,
+)
+
+
+PERSONALITY_INDEX = os.environ.get(
+    'DUO_SEARCH_PERSONALITY_INDEX',
+    'true',
+).lower() not in ['false', 'f', '0', 'no']
+
+# The longest a search waits before pulling recent changes into the index
+PERSONALITY_INDEX_REFRESH_SECONDS = float(os.environ.get(
+    'DUO_SEARCH_PERSONALITY_INDEX_REFRESH_SECONDS',
+    str(5),
+))
+
+PERSONALITY_INDEX_REBUILD_SECONDS = float(os.environ.get(
+    'DUO_SEARCH_PERSONALITY_INDEX_REBUILD_SECONDS',
+    str(60 * 60), # 1 hour
+))
+
+# Matches the number of candidates `Q_UNCACHED_SEARCH_2` ranks by personality
+CANDIDATE_LIMIT = 10000
+
+# How many people a tier needs to hold for the search to stop widening. Enough
+# that the best `CANDIDATE_LIMIT` of them still leave Postgres plenty to filter.
+TIER_CANDIDATES = int(os.environ.get(
+    'DUO_SEARCH_PERSONALITY_INDEX_TIER_CANDIDATES',
+    str(4 * CANDIDATE_LIMIT),
+))
+
+SEARCH_TIERS_METERS = (
+    10_000,
+    50_000,
+    250_000,
+    1_000_000,
+    5_000_000,
+)
+
+# The tier reported when the whole of the searcher's distance preference was
+# ranked
+PREFERENCE_TIER = 'preference'
+
+PERSONALITY_DIMENSIONS = 47
+
+# `search_index_time` is set when an update runs rather than when it commits,
+# so each refresh re-reads the changes from shortly before the previous one
+_REFRESH_OVERLAP = timedelta(seconds=30)
+
+_PAGE_SIZE = 10000
+
+_INITIAL_CAPACITY = 1024
+
+_EARTH_RADIUS_METERS = 6371008.8
+
+# ST_DWithin measures distances on the spheroid whereas the index measures
+# them on a sphere, which can be out by about half a percent. The index
+# over-fetches a little and leaves Postgres to make the exact cut.
+_DISTANCE_SLACK = 1.01
+
+
+ScalarT = TypeVar('ScalarT', bound=numpy.generic)
+
+
+@dataclass(frozen=True)
+class IndexedPerson:
+    id: int
+    gender_id: int
+    # Activated and not shadow-banned
+    searchable: bool
+    latitude: float
+    longitude: float
+    personality: Sequence[float]
+
+
+@dataclass(frozen=True)
+class Searcher:
+    personality: Sequence[float]
+    latitude: float
+    longitude: float
+    distance_preference: float
+    gender_preference: Sequence[int]
+
+
+@dataclass(frozen=True)
+class Candidates:
+    ids: list[int]
+    # `PREFERENCE_TIER`, or the radius of the ring which held enough people,
+    # such as '50km'
+    tier: str
+
+
+def _tier_name(meters: int) -> str:
+    return f'{meters // 1000}km'
+
+
+def _unit_vectors(
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+) -> npt.NDArray[numpy.float64]:
+    """
+    Points on the unit sphere, one per column. The dot product of two of them
+    is the cosine of the angle between them, so a distance check needs no
+    trigonometry per person.
+    """
+    lat = numpy.radians(numpy.asarray(latitudes, dtype=numpy.float64))
+    lon = numpy.radians(numpy.asarray(longitudes, dtype=numpy.float64))
+
+    return numpy.stack((
+        numpy.cos(lat) * numpy.cos(lon),
+        numpy.cos(lat) * numpy.sin(lon),
+        numpy.sin(lat),
+    ))
+
+
+def _grown(a: npt.NDArray[ScalarT], capacity: int) -> npt.NDArray[ScalarT]:
+    """`a` with its last axis extended to `capacity`"""
+    b = numpy.zeros_like(a, shape=(*a.shape[:-1], capacity))
+    b[..., :a.shape[-1]] = a
+    return b
+
+
+class PersonalityIndex:
+    def __init__(self, capacity: int = _INITIAL_CAPACITY) -> None:
+        self._lock = threading.Lock()
+
+        self._row_by_id: dict[int, int] = {}
+        self._size = 0
+
+        # One column per person. Scoring everyone against a searcher's vector
+        # is then a pass over contiguous rows, which is a few times faster
+        # than a pass over one short row per person.
+        self._ids = numpy.zeros(capacity, dtype=numpy.int64)
+        self._gender_ids = numpy.zeros(capacity, dtype=numpy.int16)
+        self._searchable = numpy.zeros(capacity, dtype=numpy.bool_)
+        self._positions = numpy.zeros((3, capacity), dtype=numpy.float64)
+        self._personalities = numpy.zeros(
+            (PERSONALITY_DIMENSIONS, capacity),
+            dtype=numpy.float32,
+        )
+
+        # The `search_index_time` after which changes haven't been read yet.
+        # None until everyone has been loaded once.
+        self._since: datetime | None = None
+
+        self.refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(numpy.count_nonzero(self._searchable[:self._size]))
+
+    def _grow(self, capacity: int) -> None:
+        self._ids = _grown(self._ids, capacity)
+        self._gender_ids = _grown(self._gender_ids, capacity)
+        self._searchable = _grown(self._searchable, capacity)
+        self._positions = _grown(self._positions, capacity)
+        self._personalities = _grown(self._personalities, capacity)
+
+    def upsert(self, people: Sequence[IndexedPerson]) -> None:
+        if not people:
+            return
+
+        with self._lock:
+            rows = []
+            for person in people:
+                row = self._row_by_id.get(person.id)
+                if row is None:
+                    row = self._size
+                    self._row_by_id[person.id] = row
+                    self._size += 1
+                rows.append(row)
+
+            if self._size > len(self._ids):
+                self._grow(max(self._size, 2 * len(self._ids)))
+
+            self._ids[rows] = [p.id for p in people]
+            self._gender_ids[rows] = [p.gender_id for p in people]
+            self._searchable[rows] = [p.searchable for p in people]
+            self._positions[:, rows] = _unit_vectors(
+                [p.latitude for p in people],
+                [p.longitude for p in people],
+            )
+            self._personalities[:, rows] = numpy.asarray(
+                [p.personality for p in people],
+                dtype=numpy.float32,
+            ).T
+
+    def candidates(
+        self,
+        searcher: Searcher,
+        limit: int = CANDIDATE_LIMIT,
+    ) -> list[int]:
+        """
+        The ids of up to `limit` searchable people who meet the searcher's
+        gender and distance preferences, best personality match first.
+        """
+        return self.search(searcher, limit).ids
+
+    def search(
+        self,
+        searcher: Searcher,
+        limit: int = CANDIDATE_LIMIT,
+        tier_candidates: int = TIER_CANDIDATES,
+    ) -> Candidates:
+        """
+        `candidates`, along with the tier they came from. The people ranked
+        are those in the smallest of `SEARCH_TIERS_METERS` which holds at least
+        `tier_candidates` of them, or everyone in range if none does.
+        """
+        personality = numpy.asarray(searcher.personality, dtype=numpy.float32)
+
+        max_angle = (
+            searcher.distance_preference * _DISTANCE_SLACK
+            / _EARTH_RADIUS_METERS)
+
+        tier_angles = [
+            (_tier_name(meters), meters * _DISTANCE_SLACK / _EARTH_RADIUS_METERS)
+            for meters in SEARCH_TIERS_METERS
+            if meters < searcher.distance_preference
+        ]
+
+        tier = PREFERENCE_TIER
+
+        with self._lock:
+            size = self._size
+
+            # There's only a handful of genders, and comparing against each is
+            # much faster than `numpy.isin`
+            mask = numpy.zeros(size, dtype=numpy.bool_)
+            for gender_id in set(searcher.gender_preference):
+                mask |= self._gender_ids[:size] == gender_id
+
+            mask &= self._searchable[:size]
+
+            if max_angle < math.pi or tier_angles:
+                position = _unit_vectors(
+                    [searcher.latitude],
+                    [searcher.longitude],
+                )[:, 0]
+                cosines = position @ self._positions[:, :size]
+
+            if max_angle < math.pi:
+                mask &= cosines >= math.cos(max_angle)
+
+            rows = numpy.flatnonzero(mask)
+
+            if tier_angles and len(rows) >= tier_candidates:
+                row_cosines = cosines[rows]
+
+                for name, angle in tier_angles:
+                    within = row_cosines >= math.cos(angle)
+
+                    if numpy.count_nonzero(within) >= tier_candidates:
+                        rows = rows[within]
+                        tier = name
+                        break
+
+            # `<#>` is the negative inner product, so the best matches have the
+            # largest scores here. Gathering the columns of a few candidates
+            # is cheaper than scoring everyone, but gathering most of them
+            # isn't.
+            if len(rows) < size // 4:
+                scores = personality @ self._personalities[:, rows]
+            else:
+                scores = (personality @ self._personalities[:, :size])[rows]
+
+            ids = self._ids[rows]
+
+        if len(scores) > limit:
+            best: npt.NDArray[numpy.intp] = numpy.argpartition(-scores, limit - 1)[:limit]
+        else:
+            best = numpy.arange(len(scores))
+
+        best = best[numpy.argsort(-scores[best], kind='stable')]
+
+        return Candidates(ids=[int(i) for i in ids[best]], tier=tier)
+
+    def refresh(self, tx: Tx) -> None:
+        """
+        Reads the people who changed since the last refresh, or everyone who's
+        searchable if this is the first.
+        """
+        now = tx.execute(Q_PERSONALITY_INDEX_NOW).fetchone()
+        if now is None:
+            raise RuntimeError('Expected the database time')
+
+        for people in _fetch_people(tx, self._since):
+            self.upsert(people)
+
+        self._since = now['now'] - _REFRESH_OVERLAP
+        self.refreshed_at = time.monotonic()
+
+
+def _fetch_people(
+    tx: Tx,
+    since: datetime | None,
+) -> Iterator[list[IndexedPerson]]:
+    after_id = 0
+
+    while True:
+        rows = tx.execute(Q_PERSONALITY_INDEX, dict(
+            after_id=after_id,
+            since=since,
+            limit=_PAGE_SIZE,
+        )).fetchall()
+
+        if not rows:
+            return
+
+        yield [
+            IndexedPerson(
+                id=row['id'],
+                gender_id=row['gender_id'],
+                searchable=row['searchable'],
+                latitude=row['latitude'],
+                longitude=row['longitude'],
+                personality=row['personality'],
+            )
+            for row in rows
+        ]
+
+        after_id = rows[-1]['id']
+
+
+def build() -> PersonalityIndex:
+    index = PersonalityIndex()
+
+    with api_tx('READ COMMITTED') as tx:
+        index.refresh(tx)
+
+    return index
+
+
+_index: PersonalityIndex | None = None
+_refresh_lock = threading.Lock()
+_start_lock = threading.Lock()
+_is_started = False
+
+
+def _build_forever() -> None:
+    global _index
+
+    while True:
+        try:
+            start = time.perf_counter()
+            index = build()
+            _index = index
+            print(
+                f'Built personality index of {len(index)} people in '
+                f'{time.perf_counter() - start:.1f}s'
+            )
+        except:
+            print(traceback.format_exc())
+
+        time.sleep(PERSONALITY_INDEX_REBUILD_SECONDS)
+
+
+def _start() -> None:
+    global _is_started
+
+    with _start_lock:
+        if _is_started:
+            return
+
+        threading.Thread(target=_build_forever, daemon=True).start()
+
+        _is_started = True
+
+
+def _maybe_refresh(tx: Tx, index: PersonalityIndex) -> None:
+    if time.monotonic() - index.refreshed_at < PERSONALITY_INDEX_REFRESH_SECONDS:
+        return
+
+    # Another request is already refreshing the index; one refresh is enough
+    if not _refresh_lock.acquire(blocking=False):
+        return
+
+    try:
+        index.refresh(tx)
+    finally:
+        _refresh_lock.release()
+
+
+def is_ready() -> bool:
+    """
+    Whether `candidates` answers from the index, as opposed to leaving every
+    search to Postgres because the index hasn't been built yet. Starts
+    building it if need be.
+    """
+    if not PERSONALITY_INDEX:
+        return True
+
+    _start()
+
+    return _index is not None
+
+
+def candidates(
+    tx: Tx,
+    searcher_person_id: int,
+    gender_preference: Sequence[int],
+) -> Candidates | None:
+    """
+    The best candidates for the searcher by personality, or None if the search
+    should be left to Postgres.
+    """
+    if not PERSONALITY_INDEX:
+        return None
+
+    _start()
+
+    index = _index
+
+    if index is None:
+        return None
+
+    row = tx.execute(
+        Q_PERSONALITY_INDEX_SEARCHER,
+        dict(searcher_person_id=searcher_person_id),
+    ).fetchone()
+
+    if row is None or row['has_club_preference']:
+        return None
+
+    _maybe_refresh(tx, index)
+
+    return index.search(Searcher(
+        personality=row['personality'],
+        latitude=row['latitude'],
+        longitude=row['longitude'],
+        distance_preference=row['distance_preference'],
+        gender_preference=gender_preference,
+    ))
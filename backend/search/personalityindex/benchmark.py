@@ -0,0 +1,166 @@
+"""
+Compares uncached searches whose candidates come from the personality index
+against searches ranked by Postgres alone, for a random sample of searchers.
+Reports the share of Postgres' results which the index-backed search also
+returned (recall) and the latency of each. Each search is rolled back, so
+`search_cache` is left as it was:
+
+    python3 -m search.personalityindex.benchmark [searchers]
+"""
+
+import sys
+import time
+from collections.abc import Callable
+import numpy
+import psycopg
+from database import Tx, api_tx
+from search.personalityindex import PersonalityIndex, Searcher
+from search.sql import (
+    Q_PERSONALITY_INDEX_SEARCHER,
+    Q_UNCACHED_SEARCH_2,
+    Q_UNCACHED_SEARCH_2_FROM_INDEX,
+)
+
+
+Q_SEARCHERS = """
+SELECT
+    id
+FROM
+    person
+WHERE
+    activated
+ORDER BY
+    random()
+LIMIT
+    %(limit)s
+"""
+
+
+Q_GENDER_PREFERENCE = """
+SELECT
+    gender_id
+FROM
+    search_preference_gender
+WHERE
+    person_id = %(searcher_person_id)s
+"""
+
+
+Q_RESULTS = """
+SELECT
+    prospect_person_ids
+FROM
+    search_cache
+WHERE
+    searcher_person_id = %(searcher_person_id)s
+"""
+
+
+def _search(
+    tx: Tx,
+    searcher_person_id: int,
+    run: Callable[[], None],
+) -> tuple[float, list[int]]:
+    with tx.connection.transaction():
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+
+        row = tx.execute(Q_RESULTS, dict(
+            searcher_person_id=searcher_person_id)).fetchone()
+        results = [] if row is None else row['prospect_person_ids']
+
+        raise psycopg.Rollback()
+
+    return elapsed, results
+
+
+def _milliseconds(seconds: list[float]) -> str:
+    p50, p95, p99 = numpy.percentile(seconds, [50, 95, 99]) * 1000
+    return f'p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms'
+
+
+def main() -> None:
+    num_searchers = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    sql_seconds: list[float] = []
+    index_seconds: list[float] = []
+    recalls: list[float] = []
+
+    with api_tx('READ COMMITTED') as tx:
+        tx.execute('SET LOCAL statement_timeout = 0')
+
+        start = time.perf_counter()
+        index = PersonalityIndex()
+        index.refresh(tx)
+        print(
+            f'Indexed {len(index)} people in '
+            f'{time.perf_counter() - start:.1f}s'
+        )
+
+        searcher_person_ids = [
+            row['id']
+            for row in tx.execute(
+                Q_SEARCHERS, dict(limit=num_searchers)).fetchall()
+        ]
+
+        for searcher_person_id in searcher_person_ids:
+            params = dict(searcher_person_id=searcher_person_id)
+
+            gender_preference = [
+                row['gender_id']
+                for row in tx.execute(Q_GENDER_PREFERENCE, params).fetchall()
+            ]
+
+            row = tx.execute(Q_PERSONALITY_INDEX_SEARCHER, params).fetchone()
+
+            # Club searches don't use the index
+            if row is None or row['has_club_preference']:
+                continue
+
+            params |= dict(gender_preference=gender_preference)
+
+            def search_with_sql() -> None:
+                tx.execute(Q_UNCACHED_SEARCH_2, params)
+
+            def search_with_index() -> None:
+                prospect_ids = index.candidates(Searcher(
+                    personality=row['personality'],
+                    latitude=row['latitude'],
+                    longitude=row['longitude'],
+                    distance_preference=row['distance_preference'],
+                    gender_preference=gender_preference,
+                ))
+
+                tx.execute(
+                    Q_UNCACHED_SEARCH_2_FROM_INDEX,
+                    params | dict(prospect_ids=prospect_ids))
+
+            sql_elapsed, sql_results = _search(
+                tx, searcher_person_id, search_with_sql)
+            index_elapsed, index_results = _search(
+                tx, searcher_person_id, search_with_index)
+
+            sql_seconds.append(sql_elapsed)
+            index_seconds.append(index_elapsed)
+
+            if sql_results:
+                recalls.append(
+                    len(set(sql_results) & set(index_results))
+                    / len(sql_results))
+
+    if not sql_seconds:
+        raise Exception('The benchmark needs at least one non-club searcher')
+
+    print(f'{len(sql_seconds)} searches')
+    print(f'  postgres: {_milliseconds(sql_seconds)}')
+    print(f'  index:    {_milliseconds(index_seconds)}')
+    if recalls:
+        print(
+            f'  recall:   mean={numpy.mean(recalls):.3f} '
+            f'min={numpy.min(recalls):.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import unittest
+import numpy
+from search.personalityindex import (
+    PERSONALITY_DIMENSIONS,
+    PREFERENCE_TIER,
+    IndexedPerson,
+    PersonalityIndex,
+    Searcher,
+)
+
+
+def _personality(*leading: float) -> list[float]:
+    return [*leading] + [0.0] * (PERSONALITY_DIMENSIONS - len(leading))
+
+
+def _person(
+    id: int,
+    personality: list[float],
+    gender_id: int = 1,
+    searchable: bool = True,
+    latitude: float = -33.87,
+    longitude: float = 151.21,
+) -> IndexedPerson:
+    return IndexedPerson(
+        id=id,
+        gender_id=gender_id,
+        searchable=searchable,
+        latitude=latitude,
+        longitude=longitude,
+        personality=personality,
+    )
+
+
+def _searcher(
+    personality: list[float],
+    gender_preference: list[int] = [1, 2],
+    distance_preference: float = 1e9,
+) -> Searcher:
+    return Searcher(
+        personality=personality,
+        latitude=-33.87,
+        longitude=151.21,
+        distance_preference=distance_preference,
+        gender_preference=gender_preference,
+    )
+
+
+class TestPersonalityIndex(unittest.TestCase):
+    def test_ranks_by_inner_product(self) -> None:
+        index = PersonalityIndex()
+        index.upsert([
+            _person(1, _personality(0.1, 0.9)),
+            _person(2, _personality(0.9, 0.1)),
+            _person(3, _personality(0.5, 0.5)),
+        ])
+
+        self.assertEqual(
+            index.candidates(_searcher(_personality(1.0, 0.0))),
+            [2, 3, 1])
+
+        self.assertEqual(
+            index.candidates(_searcher(_personality(1.0, 0.0)), limit=2),
+            [2, 3])
+
+    def test_filters_by_gender_and_searchability(self) -> None:
+        index = PersonalityIndex()
+        index.upsert([
+            _person(1, _personality(1.0), gender_id=1),
+            _person(2, _personality(1.0), gender_id=2),
+            _person(3, _personality(1.0), gender_id=3),
+            _person(4, _personality(1.0), gender_id=1, searchable=False),
+        ])
+
+        self.assertEqual(
+            sorted(index.candidates(_searcher(_personality(1.0)))),
+            [1, 2])
+
+        self.assertEqual(
+            index.candidates(
+                _searcher(_personality(1.0), gender_preference=[3])),
+            [3])
+
+    def test_filters_by_distance(self) -> None:
+        index = PersonalityIndex()
+        index.upsert([
+            # Sydney
+            _person(1, _personality(1.0), latitude=-33.87, longitude=151.21),
+            # Parramatta, about 20 km away
+            _person(2, _personality(1.0), latitude=-33.82, longitude=151.00),
+            # Newcastle, about 120 km away
+            _person(3, _personality(1.0), latitude=-32.93, longitude=151.78),
+            # London
+            _person(4, _personality(1.0), latitude=51.51, longitude=-0.13),
+        ])
+
+        def within(distance: float) -> list[int]:
+            return sorted(index.candidates(_searcher(
+                _personality(1.0),
+                distance_preference=distance,
+            )))
+
+        self.assertEqual(within(10_000), [1])
+        self.assertEqual(within(50_000), [1, 2])
+        self.assertEqual(within(500_000), [1, 2, 3])
+        self.assertEqual(within(1e9), [1, 2, 3, 4])
+
+    def test_widens_through_tiers(self) -> None:
+        index = PersonalityIndex()
+        index.upsert([
+            # Sydney
+            _person(1, _personality(0.1), latitude=-33.87, longitude=151.21),
+            # Parramatta, about 20 km away
+            _person(2, _personality(0.2), latitude=-33.82, longitude=151.00),
+            # Newcastle, about 120 km away
+            _person(3, _personality(0.3), latitude=-32.93, longitude=151.78),
+            # London
+            _person(4, _personality(0.4), latitude=51.51, longitude=-0.13),
+            # Sydney, but of another gender
+            _person(5, _personality(0.5), gender_id=3),
+        ])
+
+        def search(
+            tier_candidates: int,
+            distance: float = 1e9,
+        ) -> tuple[str, list[int]]:
+            candidates = index.search(
+                _searcher(_personality(1.0), distance_preference=distance),
+                tier_candidates=tier_candidates,
+            )
+            return candidates.tier, candidates.ids
+
+        self.assertEqual(search(1), ('10km', [1]))
+        self.assertEqual(search(2), ('50km', [2, 1]))
+        self.assertEqual(search(3), ('250km', [3, 2, 1]))
+        self.assertEqual(search(4), (PREFERENCE_TIER, [4, 3, 2, 1]))
+
+        # Tiers as wide as the searcher's distance preference aren't used
+        self.assertEqual(search(2, distance=50_000), (PREFERENCE_TIER, [2, 1]))
+        self.assertEqual(search(3, distance=50_000), (PREFERENCE_TIER, [2, 1]))
+
+    def test_upsert_replaces_people_and_grows(self) -> None:
+        index = PersonalityIndex(capacity=2)
+        index.upsert([_person(i, _personality(i)) for i in range(1, 6)])
+
+        self.assertEqual(len(index), 5)
+
+        index.upsert([
+            _person(5, _personality(5.0), searchable=False),
+            _person(1, _personality(10.0)),
+        ])
+
+        self.assertEqual(len(index), 4)
+        self.assertEqual(
+            index.candidates(_searcher(_personality(1.0))),
+            [1, 4, 3, 2])
+
+    def test_matches_a_full_sort(self) -> None:
+        rng = numpy.random.default_rng(0)
+
+        personalities = rng.random((2000, PERSONALITY_DIMENSIONS))
+        genders = rng.integers(1, 4, size=2000)
+
+        index = PersonalityIndex()
+        index.upsert([
+            _person(
+                i,
+                personalities[i].tolist(),
+                gender_id=int(genders[i]),
+            )
+            for i in range(2000)
+        ])
+
+        for _ in range(10):
+            searcher_personality = rng.random(PERSONALITY_DIMENSIONS)
+
+            scores = personalities @ searcher_personality
+            expected = [
+                int(i)
+                for i in numpy.argsort(-scores)
+                if genders[i] in (1, 2)
+            ][:100]
+
+            candidates = index.candidates(
+                _searcher(searcher_personality.tolist()),
+                limit=100,
+            )
+
+            # The index works in float32, so near-ties may come out in either
+            # order
+            self.assertEqual(set(candidates), set(expected))
+            self.assertTrue(numpy.all(
+                numpy.diff(scores[candidates]) <= 1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
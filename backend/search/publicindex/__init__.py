@@ -0,0 +1,407 @@
+"""
+An index of the public profiles which `/public-search` ranks by an anonymous
+visitor's answers, shared by every API worker on a host.
+
+`Q_PUBLIC_SEARCH_WITH_ANSWERS` has Postgres score every public profile against
+the visitor's personality on each call. Instead, the profiles, their
+personality vectors and every question's score vectors are written to one file,
+which each worker memory-maps. The vectors are read straight out of the shared
+page cache; only the profiles' JSON is parsed by each worker, once per version
+of the file. A search then computes the visitor's personality, ranks the
+profiles with one matrix-vector product and doesn't touch the database.
+
+The file is rebuilt when it's older than `DUO_PUBLIC_SEARCH_INDEX_REFRESH_SECONDS`
+by whichever worker notices first, in a background thread. The new version is
+written beside the old one and renamed over it, so workers keep serving the old
+version until they see the new one. Only when there's no file yet does a
+request wait for it to be built.
+
+The file's layout is a fixed-size header, followed by the arrays and the JSON,
+each aligned to `_ALIGNMENT` bytes:
+
+    header
+    prospect personalities  float32[num_prospects, PERSONALITY_DIMENSIONS]
+    question ids            int64[num_questions]
+    question score vectors  int32[num_questions, 4, TRAIT_COUNT]
+    prospects               UTF-8 JSON list of rows
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import traceback
+from collections.abc import Iterator, Mapping, Sequence
+import numpy
+import numpy.typing as npt
+import duotypes as t
+from database import Tx, api_tx
+from qanda import personality
+from search.sql import (
+    Q_PUBLIC_SEARCH_INDEX,
+    Q_PUBLIC_SEARCH_INDEX_QUESTIONS,
+)
+
+
+PUBLIC_SEARCH_INDEX = os.environ.get(
+    'DUO_PUBLIC_SEARCH_INDEX',
+    'true',
+).lower() not in ['false', 'f', '0', 'no']
+
+PUBLIC_SEARCH_INDEX_PATH = os.environ.get(
+    'DUO_PUBLIC_SEARCH_INDEX_PATH',
+    os.path.join(
+        '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+        'duo-public-search-index',
+    ),
+)
+
+PUBLIC_SEARCH_INDEX_REFRESH_SECONDS = float(os.environ.get(
+    'DUO_PUBLIC_SEARCH_INDEX_REFRESH_SECONDS',
+    str(60),
+))
+
+PERSONALITY_DIMENSIONS = personality.TRAIT_COUNT + 1
+
+_MAGIC = b'DUOPSI01'
+
+# magic, num_prospects, num_questions, prospects_json_length
+_HEADER = struct.Struct('<8sQQQ')
+
+_ALIGNMENT = 64
+
+_SCORE_VECTOR_NAMES = (
+    'presence_given_yes',
+    'presence_given_no',
+    'absence_given_yes',
+    'absence_given_no',
+)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _json_default(o: object) -> str:
+    # UUIDs and the `Decimal` ages which `EXTRACT` returns. Flask renders both
+    # as strings too.
+    return str(o)
+
+
+def _sections(
+    num_prospects: int,
+    num_questions: int,
+) -> Iterator[tuple[int, int]]:
+    """The (offset, length) of each section after the header, in order"""
+    offset = _HEADER.size
+
+    for length in (
+        num_prospects * PERSONALITY_DIMENSIONS * 4,
+        num_questions * 8,
+        num_questions * len(_SCORE_VECTOR_NAMES) * personality.TRAIT_COUNT * 4,
+    ):
+        offset = _aligned(offset)
+        yield offset, length
+        offset += length
+
+    yield _aligned(offset), -1
+
+
+def serialize(
+    prospects: Sequence[Mapping[str, object]],
+    personalities: npt.NDArray[numpy.float32],
+    question_ids: npt.NDArray[numpy.int64],
+    question_scores: npt.NDArray[numpy.int32],
+) -> bytes:
+    prospects_json = json.dumps(
+        prospects,
+        default=_json_default,
+        separators=(',', ':'),
+    ).encode()
+
+    sections = list(_sections(len(prospects), len(question_ids)))
+    json_offset = sections[-1][0]
+
+    buf = bytearray(json_offset + len(prospects_json))
+
+    _HEADER.pack_into(
+        buf,
+        0,
+        _MAGIC,
+        len(prospects),
+        len(question_ids),
+        len(prospects_json),
+    )
+
+    for (offset, length), data in zip(
+        sections,
+        (
+            personalities.tobytes(),
+            question_ids.tobytes(),
+            question_scores.tobytes(),
+        ),
+    ):
+        buf[offset:offset + length] = data
+
+    buf[json_offset:] = prospects_json
+
+    return bytes(buf)
+
+
+class PublicSearchIndex:
+    def __init__(self, buf: mmap.mmap | bytes) -> None:
+        magic, num_prospects, num_questions, json_length = (
+            _HEADER.unpack_from(buf, 0))
+
+        if magic != _MAGIC:
+            raise ValueError('Not a public search index')
+
+        (
+            (personalities_offset, _),
+            (question_ids_offset, _),
+            (question_scores_offset, _),
+            (json_offset, _),
+        ) = _sections(num_prospects, num_questions)
+
+        # These are views of `buf`, not copies
+        self._personalities = numpy.frombuffer(
+            buf,
+            dtype=numpy.float32,
+            count=num_prospects * PERSONALITY_DIMENSIONS,
+            offset=personalities_offset,
+        ).reshape(num_prospects, PERSONALITY_DIMENSIONS)
+
+        question_ids = numpy.frombuffer(
+            buf,
+            dtype=numpy.int64,
+            count=num_questions,
+            offset=question_ids_offset,
+        )
+
+        self._question_scores = numpy.frombuffer(
+            buf,
+            dtype=numpy.int32,
+            count=num_questions * len(_SCORE_VECTOR_NAMES) * personality.TRAIT_COUNT,
+            offset=question_scores_offset,
+        ).reshape(num_questions, len(_SCORE_VECTOR_NAMES), personality.TRAIT_COUNT)
+
+        self._row_by_question_id = {
+            int(question_id): row
+            for row, question_id in enumerate(question_ids)
+        }
+
+        self._prospects: list[dict[str, object]] = json.loads(
+            buf[json_offset:json_offset + json_length])
+
+    def __len__(self) -> int:
+        return len(self._prospects)
+
+    def personality(
+        self,
+        answers: Sequence[t.PublicAnswer],
+    ) -> npt.NDArray[numpy.float64]:
+        """
+        The personality vector of someone who gave `answers`. This is
+        `personality.accumulate`, folding every answer in at once.
+        """
+        answered = [
+            (self._row_by_question_id[a.question_id], a.answer)
+            for a in answers
+            if a.question_id in self._row_by_question_id
+            if a.answer is not None
+        ]
+
+        rows = numpy.array([row for row, _ in answered], dtype=numpy.intp)
+        no = numpy.array([not answer for _, answer in answered], dtype=numpy.intp)
+
+        # See `_SCORE_VECTOR_NAMES` for the order of the score vectors
+        given_presence = self._question_scores[rows, no].astype(numpy.int64)
+        given_absence = self._question_scores[rows, 2 + no].astype(numpy.int64)
+        excess = numpy.minimum(given_presence, given_absence)
+
+        return personality.personality_vector(
+            (given_presence - excess).sum(axis=0),
+            (given_absence - excess).sum(axis=0),
+            len(answered),
+        )
+
+    def search(
+        self,
+        answers: Sequence[t.PublicAnswer],
+        n: int,
+        o: int,
+    ) -> list[dict[str, object]]:
+        """
+        Ranks the public profiles as `Q_PUBLIC_SEARCH_WITH_ANSWERS` does: best
+        match first, then by id
+        """
+        size = len(self._prospects)
+
+        if n == 0 or o >= size:
+            return []
+
+        scores = self._personalities @ self.personality(answers).astype(
+            numpy.float32)
+
+        # `<#>` is the negative inner product. Postgres rounds half to even
+        # when it casts to SMALLINT, as does `rint`.
+        match_percentages = numpy.rint(
+            numpy.clip(100 * (1 + scores.astype(numpy.float64)) / 2, 0, 99)
+        ).astype(numpy.int64)
+
+        # The prospects are stored in order of id, so each prospect's row
+        # breaks ties between equal match percentages. Only the first `o + n`
+        # are needed in order.
+        keys = (99 - match_percentages) * size + numpy.arange(size)
+
+        end = min(o + n, size)
+        if end < size:
+            best = numpy.argpartition(keys, end - 1)[:end]
+        else:
+            best = numpy.arange(size)
+
+        page = best[numpy.argsort(keys[best])][o:end]
+
+        return [
+            self._prospects[i] | dict(match_percentage=int(match_percentages[i]))
+            for i in page
+        ]
+
+
+def _fetch(tx: Tx) -> bytes:
+    prospects = tx.execute(Q_PUBLIC_SEARCH_INDEX).fetchall()
+    questions = tx.execute(Q_PUBLIC_SEARCH_INDEX_QUESTIONS).fetchall()
+
+    personalities = numpy.array(
+        [p.pop('personality') for p in prospects],
+        dtype=numpy.float32,
+    ).reshape(len(prospects), PERSONALITY_DIMENSIONS)
+
+    question_ids = numpy.array(
+        [q['id'] for q in questions],
+        dtype=numpy.int64,
+    )
+
+    question_scores = numpy.array(
+        [[q[name] for name in _SCORE_VECTOR_NAMES] for q in questions],
+        dtype=numpy.int32,
+    ).reshape(len(questions), len(_SCORE_VECTOR_NAMES), personality.TRAIT_COUNT)
+
+    return serialize(prospects, personalities, question_ids, question_scores)
+
+
+def build(path: str = PUBLIC_SEARCH_INDEX_PATH) -> None:
+    with api_tx('READ COMMITTED') as tx:
+        data = _fetch(tx)
+
+    directory, name = os.path.split(path)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+
+def _is_stale(stat: os.stat_result) -> bool:
+    return time.time() - stat.st_mtime >= PUBLIC_SEARCH_INDEX_REFRESH_SECONDS
+
+
+def _maybe_rebuild(path: str, stat: os.stat_result | None) -> None:
+    if stat is not None and not _is_stale(stat):
+        return
+
+    with open(f'{path}.lock', 'a') as lock_file:
+        # When there's no index yet, wait for whoever's building it. Otherwise
+        # keep serving the stale one while another worker rebuilds it.
+        try:
+            fcntl.flock(
+                lock_file,
+                fcntl.LOCK_EX if stat is None
+                else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        try:
+            # Another worker rebuilt it while we waited
+            if _version(_stat(path)) != _version(stat):
+                return
+
+            build(path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _stat(path: str) -> os.stat_result | None:
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _version(stat: os.stat_result | None) -> tuple[int, int] | None:
+    """
+    Identifies a version of the file. Each version is a new file, but the inode
+    of a deleted version can be reused, so the time it was written is included.
+    """
+    return None if stat is None else (stat.st_ino, stat.st_mtime_ns)
+
+
+def _open(path: str) -> tuple[tuple[int, int] | None, PublicSearchIndex]:
+    with open(path, 'rb') as f:
+        version = _version(os.fstat(f.fileno()))
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return version, PublicSearchIndex(buf)
+
+
+_lock = threading.Lock()
+_version_mapped: tuple[int, int] | None = None
+_index: PublicSearchIndex | None = None
+_is_rebuilding = False
+
+
+def _rebuild_in_background(path: str, stat: os.stat_result) -> None:
+    global _is_rebuilding
+
+    try:
+        _maybe_rebuild(path, stat)
+    except:
+        print(traceback.format_exc())
+    finally:
+        with _lock:
+            _is_rebuilding = False
+
+
+def get(path: str = PUBLIC_SEARCH_INDEX_PATH) -> PublicSearchIndex:
+    """
+    The latest version of the index. Builds it if there isn't one, and starts
+    rebuilding it in the background if it's stale.
+    """
+    global _version_mapped, _index, _is_rebuilding
+
+    with _lock:
+        stat = _stat(path)
+
+        if stat is None:
+            _maybe_rebuild(path, stat)
+        elif _is_stale(stat) and not _is_rebuilding:
+            _is_rebuilding = True
+            threading.Thread(
+                target=_rebuild_in_background,
+                args=(path, stat),
+                daemon=True,
+            ).start()
+
+        if _index is None or _version(_stat(path)) != _version_mapped:
+            # The previous version stays mapped until nothing refers to it
+            _version_mapped, _index = _open(path)
+
+        return _index
@@ -0,0 +1,88 @@
+"""
+Compares the throughput of `/public-search` with answers when public profiles
+are ranked by Postgres against when they're ranked by the shared index, in one
+process. Each search uses a random set of answers:
+
+    python3 -m search.publicindex.benchmark [seconds] [answers]
+"""
+
+import random
+import sys
+import time
+from collections.abc import Callable
+import numpy
+import duotypes as t
+from database import api_tx
+from search import _get_public_search_with_answers_from_db, publicindex
+from search.sql import Q_PUBLIC_SEARCH_INDEX_QUESTIONS
+
+
+def _requests(
+    seconds: float,
+    requests: list[t.PublicSearchRequest],
+    search: Callable[[t.PublicSearchRequest], object],
+) -> tuple[float, list[float]]:
+    """Requests/second, and the latency of each request"""
+    latencies: list[float] = []
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        search(requests[len(latencies) % len(requests)])
+        latencies.append(time.perf_counter() - start)
+
+    return len(latencies) / sum(latencies), latencies
+
+
+def _milliseconds(seconds: list[float]) -> str:
+    p50, p95, p99 = numpy.percentile(seconds, [50, 95, 99]) * 1000
+    return f'p50={p50:.3f}ms p95={p95:.3f}ms p99={p99:.3f}ms'
+
+
+def main() -> None:
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    num_answers = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+
+    with api_tx('READ COMMITTED') as tx:
+        question_ids = [
+            row['id']
+            for row in tx.execute(Q_PUBLIC_SEARCH_INDEX_QUESTIONS).fetchall()
+        ]
+
+    requests = [
+        t.PublicSearchRequest(
+            answers=[
+                t.PublicAnswer(
+                    question_id=question_id,
+                    answer=random.choice([True, False, None]),
+                )
+                for question_id in random.sample(
+                    question_ids, min(num_answers, len(question_ids)))
+            ],
+            n=10,
+            o=random.choice([0, 0, 0, 10, 20]),
+        )
+        for _ in range(1000)
+    ]
+
+    start = time.perf_counter()
+    publicindex.build()
+    index = publicindex.get()
+    print(
+        f'Indexed {len(index)} public profiles in '
+        f'{time.perf_counter() - start:.2f}s'
+    )
+
+    def search_with_index(req: t.PublicSearchRequest) -> object:
+        return publicindex.get().search(req.answers, n=req.n, o=req.o)
+
+    for name, search in [
+        ('postgres', _get_public_search_with_answers_from_db),
+        ('index', search_with_index),
+    ]:
+        rate, latencies = _requests(seconds, requests, search)
+        print(f'{name:8}  {rate:9.1f} req/s  {_milliseconds(latencies)}')
+
+
+if __name__ == '__main__':
+    main()
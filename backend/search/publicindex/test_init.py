@@ -0,0 +1,225 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+import numpy
+import duotypes as t
+from qanda import personality
+import search.publicindex
+from search.publicindex import (
+    PERSONALITY_DIMENSIONS,
+    PublicSearchIndex,
+    get,
+    serialize,
+)
+
+
+def _serialized(
+    personalities: list[list[float]],
+    question_scores: list[list[list[int]]] = [],
+) -> bytes:
+    prospects = [
+        dict(
+            prospect_person_id=i + 1,
+            prospect_uuid=uuid.UUID(int=i + 1),
+            name=f'user{i + 1}',
+            age=Decimal(30),
+        )
+        for i in range(len(personalities))
+    ]
+
+    return serialize(
+        prospects,
+        numpy.array(personalities, dtype=numpy.float32).reshape(
+            len(personalities), PERSONALITY_DIMENSIONS),
+        numpy.arange(1, len(question_scores) + 1, dtype=numpy.int64),
+        numpy.array(question_scores, dtype=numpy.int32).reshape(
+            len(question_scores), 4, personality.TRAIT_COUNT),
+    )
+
+
+def _index(
+    personalities: list[list[float]],
+    question_scores: list[list[list[int]]] = [],
+) -> PublicSearchIndex:
+    return PublicSearchIndex(_serialized(personalities, question_scores))
+
+
+def _personality(*leading: float) -> list[float]:
+    return [*leading] + [0.0] * (PERSONALITY_DIMENSIONS - len(leading))
+
+
+def _question_scores(trait: int) -> list[list[int]]:
+    """Answering yes gives `trait` presence; answering no gives it absence"""
+    scores = [[0] * personality.TRAIT_COUNT for _ in range(4)]
+    scores[0][trait] = 10 # presence_given_yes
+    scores[3][trait] = 10 # absence_given_no
+    return scores
+
+
+class TestPublicSearchIndex(unittest.TestCase):
+    def test_round_trips_prospects(self) -> None:
+        index = _index([_personality(1.0), _personality(0.5)])
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(
+            index.search([], n=1, o=1),
+            [dict(
+                prospect_person_id=2,
+                prospect_uuid=str(uuid.UUID(int=2)),
+                name='user2',
+                age='30',
+                match_percentage=50,
+            )])
+
+    def test_computes_personality_from_answers(self) -> None:
+        index = _index([], [_question_scores(0), _question_scores(1)])
+
+        answers = [
+            t.PublicAnswer(question_id=1, answer=True),
+            t.PublicAnswer(question_id=2, answer=False),
+            # Skipped and unknown questions contribute nothing
+            t.PublicAnswer(question_id=2, answer=None),
+            t.PublicAnswer(question_id=3, answer=True),
+        ]
+
+        presence = numpy.zeros(personality.TRAIT_COUNT, dtype=numpy.int64)
+        absence = numpy.zeros(personality.TRAIT_COUNT, dtype=numpy.int64)
+        presence[0] = 10
+        absence[1] = 10
+
+        numpy.testing.assert_allclose(
+            index.personality(answers),
+            personality.personality_vector(presence, absence, 2))
+
+    def test_personality_matches_accumulate(self) -> None:
+        rng = numpy.random.default_rng(0)
+
+        question_scores = rng.integers(
+            0, 20, size=(50, 4, personality.TRAIT_COUNT))
+
+        index = _index([], question_scores.tolist())
+
+        for _ in range(20):
+            answers = [
+                t.PublicAnswer(
+                    question_id=int(question_id),
+                    answer=[True, False, None][rng.integers(3)],
+                )
+                for question_id in rng.choice(50, size=10, replace=False) + 1
+            ]
+
+            presence, absence, count = personality.accumulate(
+                (
+                    dict(
+                        presence_given_yes=question_scores[a.question_id - 1][0],
+                        presence_given_no=question_scores[a.question_id - 1][1],
+                        absence_given_yes=question_scores[a.question_id - 1][2],
+                        absence_given_no=question_scores[a.question_id - 1][3],
+                    ),
+                    a.answer,
+                )
+                for a in answers
+            )
+
+            numpy.testing.assert_allclose(
+                index.personality(answers),
+                personality.personality_vector(presence, absence, count))
+
+    def test_ranks_by_match_percentage_then_id(self) -> None:
+        index = _index(
+            [
+                _personality(-1.0),
+                _personality(1.0),
+                _personality(0.0),
+                _personality(1.0),
+            ],
+            [_question_scores(0)],
+        )
+
+        answers = [t.PublicAnswer(question_id=1, answer=True)]
+
+        results = index.search(answers, n=10, o=0)
+
+        self.assertEqual(
+            [r['prospect_person_id'] for r in results],
+            [2, 4, 3, 1])
+
+        # The searcher only has the first trait, which prospects 2 and 4 share
+        # and prospect 1 has the opposite of
+        match = round(50 + 50 * index.personality(answers)[0])
+        self.assertGreater(match, 50)
+        self.assertEqual(
+            [r['match_percentage'] for r in results],
+            [match, match, 50, 100 - match])
+
+        self.assertEqual(
+            index.search(answers, n=2, o=1),
+            results[1:3])
+
+        self.assertEqual(index.search([], n=10, o=4), [])
+        self.assertEqual(index.search([], n=0, o=0), [])
+
+
+class TestGet(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'index')
+
+        patcher = patch.multiple(
+            search.publicindex,
+            _version_mapped=None,
+            _index=None,
+            _is_rebuilding=False,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write(self, num_prospects: int) -> None:
+        with open(f'{self.path}.tmp', 'wb') as f:
+            f.write(_serialized([_personality(1.0)] * num_prospects))
+        os.replace(f'{self.path}.tmp', self.path)
+
+    def test_builds_missing_index_before_returning(self) -> None:
+        with patch(
+            'search.publicindex.build',
+            side_effect=lambda path: self._write(3),
+        ):
+            self.assertEqual(len(get(self.path)), 3)
+
+    def test_rebuilds_stale_index_in_background(self) -> None:
+        self._write(1)
+        os.utime(self.path, (0, 0))
+
+        building = threading.Event()
+        may_finish = threading.Event()
+
+        def build(path: str) -> None:
+            building.set()
+            may_finish.wait(timeout=5)
+            self._write(2)
+
+        with patch('search.publicindex.build', side_effect=build):
+            # The stale version is served while it's rebuilt
+            self.assertEqual(len(get(self.path)), 1)
+            self.assertTrue(building.wait(timeout=5))
+            self.assertEqual(len(get(self.path)), 1)
+
+            may_finish.set()
+
+            deadline = time.monotonic() + 5
+            while (
+                search.publicindex._is_rebuilding and
+                time.monotonic() < deadline
+            ):
+                time.sleep(0.01)
+
+            self.assertEqual(len(get(self.path)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+"""
+Picks the prospect shown by a quiz search: the best of the searcher's cached
+search results, re-ranked against the personality their latest answer gave
+them.
+
+`Q_QUIZ_SEARCH` used to re-read every cached prospect's personality from
+Postgres after each answer. Instead, each API worker keeps a searcher's cached
+prospects as one float32 block, so re-ranking them is a single matrix-vector
+product. The blocks are kept in a small LRU cache, keyed by the searcher's
+`search_cache.updated_at`, which changes whenever their results are replaced
+by an uncached search or someone is blanked out of them by a skip.
+
+Like the query it replaces, the block holds the prospects' personalities,
+verification and photos as they were when it was read.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+import numpy
+import numpy.typing as npt
+from database import Tx
+from search.personalityindex import PERSONALITY_DIMENSIONS
+from search.sql import (
+    Q_QUIZ_CACHED_PROSPECTS,
+    Q_QUIZ_SEARCHER,
+)
+
+
+QUIZ_CACHE_SIZE = int(os.environ.get(
+    'DUO_SEARCH_QUIZ_CACHE_SIZE',
+    str(256),
+))
+
+# Verified prospects with photos are only promoted above other prospects with
+# photos if there's at least this many of them
+PROMOTE_VERIFIED_THRESHOLD = 250
+
+
+@dataclass(frozen=True)
+class CachedProspects:
+    updated_at: datetime | None
+    prospect_person_ids: npt.NDArray[numpy.int64]
+    # One row per prospect, in the order of the cached search results
+    personalities: npt.NDArray[numpy.float32]
+    verified: npt.NDArray[numpy.bool_]
+    has_profile_photo: npt.NDArray[numpy.bool_]
+
+
+@dataclass(frozen=True)
+class BestProspect:
+    prospect_person_id: int
+    match_percentage: int
+
+
+def best_prospect(
+    prospects: CachedProspects,
+    personality: Sequence[float],
+    count_answers: int,
+) -> BestProspect | None:
+    if len(prospects.prospect_person_ids) == 0:
+        return None
+
+    # `<#>` is the negative inner product
+    scores = prospects.personalities @ numpy.asarray(
+        personality, dtype=numpy.float32)
+
+    # Postgres rounds half to even when it casts to SMALLINT, as does `rint`
+    match_percentages = numpy.rint(
+        numpy.clip(100 * (1 + scores.astype(numpy.float64)) / 2, 0, 99))
+
+    verified_with_photo = prospects.has_profile_photo & prospects.verified
+
+    do_promote_verified = (
+        count_answers > 0 and
+        numpy.count_nonzero(verified_with_photo) >= PROMOTE_VERIFIED_THRESHOLD)
+
+    promoted = (
+        verified_with_photo
+        if do_promote_verified
+        else prospects.has_profile_photo)
+
+    # Match percentages are below 100, so this orders by `promoted`, then by
+    # match percentage. `argmax` breaks ties by taking the earliest result.
+    i = int(numpy.argmax(100 * promoted + match_percentages))
+
+    return BestProspect(
+        prospect_person_id=int(prospects.prospect_person_ids[i]),
+        match_percentage=int(match_percentages[i]),
+    )
+
+
+def _fetch_cached_prospects(
+    tx: Tx,
+    searcher_person_id: int,
+    updated_at: datetime | None,
+) -> CachedProspects:
+    rows = tx.execute(
+        Q_QUIZ_CACHED_PROSPECTS,
+        dict(searcher_person_id=searcher_person_id),
+    ).fetchall()
+
+    return CachedProspects(
+        # The results might have changed since `updated_at` was read
+        updated_at=rows[0]['updated_at'] if rows else updated_at,
+        prospect_person_ids=numpy.array(
+            [row['prospect_person_id'] for row in rows],
+            dtype=numpy.int64,
+        ),
+        personalities=numpy.array(
+            [row['personality'] for row in rows],
+            dtype=numpy.float32,
+        ).reshape(len(rows), PERSONALITY_DIMENSIONS),
+        verified=numpy.array(
+            [row['verified'] for row in rows],
+            dtype=numpy.bool_,
+        ),
+        has_profile_photo=numpy.array(
+            [row['has_profile_photo'] for row in rows],
+            dtype=numpy.bool_,
+        ),
+    )
+
+
+class _LruCache:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[int, CachedProspects] = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+    def get(self, key: int) -> CachedProspects | None:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def set(self, key: int, value: CachedProspects) -> None:
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+
+_cache = _LruCache(maxsize=QUIZ_CACHE_SIZE)
+
+
+def quiz_search(tx: Tx, searcher_person_id: int) -> BestProspect | None:
+    searcher = tx.execute(
+        Q_QUIZ_SEARCHER,
+        dict(searcher_person_id=searcher_person_id),
+    ).fetchone()
+
+    if searcher is None or searcher['updated_at'] is None:
+        return None
+
+    prospects = _cache.get(searcher_person_id)
+
+    if prospects is None or prospects.updated_at != searcher['updated_at']:
+        prospects = _fetch_cached_prospects(
+            tx, searcher_person_id, searcher['updated_at'])
+        _cache.set(searcher_person_id, prospects)
+
+    return best_prospect(
+        prospects,
+        personality=searcher['personality'],
+        count_answers=searcher['count_answers'],
+    )
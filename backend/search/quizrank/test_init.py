@@ -0,0 +1,116 @@
+import unittest
+from datetime import datetime
+import numpy
+from search.quizrank import (
+    PROMOTE_VERIFIED_THRESHOLD,
+    CachedProspects,
+    _LruCache,
+    best_prospect,
+)
+
+
+def _prospects(
+    personalities: list[list[float]],
+    verified: list[bool] | None = None,
+    has_profile_photo: list[bool] | None = None,
+) -> CachedProspects:
+    n = len(personalities)
+
+    return CachedProspects(
+        updated_at=datetime(2024, 1, 1),
+        prospect_person_ids=numpy.arange(1, n + 1, dtype=numpy.int64),
+        personalities=numpy.array(
+            personalities,
+            dtype=numpy.float32,
+        ).reshape(n, len(personalities[0]) if personalities else 0),
+        verified=numpy.array(
+            [False] * n if verified is None else verified,
+            dtype=numpy.bool_,
+        ),
+        has_profile_photo=numpy.array(
+            [True] * n if has_profile_photo is None else has_profile_photo,
+            dtype=numpy.bool_,
+        ),
+    )
+
+
+class TestBestProspect(unittest.TestCase):
+    def test_no_prospects(self) -> None:
+        self.assertIsNone(best_prospect(_prospects([]), [1.0, 0.0], 1))
+
+    def test_ranks_by_match_percentage(self) -> None:
+        prospects = _prospects([
+            [0.1, 0.9],
+            [0.9, 0.1],
+            [0.5, 0.5],
+        ])
+
+        best = best_prospect(prospects, [1.0, 0.0], 1)
+
+        self.assertIsNotNone(best)
+        assert best is not None
+        self.assertEqual(best.prospect_person_id, 2)
+        self.assertEqual(best.match_percentage, 95)
+
+    def test_clamps_match_percentage(self) -> None:
+        best = best_prospect(_prospects([[-2.0], [-3.0]]), [1.0], 1)
+        assert best is not None
+        self.assertEqual((best.prospect_person_id, best.match_percentage), (1, 0))
+
+        best = best_prospect(_prospects([[2.0], [3.0]]), [1.0], 1)
+        assert best is not None
+        self.assertEqual((best.prospect_person_id, best.match_percentage), (1, 99))
+
+    def test_promotes_prospects_with_photos(self) -> None:
+        prospects = _prospects(
+            [[0.9], [0.1]],
+            has_profile_photo=[False, True],
+        )
+
+        best = best_prospect(prospects, [1.0], 1)
+        assert best is not None
+        self.assertEqual(best.prospect_person_id, 2)
+
+    def test_promotes_verified_prospects_when_there_are_enough(self) -> None:
+        n = PROMOTE_VERIFIED_THRESHOLD
+
+        # The best match is unverified; everyone else is verified
+        personalities = [[1.0]] + [[0.0]] * n
+        verified = [False] + [True] * n
+
+        best = best_prospect(
+            _prospects(personalities, verified=verified), [1.0], 1)
+        assert best is not None
+        self.assertEqual(best.prospect_person_id, 2)
+
+        # Searchers who haven't answered anything aren't shown verified people
+        # first
+        best = best_prospect(
+            _prospects(personalities, verified=verified), [1.0], 0)
+        assert best is not None
+        self.assertEqual(best.prospect_person_id, 1)
+
+        # Nor are searchers with too few verified prospects
+        best = best_prospect(
+            _prospects(personalities[:-1], verified=verified[:-1]), [1.0], 1)
+        assert best is not None
+        self.assertEqual(best.prospect_person_id, 1)
+
+
+class TestLruCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self) -> None:
+        cache = _LruCache(maxsize=2)
+
+        cache.set(1, _prospects([[1.0]]))
+        cache.set(2, _prospects([[2.0]]))
+        cache.get(1)
+        cache.set(3, _prospects([[3.0]]))
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(3))
+
+
+if __name__ == '__main__':
+    unittest.main()
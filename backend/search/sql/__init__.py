@@ -57,16 +57,7 @@ WHERE
 
 
 
-Q_UNCACHED_SEARCH_1 = """
-DELETE FROM
-    search_cache
-WHERE
-    searcher_person_id = %(searcher_person_id)s
-"""
-
-
-
-Q_UNCACHED_SEARCH_2 = """
+_Q_UNCACHED_SEARCH_2 = """
 WITH searcher AS (
     SELECT
         coordinates,
@@ -157,89 +148,11 @@ WITH searcher AS (
         person
     WHERE
         person.id = %(searcher_person_id)s
-), prospects_first_pass_without_club AS (
-    SELECT
-        id
-    FROM
-        person AS prospect
-    CROSS JOIN
-        searcher
-    WHERE
-        prospect.activated
-    AND
-        -- The prospect meets the searcher's gender preference
-        prospect.gender_id = ANY(%(gender_preference)s::SMALLINT[])
-    AND
-        -- The prospect meets the searcher's location preference
-        ST_DWithin(
-            prospect.coordinates,
-            searcher.coordinates,
-            searcher.distance_preference
-        )
-    AND
-        searcher.club_preference IS NULL
-
-    LIMIT
-        30000
-), prospects_first_pass_with_club AS (
-    SELECT
-        person_id AS id
-    FROM
-        person_club AS prospect
-    CROSS JOIN
-        searcher
-    WHERE
-        prospect.activated
-    AND
-        -- The prospect meets the searcher's gender preference
-        prospect.gender_id = ANY(%(gender_preference)s::SMALLINT[])
-    AND
-        -- The prospect meets the searcher's location preference
-        ST_DWithin(
-            prospect.coordinates,
-            searcher.coordinates,
-            searcher.distance_preference
-        )
-    AND
-        prospect.club_name = searcher.club_preference
-
-    LIMIT
-        30000
-), prospects_second_pass AS (
-    SELECT id FROM prospects_first_pass_without_club
-    UNION ALL
-    SELECT id FROM prospects_first_pass_with_club
-), prospects_third_pass AS (
-    SELECT
-        prospect.id
-    FROM
-        person AS prospect
-    JOIN
-        prospects_second_pass
-    ON
-        prospects_second_pass.id = prospect.id
-    CROSS JOIN
-        searcher
-    WHERE
-        -- Shadow-banned prospects appear not to exist to other searchers. Done
-        -- here (rather than in the per-source first passes) so the single
-        -- `person` join covers both the club and non-club paths, and so
-        -- person_club needn't carry the column.
-        prospect.shadow_banned_at IS NULL
-    ORDER BY
-        prospect.personality <#> searcher.personality
-    LIMIT
-        10000
+), [[prospects_third_pass]]
 ), prospects_fourth_pass AS (
     SELECT
         prospect.id AS prospect_person_id,
 
-        uuid AS prospect_uuid,
-
-        name,
-
-        prospect.personality,
-
         verification_level_id > 1 AS verified,
 
         (
@@ -254,12 +167,6 @@ WITH searcher AS (
             LIMIT 1
         ) AS profile_photo_uuid,
 
-        CASE
-            WHEN show_my_age
-            THEN EXTRACT(YEAR FROM AGE(prospect.date_of_birth))
-            ELSE NULL
-        END AS age,
-
         CLAMP(
             0,
             99,
@@ -546,184 +453,538 @@ WITH searcher AS (
         verified
     AND
         (SELECT count_answers > 0 FROM searcher)
+), ranked AS (
+    SELECT
+        prospect_person_id,
+        match_percentage,
+        ROW_NUMBER() OVER (
+            ORDER BY
+                -- If this is changed, other subqueries will need changing too
+                CASE
+                    WHEN (SELECT x FROM do_promote_verified)
+                    THEN
+                        profile_photo_uuid IS NOT NULL AND verified
+                    ELSE
+                        profile_photo_uuid IS NOT NULL
+                END DESC,
+
+                match_percentage DESC
+        ) AS position
+    FROM
+        prospects_fourth_pass
+    WHERE
+        prospects_fourth_pass.prospect_person_id != %(searcher_person_id)s
+    AND
+        'bot' <> ALL(prospects_fourth_pass.roles)
+    ORDER BY
+        position
+    LIMIT
+        500
 )
+-- Replaces the searcher's previous results. Only ids are stored; everything
+-- else about a prospect is looked up when their page of results is requested.
 INSERT INTO search_cache (
     searcher_person_id,
-    position,
-    prospect_person_id,
-    prospect_uuid,
-    profile_photo_uuid,
-    name,
-    age,
-    match_percentage,
-    personality,
-    verified
+    prospect_person_ids,
+    match_percentages
 )
 SELECT
     %(searcher_person_id)s,
-    ROW_NUMBER() OVER (
-        ORDER BY
-            -- If this is changed, other subqueries will need changing too
-            CASE
-                WHEN (SELECT x FROM do_promote_verified)
-                THEN
-                    profile_photo_uuid IS NOT NULL AND verified
-                ELSE
-                    profile_photo_uuid IS NOT NULL
-            END DESC,
-
-            match_percentage DESC
-    ) AS position,
-    prospect_person_id,
-    prospect_uuid,
-    profile_photo_uuid,
-    name,
-    age,
-    match_percentage,
-    personality,
-    verified
+    COALESCE(
+        array_agg(prospect_person_id ORDER BY position),
+        '{}'
+    ),
+    COALESCE(
+        array_agg(match_percentage::SMALLINT ORDER BY position),
+        '{}'
+    )
 FROM
-    prospects_fourth_pass
-WHERE
-    prospects_fourth_pass.prospect_person_id != %(searcher_person_id)s
-AND
-    'bot' <> ALL(prospects_fourth_pass.roles)
-ORDER BY
-    position
-LIMIT
-    500
-ON CONFLICT (searcher_person_id, position) DO UPDATE SET
-    searcher_person_id = EXCLUDED.searcher_person_id,
-    position = EXCLUDED.position,
-    prospect_person_id = EXCLUDED.prospect_person_id,
-    prospect_uuid = EXCLUDED.prospect_uuid,
-    profile_photo_uuid = EXCLUDED.profile_photo_uuid,
-    name = EXCLUDED.name,
-    age = EXCLUDED.age,
-    match_percentage = EXCLUDED.match_percentage,
-    personality = EXCLUDED.personality,
-    verified = EXCLUDED.verified
+    ranked
+ON CONFLICT (searcher_person_id) DO UPDATE SET
+    prospect_person_ids = EXCLUDED.prospect_person_ids,
+    match_percentages = EXCLUDED.match_percentages,
+    updated_at = EXCLUDED.updated_at
 """
 
 
 
-Q_CACHED_SEARCH = """
-WITH page AS (
+Q_UNCACHED_SEARCH_2 = _Q_UNCACHED_SEARCH_2.replace(
+    '[[prospects_third_pass]]',
+    """prospects_first_pass_without_club AS (
     SELECT
-        prospect_person_id,
-        prospect_uuid,
-        (
-            SELECT url_slug FROM person WHERE id = prospect_person_id
-        ) AS url_slug,
-        profile_photo_uuid,
-        (
-            SELECT blurhash FROM photo WHERE profile_photo_uuid = photo.uuid
-        ) AS profile_photo_blurhash,
-        name,
-        age,
-        match_percentage,
-        EXISTS (
-            SELECT
-                1
-            FROM
-                messaged
-            WHERE
-                subject_person_id = %(searcher_person_id)s
-            AND
-                object_person_id = prospect_person_id
-        ) AS person_messaged_prospect,
-        EXISTS (
-            SELECT
-                1
-            FROM
-                messaged
-            WHERE
-                subject_person_id = prospect_person_id
-            AND
-                object_person_id = %(searcher_person_id)s
-        ) AS prospect_messaged_person,
-        verified,
-        (
-            SELECT
-                verification_level_id
-            FROM
-                person
-            WHERE
-                id = %(searcher_person_id)s
-        ) AS searcher_verification_level_id,
-        (
-            SELECT
-                privacy_verification_level_id
-            FROM
-                person
-            WHERE
-                id = prospect_person_id
-        ) AS privacy_verification_level_id
+        id
     FROM
-        search_cache
+        person AS prospect
+    CROSS JOIN
+        searcher
     WHERE
-        searcher_person_id = %(searcher_person_id)s AND
-        position >  %(o)s AND
-        position <= %(o)s + %(n)s
-    ORDER BY
-        position
-)
-SELECT
-    public_page.profile_photo_blurhash,
-    public_page.name,
-    public_page.age,
-    public_page.match_percentage,
-    public_page.person_messaged_prospect,
-    public_page.prospect_messaged_person,
-    public_page.verified,
-    public_page.verification_required_to_view,
+        prospect.activated
+    AND
+        -- The prospect meets the searcher's gender preference
+        prospect.gender_id = ANY(%(gender_preference)s::SMALLINT[])
+    AND
+        -- The prospect meets the searcher's location preference
+        ST_DWithin(
+            prospect.coordinates,
+            searcher.coordinates,
+            searcher.distance_preference
+        )
+    AND
+        searcher.club_preference IS NULL
 
-    private_page.prospect_person_id,
-    private_page.prospect_uuid,
-    private_page.url_slug,
-    private_page.profile_photo_uuid
-FROM
-    (
-        SELECT
-            *,
+    -- Nearest first, so that when there are more than enough people in range,
+    -- the closest are kept rather than arbitrary ones
+    ORDER BY
+        prospect.coordinates <-> (SELECT coordinates FROM searcher)
 
-            CASE
-                WHEN
-                    searcher_verification_level_id >=
-                    privacy_verification_level_id
-                THEN NULL
-                WHEN
-                    privacy_verification_level_id = 2
-                THEN 'basics'
-                WHEN
-                    privacy_verification_level_id = 3
-                THEN 'photos'
-            END AS verification_required_to_view
-        FROM
-            page
-    ) AS public_page
-LEFT JOIN
-    (
-        SELECT
-            *
-        FROM
-            page
-        WHERE
-            searcher_verification_level_id >= privacy_verification_level_id
-    ) AS private_page
-ON
-    private_page.prospect_person_id = public_page.prospect_person_id
-"""
+    LIMIT
+        30000
+), prospects_first_pass_with_club AS (
+    SELECT
+        person_id AS id
+    FROM
+        person_club AS prospect
+    CROSS JOIN
+        searcher
+    WHERE
+        prospect.activated
+    AND
+        -- The prospect meets the searcher's gender preference
+        prospect.gender_id = ANY(%(gender_preference)s::SMALLINT[])
+    AND
+        -- The prospect meets the searcher's location preference
+        ST_DWithin(
+            prospect.coordinates,
+            searcher.coordinates,
+            searcher.distance_preference
+        )
+    AND
+        prospect.club_name = searcher.club_preference
 
-Q_PUBLIC_SEARCH = """
-SELECT
-    prospect.id AS prospect_person_id,
+    -- Nearest first, as above
+    ORDER BY
+        prospect.coordinates <-> (SELECT coordinates FROM searcher)
 
-    prospect.uuid AS prospect_uuid,
+    LIMIT
+        30000
+), prospects_second_pass AS (
+    SELECT id FROM prospects_first_pass_without_club
+    UNION ALL
+    SELECT id FROM prospects_first_pass_with_club
+), prospects_third_pass AS (
+    SELECT
+        prospect.id
+    FROM
+        person AS prospect
+    JOIN
+        prospects_second_pass
+    ON
+        prospects_second_pass.id = prospect.id
+    CROSS JOIN
+        searcher
+    WHERE
+        -- Shadow-banned prospects appear not to exist to other searchers. Done
+        -- here (rather than in the per-source first passes) so the single
+        -- `person` join covers both the club and non-club paths, and so
+        -- person_club needn't carry the column.
+        prospect.shadow_banned_at IS NULL
+    ORDER BY
+        prospect.personality <#> searcher.personality
+    LIMIT
+        10000
+""".strip(),
+)
 
-    prospect.url_slug,
 
-    prospect.name,
+
+# The same as `Q_UNCACHED_SEARCH_2`, except that only the `%(nearest)s` nearest
+# people are ranked. Serves the first page of a search which timed out before
+# the personality index could offer candidates.
+Q_PARTIAL_UNCACHED_SEARCH_2 = Q_UNCACHED_SEARCH_2.replace(
+    """
+    LIMIT
+        30000
+""",
+    """
+    LIMIT
+        %(nearest)s
+""",
+)
+
+
+
+# The same as `Q_UNCACHED_SEARCH_2`, except that the candidates ranked by
+# personality come from `search.personalityindex` as `%(prospect_ids)s`. The
+# index can lag behind `person` by a few seconds, so everything it filtered on
+# is checked again here.
+Q_UNCACHED_SEARCH_2_FROM_INDEX = _Q_UNCACHED_SEARCH_2.replace(
+    '[[prospects_third_pass]]',
+    """prospects_third_pass AS (
+    SELECT
+        prospect.id
+    FROM
+        person AS prospect
+    CROSS JOIN
+        searcher
+    WHERE
+        prospect.id = ANY(%(prospect_ids)s::INT[])
+    AND
+        prospect.activated
+    AND
+        prospect.shadow_banned_at IS NULL
+    AND
+        prospect.gender_id = ANY(%(gender_preference)s::SMALLINT[])
+    AND
+        ST_DWithin(
+            prospect.coordinates,
+            searcher.coordinates,
+            searcher.distance_preference
+        )
+    """.strip(),
+)
+
+
+
+_REPLACE_SEARCH_CACHE = """
+ON CONFLICT (searcher_person_id) DO UPDATE SET
+    prospect_person_ids = EXCLUDED.prospect_person_ids,
+    match_percentages = EXCLUDED.match_percentages,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+
+# Appends to the partial results which a timed-out search left in
+# `search_cache`, so that pages the searcher has already seen stay put. The
+# results are left alone if the searcher has searched again since
+# `%(partial_updated_at)s`.
+_EXTEND_SEARCH_CACHE = """
+ON CONFLICT (searcher_person_id) DO UPDATE SET
+    prospect_person_ids = (
+        search_cache.prospect_person_ids || ARRAY(
+            SELECT
+                result.prospect_person_id
+            FROM
+                unnest(EXCLUDED.prospect_person_ids)
+                WITH ORDINALITY AS result(prospect_person_id, position)
+            WHERE
+                result.prospect_person_id <> ALL(search_cache.prospect_person_ids)
+            ORDER BY
+                result.position
+        )
+    )[1:500],
+    match_percentages = (
+        search_cache.match_percentages || ARRAY(
+            SELECT
+                result.match_percentage
+            FROM
+                unnest(EXCLUDED.prospect_person_ids, EXCLUDED.match_percentages)
+                WITH ORDINALITY AS result(
+                    prospect_person_id,
+                    match_percentage,
+                    position
+                )
+            WHERE
+                result.prospect_person_id <> ALL(search_cache.prospect_person_ids)
+            ORDER BY
+                result.position
+        )
+    )[1:500],
+    updated_at = EXCLUDED.updated_at
+WHERE
+    search_cache.updated_at = %(partial_updated_at)s
+"""
+
+
+
+Q_EXTEND_UNCACHED_SEARCH_2 = Q_UNCACHED_SEARCH_2.replace(
+    _REPLACE_SEARCH_CACHE,
+    _EXTEND_SEARCH_CACHE,
+)
+
+
+
+Q_EXTEND_UNCACHED_SEARCH_2_FROM_INDEX = Q_UNCACHED_SEARCH_2_FROM_INDEX.replace(
+    _REPLACE_SEARCH_CACHE,
+    _EXTEND_SEARCH_CACHE,
+)
+
+
+
+Q_SEARCH_CACHE_UPDATED_AT = """
+SELECT
+    updated_at
+FROM
+    search_cache
+WHERE
+    searcher_person_id = %(searcher_person_id)s
+"""
+
+
+# Claims the search which the cron service warmed for the searcher, if it's
+# still fresh and they haven't moved, changed gender or answered questions
+# since. Changes to the prospects aren't checked; `max_age_seconds` stands in
+# for that. Each warmed search is served once.
+Q_TAKE_WARM_SEARCH_CACHE = """
+UPDATE
+    search_cache
+SET
+    warmed_at = NULL
+FROM
+    person
+WHERE
+    search_cache.searcher_person_id = %(searcher_person_id)s
+AND
+    person.id = search_cache.searcher_person_id
+AND
+    search_cache.warmed_at = search_cache.updated_at
+AND
+    search_cache.warmed_at > NOW() - INTERVAL '1 second' * %(max_age_seconds)s
+AND
+    person.search_index_time < search_cache.warmed_at
+RETURNING
+    search_cache.searcher_person_id
+"""
+
+
+
+# Marks the search which was just written to `search_cache` as warmed
+Q_MARK_SEARCH_CACHE_WARM = """
+UPDATE
+    search_cache
+SET
+    warmed_at = updated_at
+WHERE
+    searcher_person_id = %(searcher_person_id)s
+"""
+
+
+Q_PERSONALITY_INDEX_NOW = """
+SELECT NOW()::TIMESTAMP AS now
+"""
+
+
+
+# People whose searchability, gender, location or personality changed after
+# `%(since)s`, or every searchable person when `%(since)s` is NULL. Paged by
+# id, so that loading everyone doesn't hold the whole table in memory at once.
+Q_PERSONALITY_INDEX = """
+SELECT
+    id,
+    gender_id,
+    activated AND shadow_banned_at IS NULL AS searchable,
+    ST_Y(coordinates::geometry) AS latitude,
+    ST_X(coordinates::geometry) AS longitude,
+    personality::REAL[] AS personality
+FROM
+    person
+WHERE
+    id > %(after_id)s
+AND (
+        %(since)s::TIMESTAMP IS NULL
+    AND
+        activated
+    AND
+        shadow_banned_at IS NULL
+    OR
+        search_index_time > %(since)s::TIMESTAMP
+)
+ORDER BY
+    id
+LIMIT
+    %(limit)s
+"""
+
+
+
+Q_PERSONALITY_INDEX_SEARCHER = """
+SELECT
+    personality::REAL[] AS personality,
+    ST_Y(coordinates::geometry) AS latitude,
+    ST_X(coordinates::geometry) AS longitude,
+    COALESCE(
+        (
+            SELECT
+                1000 * distance
+            FROM
+                search_preference_distance
+            WHERE
+                person_id = %(searcher_person_id)s
+        ),
+        1e9
+    ) AS distance_preference,
+    EXISTS (
+        SELECT
+            1
+        FROM
+            search_preference_club
+        WHERE
+            person_id = %(searcher_person_id)s
+    ) AS has_club_preference
+FROM
+    person
+WHERE
+    id = %(searcher_person_id)s
+"""
+
+
+Q_CACHED_SEARCH = """
+WITH searcher AS (
+    SELECT
+        verification_level_id
+    FROM
+        person
+    WHERE
+        id = %(searcher_person_id)s
+), result AS (
+    SELECT
+        result.prospect_person_id,
+        result.match_percentage,
+        result.position
+    FROM
+        search_cache
+    CROSS JOIN LATERAL
+        unnest(
+            search_cache.prospect_person_ids[
+                %(o)s::INT + 1 : %(o)s::INT + %(n)s::INT],
+            search_cache.match_percentages[
+                %(o)s::INT + 1 : %(o)s::INT + %(n)s::INT]
+        ) WITH ORDINALITY AS result(
+            prospect_person_id,
+            match_percentage,
+            position
+        )
+    WHERE
+        search_cache.searcher_person_id = %(searcher_person_id)s
+), messaged_page AS (
+    -- Who the searcher messaged or was messaged by, out of the whole page
+    SELECT
+        object_person_id AS prospect_person_id,
+        TRUE AS person_messaged_prospect,
+        FALSE AS prospect_messaged_person
+    FROM
+        messaged
+    WHERE
+        subject_person_id = %(searcher_person_id)s
+    AND
+        object_person_id IN (SELECT prospect_person_id FROM result)
+    UNION ALL
+    SELECT
+        subject_person_id AS prospect_person_id,
+        FALSE AS person_messaged_prospect,
+        TRUE AS prospect_messaged_person
+    FROM
+        messaged
+    WHERE
+        subject_person_id IN (SELECT prospect_person_id FROM result)
+    AND
+        object_person_id = %(searcher_person_id)s
+), messaged_result AS (
+    SELECT
+        prospect_person_id,
+        bool_or(person_messaged_prospect) AS person_messaged_prospect,
+        bool_or(prospect_messaged_person) AS prospect_messaged_person
+    FROM
+        messaged_page
+    GROUP BY
+        prospect_person_id
+), page AS (
+    SELECT
+        prospect_card.person_id AS prospect_person_id,
+        prospect_card.uuid AS prospect_uuid,
+        prospect_card.url_slug,
+        prospect_card.profile_photo_uuid,
+        prospect_card.profile_photo_blurhash,
+        prospect_card.name,
+        CASE
+            WHEN prospect_card.show_my_age
+            THEN EXTRACT(YEAR FROM AGE(prospect_card.date_of_birth))
+            ELSE NULL
+        END AS age,
+        result.match_percentage,
+        COALESCE(
+            messaged_result.person_messaged_prospect,
+            FALSE
+        ) AS person_messaged_prospect,
+        COALESCE(
+            messaged_result.prospect_messaged_person,
+            FALSE
+        ) AS prospect_messaged_person,
+        prospect_card.verification_level_id > 1 AS verified,
+        searcher.verification_level_id AS searcher_verification_level_id,
+        prospect_card.privacy_verification_level_id,
+        result.position
+    FROM
+        result
+    JOIN
+        prospect_card
+    ON
+        prospect_card.person_id = result.prospect_person_id
+    CROSS JOIN
+        searcher
+    LEFT JOIN
+        messaged_result
+    ON
+        messaged_result.prospect_person_id = result.prospect_person_id
+)
+SELECT
+    public_page.profile_photo_blurhash,
+    public_page.name,
+    public_page.age,
+    public_page.match_percentage,
+    public_page.person_messaged_prospect,
+    public_page.prospect_messaged_person,
+    public_page.verified,
+    public_page.verification_required_to_view,
+
+    private_page.prospect_person_id,
+    private_page.prospect_uuid,
+    private_page.url_slug,
+    private_page.profile_photo_uuid
+FROM
+    (
+        SELECT
+            *,
+
+            CASE
+                WHEN
+                    searcher_verification_level_id >=
+                    privacy_verification_level_id
+                THEN NULL
+                WHEN
+                    privacy_verification_level_id = 2
+                THEN 'basics'
+                WHEN
+                    privacy_verification_level_id = 3
+                THEN 'photos'
+            END AS verification_required_to_view
+        FROM
+            page
+    ) AS public_page
+LEFT JOIN
+    (
+        SELECT
+            *
+        FROM
+            page
+        WHERE
+            searcher_verification_level_id >= privacy_verification_level_id
+    ) AS private_page
+ON
+    private_page.prospect_person_id = public_page.prospect_person_id
+ORDER BY
+    public_page.position
+"""
+
+Q_PUBLIC_SEARCH = """
+SELECT
+    prospect.id AS prospect_person_id,
+
+    prospect.uuid AS prospect_uuid,
+
+    prospect.url_slug,
+
+    prospect.name,
 
     prospect.verification_level_id > 1 AS verified,
 
@@ -874,80 +1135,162 @@ OFFSET
     %(o)s
 """
 
-Q_QUIZ_SEARCH = f"""
+# The public profiles `search.publicindex` ranks by a visitor's answers. The
+# columns match `Q_PUBLIC_SEARCH_WITH_ANSWERS`, less `match_percentage`, which
+# the index computes, and plus `personality`, which it computes it from.
+Q_PUBLIC_SEARCH_INDEX = """
+SELECT
+    prospect.id AS prospect_person_id,
+
+    prospect.uuid AS prospect_uuid,
+
+    prospect.url_slug,
+
+    prospect.name,
+
+    prospect.verification_level_id > 1 AS verified,
+
+    (
+        SELECT
+            uuid
+        FROM
+            photo
+        WHERE
+            person_id = prospect.id
+        ORDER BY
+            position
+        LIMIT 1
+    ) AS profile_photo_uuid,
+
+    (
+        SELECT
+            blurhash
+        FROM
+            photo
+        WHERE
+            person_id = prospect.id
+        ORDER BY
+            position
+        LIMIT 1
+    ) AS profile_photo_blurhash,
+
+    CASE
+        WHEN prospect.show_my_age
+        THEN EXTRACT(YEAR FROM AGE(prospect.date_of_birth))
+        ELSE NULL
+    END AS age,
+
+    FALSE AS person_messaged_prospect,
+
+    FALSE AS prospect_messaged_person,
+
+    NULL AS verification_required_to_view,
+
+    prospect.personality::REAL[] AS personality
+FROM
+    person AS prospect
+WHERE
+    prospect.public_profile
+AND
+    prospect.activated
+AND
+    prospect.shadow_banned_at IS NULL
+AND ( -- Exclude users who should be verified but aren't
+        prospect.verification_level_id > 1
+    OR
+        NOT prospect.verification_required
+)
+AND
+    prospect.last_online_time > now() - interval '7 days'
+ORDER BY
+    prospect.id
+"""
+
+Q_PUBLIC_SEARCH_INDEX_QUESTIONS = """
+SELECT
+    id,
+    presence_given_yes,
+    presence_given_no,
+    absence_given_yes,
+    absence_given_no
+FROM
+    question
+ORDER BY
+    id
+"""
+
+Q_QUIZ_SEARCHER = """
+SELECT
+    person.personality::REAL[] AS personality,
+    person.count_answers,
+    search_cache.updated_at
+FROM
+    person
+LEFT JOIN
+    search_cache
+ON
+    search_cache.searcher_person_id = person.id
+WHERE
+    person.id = %(searcher_person_id)s
+"""
+
+
+Q_QUIZ_CACHED_PROSPECTS = """
+SELECT
+    search_cache.updated_at,
+    prospect.id AS prospect_person_id,
+    prospect.personality::REAL[] AS personality,
+    prospect.verification_level_id > 1 AS verified,
+    prospect.has_profile_picture_id = (
+        SELECT id FROM yes_no WHERE name = 'Yes'
+    ) AS has_profile_photo
+FROM
+    search_cache
+CROSS JOIN LATERAL
+    unnest(search_cache.prospect_person_ids)
+    WITH ORDINALITY AS result(prospect_person_id, position)
+JOIN
+    person AS prospect
+ON
+    prospect.id = result.prospect_person_id
+WHERE
+    search_cache.searcher_person_id = %(searcher_person_id)s
+ORDER BY
+    result.position
+"""
+
+
+# The best prospect is chosen by `search.quizrank`; this only looks them up
+Q_QUIZ_SEARCH = """
 WITH searcher AS (
     SELECT
-        personality,
-        count_answers
+        verification_level_id
     FROM
         person
     WHERE
         person.id = %(searcher_person_id)s
-), do_promote_verified AS (
-    SELECT
-        count(*) >= 250 AS x
-    FROM
-        search_cache,
-        searcher
-    WHERE
-        searcher_person_id = %(searcher_person_id)s
-    AND
-        profile_photo_uuid IS NOT NULL
-    AND
-        verified
-    AND
-        (SELECT count_answers > 0 FROM searcher)
 ), page AS (
     SELECT
-        prospect_person_id,
-        prospect_uuid,
-        (
-            SELECT url_slug FROM person WHERE id = prospect_person_id
-        ) AS url_slug,
-        profile_photo_uuid,
-        (
-            SELECT blurhash FROM photo WHERE profile_photo_uuid = photo.uuid
-        ) AS profile_photo_blurhash,
-        name,
-        age,
-        CLAMP(
-            0,
-            99,
-            100 * (1 - (personality <#> (SELECT personality FROM searcher))) / 2
-        )::SMALLINT AS match_percentage,
-        (
-            SELECT
-                verification_level_id
-            FROM
-                person
-            WHERE
-                id = %(searcher_person_id)s
-        ) AS searcher_verification_level_id,
-        (
-            SELECT
-                privacy_verification_level_id
-            FROM
-                person
-            WHERE
-                id = prospect_person_id
-        ) AS privacy_verification_level_id
+        prospect_card.person_id AS prospect_person_id,
+        prospect_card.uuid AS prospect_uuid,
+        prospect_card.url_slug,
+        prospect_card.profile_photo_uuid,
+        prospect_card.profile_photo_blurhash,
+        prospect_card.name,
+        CASE
+            WHEN prospect_card.show_my_age
+            THEN EXTRACT(YEAR FROM AGE(prospect_card.date_of_birth))
+            ELSE NULL
+        END AS age,
+        %(match_percentage)s::SMALLINT AS match_percentage,
+        searcher.verification_level_id AS searcher_verification_level_id,
+        prospect_card.privacy_verification_level_id
     FROM
-        search_cache
+        prospect_card
+    CROSS JOIN
+        searcher
     WHERE
-        searcher_person_id = %(searcher_person_id)s
-    ORDER BY
-        -- If this is changed, other subqueries will need changing too
-        CASE
-            WHEN (SELECT x FROM do_promote_verified)
-            THEN
-                profile_photo_uuid IS NOT NULL AND verified
-            ELSE
-                profile_photo_uuid IS NOT NULL
-        END DESC,
-
-        match_percentage DESC
-    LIMIT
-        1
+        prospect_card.person_id = %(prospect_person_id)s
 )
 SELECT
     public_page.profile_photo_blurhash,
@@ -1005,16 +1348,28 @@ WITH searcher AS (
         person
     WHERE
         person.id = %(searcher_person_id)s
-), recent_person AS (
+), recent_card AS (
+    -- People who were recently online are shown at the time they were last
+    -- online; everyone else, at the time of their last event. These are the
+    -- most recent of each.
     (
         SELECT
-            *
+            feed_card.person_id
         FROM
             person
+        JOIN
+            feed_card
+        ON
+            feed_card.person_id = person.id
         WHERE
-            last_online_time < %(before)s
+            person.last_online_time < %(before)s
+        AND
+            person.last_online_time
+            > now() - interval '{ONLINE_RECENTLY_SECONDS} seconds'
+        AND
+            feed_card.online_card IS NOT NULL
         ORDER BY
-            last_online_time DESC
+            person.last_online_time DESC
         LIMIT
             5000
     )
@@ -1023,9 +1378,9 @@ WITH searcher AS (
 
     (
         SELECT
-            *
+            person_id
         FROM
-            person
+            feed_card
         WHERE
             last_event_time < %(before)s
         ORDER BY
@@ -1033,19 +1388,48 @@ WITH searcher AS (
         LIMIT
             5000
     )
+), mapped_card AS (
+    SELECT
+        feed_card.person_id,
+        feed_card.last_event_time,
+        CASE
+            WHEN
+                feed_card.online_card IS NOT NULL
+            AND
+                person.last_online_time
+                > now() - interval '{ONLINE_RECENTLY_SECONDS} seconds'
+            THEN
+                person.last_online_time
+            ELSE
+                feed_card.last_event_time
+        END AS mapped_last_online_time,
+        CASE
+            WHEN
+                feed_card.online_card IS NOT NULL
+            AND
+                person.last_online_time
+                > now() - interval '{ONLINE_RECENTLY_SECONDS} seconds'
+            THEN
+                feed_card.online_card
+            ELSE
+                feed_card.event_card
+        END AS card
+    FROM
+        recent_card
+    JOIN
+        feed_card
+    ON
+        feed_card.person_id = recent_card.person_id
+    JOIN
+        person
+    ON
+        person.id = recent_card.person_id
 ), person_data AS (
     SELECT
         prospect.id,
-        prospect.uuid AS person_uuid,
-        prospect.url_slug,
-        prospect.name,
         prospect.gender_id,
-        photo_data.blurhash AS photo_blurhash,
-        photo_data.uuid AS photo_uuid,
-        prospect.verification_level_id > 1 AS is_verified,
-        mapped_last_online_time,
-        mapped_last_event_name,
-        mapped_last_event_data,
+        mapped_card.mapped_last_online_time,
+        mapped_card.card,
         CLAMP(
             0,
             99,
@@ -1053,141 +1437,27 @@ WITH searcher AS (
                 1 - (prospect.personality <#> searcher.personality)
             ) / 2
         )::SMALLINT AS match_percentage,
-        flair,
-        has_gold,
-        sign_up_time,
-        -- Ads have been removed; this is kept as a constant so existing native
-        -- clients (which validate this field) keep working without the DB
-        -- spending time computing it.
-        FALSE AS advertiser_friendly,
-        count_answers,
-        about,
+        prospect.flair,
+        prospect.has_gold,
+        prospect.sign_up_time,
+        prospect.count_answers,
+        prospect.about,
         (
             SELECT EXTRACT(YEAR FROM AGE(prospect.date_of_birth))
             WHERE prospect.show_my_age
-        ) AS age,
-        gender.name AS gender,
-        (
-            SELECT prospect.location_short_friendly
-            WHERE prospect.show_my_location
-        ) AS location
+        ) AS age
     FROM
-        recent_person AS prospect
+        mapped_card
     JOIN
-        gender
+        person AS prospect
     ON
-        gender.id = prospect.gender_id
-    LEFT JOIN LATERAL (
-        SELECT
-            photo.uuid,
-            photo.blurhash,
-            photo.nsfw_score
-        FROM
-            photo
-        WHERE
-            photo.person_id = prospect.id
-        ORDER BY
-            photo.position
-        LIMIT 1
-    ) AS photo_data
-    ON TRUE
-    LEFT JOIN LATERAL (
-        SELECT
-            photo.uuid,
-            photo.blurhash,
-            photo.nsfw_score,
-            photo.extra_exts
-        FROM
-            photo
-        WHERE
-            photo.person_id = prospect.id
-        ORDER BY
-            '{{}}'::TEXT[] = extra_exts,
-            photo.uuid = photo_data.uuid,
-            random()
-        LIMIT 1
-    ) AS added_photo_data
-    ON TRUE
-    LEFT JOIN LATERAL (
-        SELECT
-            prospect.last_online_time
-            > now() - interval '{ONLINE_RECENTLY_SECONDS} seconds'
-            AS was_recently_online
-    )
-    ON TRUE
-    LEFT JOIN LATERAL (
-        SELECT
-            CASE
-
-            WHEN was_recently_online AND last_event_name = 'added-photo'
-            THEN 'recently-online-with-photo'
-
-            WHEN was_recently_online AND last_event_name = 'added-voice-bio'
-            THEN 'recently-online-with-voice-bio'
-
-            WHEN was_recently_online AND last_event_name = 'updated-bio'
-            THEN 'recently-online-with-bio'
-
-            WHEN was_recently_online AND added_photo_data.uuid IS NOT NULL
-            THEN 'recently-online-with-photo'
-
-            WHEN last_event_name = 'recently-online-with-photo'
-            THEN 'added-photo'
-
-            WHEN last_event_name = 'recently-online-with-voice-bio'
-            THEN 'added-voice-bio'
-
-            WHEN last_event_name = 'recently-online-with-bio'
-            THEN 'updated-bio'
-
-            ELSE last_event_name
-
-            END::person_event AS mapped_last_event_name
-    ) AS mapped_last_event_name
-    ON TRUE
-    LEFT JOIN LATERAL (
-        SELECT
-            CASE
-                WHEN
-                    was_recently_online AND mapped_last_event_name <> 'joined'
-                THEN
-                    prospect.last_online_time
-                ELSE
-                    prospect.last_event_time
-            END AS mapped_last_online_time
-    ) AS mapped_last_online_time
-    ON TRUE
-    LEFT JOIN LATERAL (
-        SELECT
-            CASE
-
-            WHEN was_recently_online AND last_event_name = 'added-photo'
-            THEN last_event_data
-
-            WHEN was_recently_online AND last_event_name = 'added-voice-bio'
-            THEN last_event_data
-
-            WHEN was_recently_online AND last_event_name = 'updated-bio'
-            THEN last_event_data
-
-            WHEN was_recently_online AND added_photo_data.uuid IS NOT NULL
-            THEN jsonb_build_object(
-                'added_photo_uuid', added_photo_data.uuid,
-                'added_photo_blurhash', added_photo_data.blurhash,
-                'added_photo_extra_exts', added_photo_data.extra_exts
-            )
-
-            ELSE last_event_data
-
-            END::JSONB AS mapped_last_event_data
-    ) AS mapped_last_event_data
-    ON TRUE
+        prospect.id = mapped_card.person_id
     CROSS JOIN
         searcher
     WHERE
         mapped_last_online_time < %(before)s
     AND
-        last_event_time > now() - interval '1 month'
+        mapped_card.last_event_time > now() - interval '1 month'
     AND
         activated
     AND
@@ -1301,7 +1571,7 @@ WITH searcher AS (
         FROM
             photo
         WHERE
-            uuid = mapped_last_event_data->>'added_photo_uuid'
+            uuid = mapped_card.card->>'added_photo_uuid'
         AND
             photo.nsfw_score > 0.2
     )
@@ -1368,22 +1638,12 @@ WITH searcher AS (
         {FEED_RESULTS_PER_PAGE * FEED_SELECTIVITY}
 ), filtered_by_club AS (
     SELECT
-        person_uuid,
-        url_slug,
-        name,
-        photo_uuid,
-        photo_blurhash,
-        is_verified,
+        card,
         match_percentage,
-        mapped_last_event_name AS type,
         iso8601_utc(mapped_last_online_time) AS time,
         mapped_last_online_time AS last_event_time,
-        mapped_last_event_data,
         ({Q_COMPUTED_FLAIR}) AS flair,
-        age,
-        gender,
-        location,
-        advertiser_friendly
+        age
     FROM
         person_data,
         searcher
@@ -1404,22 +1664,12 @@ WITH searcher AS (
         (SELECT round(count(*)::real / {FEED_SELECTIVITY}) FROM person_data)
 )
 SELECT
-    jsonb_build_object(
-        'person_uuid', person_uuid,
-        'url_slug', url_slug,
-        'name', name,
-        'photo_uuid', photo_uuid,
-        'photo_blurhash', photo_blurhash,
-        'is_verified', is_verified,
+    card || jsonb_build_object(
         'time', time,
-        'type', type,
         'match_percentage', match_percentage,
         'flair', flair,
-        'age', age,
-        'gender', gender,
-        'location', location,
-        'advertiser_friendly', advertiser_friendly
-    ) || mapped_last_event_data AS j
+        'age', age
+    ) AS j
 FROM
     filtered_by_club
 ORDER BY
@@ -8,7 +8,7 @@ import qanda
 from qanda import question
 import search
 from auth import apple_oauth
-from database import api_tx
+from database import api_tx, pool_stats
 import psycopg
 from service.api.decorators import (
     app,
@@ -368,6 +368,13 @@ def get_public_search() -> object:
 def get_health() -> object:
     return 'status: ok'
 
+@get('/health/stats', limiter=limiter.exempt)
+def get_health_stats() -> object:
+    return dict(
+        database=pool_stats(),
+        search=search.search_stats(),
+    )
+
 @aget('/me')
 def get_me_by_session(s: t.SessionInfo) -> object:
     return person.get_me(person_id_as_int=s.person_id)
@@ -6,19 +6,21 @@ from database.asyncdatabase import (
     row_str_or_none,
 )
 import asyncio
-import duohash
-import regex
 import traceback
 import sys
 from websockets.exceptions import ConnectionClosedError
 import notify
 from async_lru_cache import AsyncLruCache
 import random
-from collections.abc import Iterable, Mapping
+from collections.abc import AsyncIterator, Iterable, Mapping
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from service.chat.robot9000 import Q_SELECT_INTRO_HASH, upsert_intro_hash
+from service.chat.robot9000 import (
+    INTRO_HASH_FILTER,
+    Q_SELECT_INTRO_HASH,
+    upsert_intro_hash,
+)
 from service.chat.mayberegister import register_push_token
-from service.chat.spam import is_spam_message
 from service.chat.upsertlastnotification import upsert_last_notification
 from service.chat.messagestorage.inbox import (
     get_inbox,
@@ -40,14 +42,16 @@ from service.chat.session import (
     maybe_get_session_response,
 )
 from service.chat.online import (
+    PresenceAggregator,
     maybe_redis_subscribe_online,
     maybe_redis_unsubscribe_online,
-    update_online_once,
-    update_online_forever,
 )
 from service.chat.ratelimit import (
-    maybe_fetch_rate_limit,
+    fetch_rate_limit_row,
+    pure_maybe_fetch_rate_limit,
+    record_intro,
 )
+from service.chat.sendauthorization import fetch_send_authorization
 from service.chat.chatutil import (
     fetch_is_skipped,
     fetch_is_shadow_banned,
@@ -101,6 +105,16 @@ from chatprotocol.outbound import (
 from service.chat.audiomessage import (
     transcode_and_put,
 )
+from service.chat.pubsub import (
+    Multiplexer,
+    Subscription,
+    SubscriptionOverflow,
+)
+from service.chat.authcache import AUTH_CACHE
+from service.chat.moderation import (
+    moderate_async,
+    start_moderation_processes,
+)
 import redis.asyncio as redis
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
@@ -113,7 +127,17 @@ from service.chat.verification import (
     verification_required,
 )
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Starts the worker's background work before it accepts any websockets"""
+    AUTH_CACHE.listen_for_invalidations(REDIS_MULTIPLEXER)
+
+    start_moderation_processes()
+
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Global publisher connection, created once per worker.
 REDIS_HOST: str = os.environ.get("DUO_REDIS_HOST", "redis")
@@ -123,27 +147,11 @@ REDIS_WORKER_CLIENT: redis.Redis = redis.Redis(
         port=REDIS_PORT,
         decode_responses=True)
 
-Q_HAS_MESSAGE = """
-SELECT
-    1
-FROM
-    messaged
-WHERE
-    subject_person_id = %(to_id)s AND object_person_id = %(from_id)s
-"""
+# Global subscriber connection, shared by every websocket on this worker.
+REDIS_MULTIPLEXER = Multiplexer(REDIS_WORKER_CLIENT)
 
-# Accounts are trusted after they've been around for a day. Verified accounts
-# are trusted a bit sooner.
-Q_IS_TRUSTED_ACCOUNT = """
-SELECT
-    1
-FROM
-    person
-WHERE
-    id = %(from_id)s
-AND
-    sign_up_time < now() - (interval '1 day') / power(verification_level_id, 2)
-"""
+# Marks everyone signed in to this worker as online, once per person
+PRESENCE = PresenceAggregator(REDIS_WORKER_CLIENT)
 
 Q_IMMEDIATE_DATA = """
 WITH to_notification AS (
@@ -215,40 +223,47 @@ WHERE
 
 MAX_MESSAGE_LEN = 5000
 
-NON_ALPHANUMERIC_RE = regex.compile(r'[^\p{L}\p{N}]')
-REPEATED_CHARACTERS_RE = regex.compile(r'(.)\1{1,}')
-
-
-async def redis_publish(channel: str, message: str) -> None:
-    await REDIS_WORKER_CLIENT.publish(channel, message)
-
 
 async def redis_publish_many(
     channel: str,
     messages: Iterable[Outbound],
 ) -> object | None:
-    for message in messages:
-        await redis_publish(channel, to_bus(message))
+    """
+    Publishes `messages` to `channel` in a single pipelined round trip. Redis
+    executes pipelined commands in order, so subscribers receive the messages
+    in the order given (e.g. every `MamResult` before the `MamFin`).
+    """
+    payloads = [to_bus(message) for message in messages]
+
+    if not payloads:
+        return None
+
+    if len(payloads) == 1:
+        await REDIS_WORKER_CLIENT.publish(channel, payloads[0])
+        return None
+
+    async with REDIS_WORKER_CLIENT.pipeline(transaction=False) as pipe:
+        for payload in payloads:
+            pipe.publish(channel, payload)
+        await pipe.execute()
+
     return None
 
 
 async def redis_forward_to_websocket(
-    pubsub: redis.client.PubSub,
+    pubsub: Subscription,
     subprotocol: str,
     websocket: WebSocket
 ) -> None:
     """
-    Listens on the Redis subscription channel and forwards any messages to the
-    connected websocket client, rendering each protocol-neutral bus payload to
-    the connection's wire format (JSON or XML).
+    Listens on the connection's Redis subscriptions and forwards any messages to
+    the connected websocket client, rendering each protocol-neutral bus payload
+    to the connection's wire format (JSON or XML).
     """
     try:
-        async for message in pubsub.listen():
-            if message is None or message.get("type") != "message":
-                continue
-
+        async for data in pubsub.listen():
             try:
-                outbound = from_bus(message['data'])
+                outbound = from_bus(data)
                 data = (
                     outbound.to_json()
                     if subprotocol == 'json'
@@ -257,6 +272,13 @@ async def redis_forward_to_websocket(
                 continue
 
             await websocket.send_text(data)
+    except SubscriptionOverflow:
+        # The client isn't keeping up. Closing the websocket makes the
+        # handler's `receive_text` raise, which closes the subscription.
+        try:
+            await websocket.close(code=1013)  # Try Again Later
+        except:
+            pass
     except asyncio.CancelledError:
         raise
     except:
@@ -302,18 +324,6 @@ async def send_notification(
     upsert_last_notification(username=to_username, is_intro=is_intro)
 
 
-def normalize_message(message_str: str) -> str:
-    message_str = message_str.lower()
-
-    # Remove everything but non-alphanumeric characters
-    message_str = NON_ALPHANUMERIC_RE.sub('', message_str)
-
-    # Remove repeated characters
-    message_str = REPEATED_CHARACTERS_RE.sub(r'\1', message_str)
-
-    return message_str
-
-
 def is_text_too_long(message: Message) -> bool:
     if isinstance(message, ChatMessage):
         return len(message.body) > MAX_MESSAGE_LEN
@@ -353,16 +363,11 @@ def _positive_count(count: object) -> bool:
 
 
 @AsyncLruCache(ttl=1, cache_condition=_positive_count)
-async def intro_use_count(message: Message) -> int:
-    if isinstance(message, AudioMessage):
+async def intro_use_count(hashed: str) -> int:
+    if not INTRO_HASH_FILTER.might_contain(hashed):
+        upsert_intro_hash(hashed)
         return 0
 
-    if isinstance(message, TypingMessage):
-        return 0
-
-    normalized = normalize_message(message.body)
-    hashed = duohash.md5(normalized)
-
     params = dict(hash=hashed)
 
     async with api_tx('read committed') as tx:
@@ -373,24 +378,6 @@ async def intro_use_count(message: Message) -> int:
 
     return row['used_count'] if row is not None else 0
 
-@AsyncLruCache(cache_condition=lambda x: not x)
-async def fetch_is_intro(from_id: int, to_id: int) -> bool:
-    async with api_tx('read committed') as tx:
-        await tx.execute(Q_HAS_MESSAGE, dict(from_id=from_id, to_id=to_id))
-        row = await tx.fetchone()
-
-    return not bool(row)
-
-@AsyncLruCache(ttl=5)  # 5 seconds
-async def fetch_is_trusted_account(from_id: int) -> bool:
-    async with api_tx('read committed') as tx:
-        await tx.execute(
-                Q_IS_TRUSTED_ACCOUNT,
-                dict(from_id=from_id))
-        row = await tx.fetchone()
-
-    return bool(row)
-
 @AsyncLruCache(ttl=2 * 60)  # 2 minutes
 async def fetch_push_tokens(username: str) -> list[str]:
     async with api_tx('read committed') as tx:
@@ -417,6 +404,7 @@ async def fetch_immediate_data(
 async def _chat_interaction_blocked(
     from_id: int,
     to_id: int,
+    is_verification_required: bool,
 ) -> tuple[bool, str | None]:
     """
     Whether `from_id` may not currently interact with `to_id` (whether sending a
@@ -424,8 +412,10 @@ async def _chat_interaction_blocked(
     client-facing `MessageBlocked` reason (None for a generic block) and is only
     meaningful when `blocked` is True. Each caller renders its own stanza
     (`MessageBlocked` or `ReactionBlocked`); only the gating rules are shared.
+    Callers fetch `is_verification_required` themselves, because sending a
+    message fetches it along with the send path's other flags.
     """
-    if await verification_required(person_id=from_id):
+    if is_verification_required:
         return True, 'age-verification'
 
     if await fetch_is_skipped(from_id=from_id, to_id=to_id):
@@ -464,6 +454,8 @@ async def _handle_reaction(
     is_blocked, _ = await _chat_interaction_blocked(
         from_id=from_id,
         to_id=partner_id,
+        is_verification_required=await verification_required(
+            person_id=from_id),
     )
     if is_blocked:
         return await reject()
@@ -502,7 +494,7 @@ async def _handle_reaction(
 async def process_text(
     session: Session,
     protocol: str,
-    pubsub: redis.client.PubSub,
+    pubsub: Subscription,
     text: str
 ) -> object | None:
     from_username = session.username
@@ -560,7 +552,7 @@ async def process_text(
     if isinstance(parsed, InboxQuery):
         return await redis_publish_many(
                 connection_uuid,
-                await get_inbox(parsed.query_id, from_username))
+                await get_inbox(parsed, from_username))
 
     if isinstance(parsed, VisitorsQuery):
         return await redis_publish_many(
@@ -634,9 +626,15 @@ async def process_text(
     # so their conversation history persists when they navigate back to it.
     is_shadow_banned = await fetch_is_shadow_banned(from_id)
 
+    authorization = await fetch_send_authorization(from_id=from_id, to_id=to_id)
+
+    if authorization is None:
+        return None
+
     is_blocked, block_reason = await _chat_interaction_blocked(
         from_id=from_id,
         to_id=to_id,
+        is_verification_required=authorization.is_verification_required,
     )
     if is_blocked:
         return await redis_publish_many(connection_uuid, [
@@ -661,26 +659,41 @@ async def process_text(
             MessageTooLong(stanza_id=stanza_id)
         ])
 
-    is_intro = await fetch_is_intro(from_id=from_id, to_id=to_id)
+    is_intro = authorization.is_intro
+
+    moderation = (
+        await moderate_async(maybe_message.body)
+        if is_intro and isinstance(maybe_message, ChatMessage)
+        else None
+    )
 
     if \
-            is_intro and \
-            is_spam_message(maybe_message) and \
-            not await fetch_is_trusted_account(from_id=from_id):
+            moderation is not None and \
+            moderation.is_spam and \
+            not authorization.is_trusted_account:
         return await redis_publish_many(connection_uuid, [
             MessageBlocked(stanza_id=stanza_id, reason='spam')
         ])
 
     if is_intro:
-        maybe_rate_limit = await maybe_fetch_rate_limit(
-                from_id=from_id,
+        rate_limit_row = await fetch_rate_limit_row(
+                redis_client=REDIS_WORKER_CLIENT,
+                person_id=from_id,
+                verification_level_id=authorization.verification_level_id)
+
+        maybe_rate_limit = pure_maybe_fetch_rate_limit(
+                rate_limit_row,
                 stanza_id=stanza_id)
 
         if maybe_rate_limit:
             return await redis_publish_many(connection_uuid, maybe_rate_limit)
 
-    used_count = await intro_use_count(maybe_message) if is_intro else 0
-    if is_intro and used_count > 0:
+    used_count = (
+        await intro_use_count(moderation.intro_hash)
+        if moderation is not None
+        else 0
+    )
+    if used_count > 0:
         return await redis_publish_many(connection_uuid, [
             MessageNotUnique(
                 stanza_id=stanza_id,
@@ -707,6 +720,12 @@ async def process_text(
             ])
             return None
 
+        if is_intro and authorization.is_first_message:
+            await record_intro(
+                redis_client=REDIS_WORKER_CLIENT,
+                from_id=from_id,
+                to_id=to_id)
+
         audio_uuid = (
                 maybe_message.audio_uuid
                 if isinstance(maybe_message, AudioMessage)
@@ -796,20 +815,13 @@ async def process_websocket_messages(websocket: WebSocket) -> None:
 
     session = Session()
 
-    redis_websocket_client: redis.Redis = redis.Redis(
-            host=REDIS_HOST,
-            port=REDIS_PORT,
-            decode_responses=True)
-
-    pubsub = redis_websocket_client.pubsub()
+    pubsub = REDIS_MULTIPLEXER.subscription()
 
     await pubsub.subscribe(session.connection_uuid)
 
     # asyncio.create_task requires some manual memory management!
     # https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
     # https://github.com/python/cpython/issues/91887
-    update_online_task = None
-
     redis_forward_to_websocket_task = asyncio.create_task(
             redis_forward_to_websocket(pubsub, subprotocol, websocket))
 
@@ -826,15 +838,8 @@ async def process_websocket_messages(websocket: WebSocket) -> None:
                         pubsub=pubsub,
                         text=text))
 
-            if not update_online_task and session.username:
-                update_online_task = asyncio.create_task(
-                    update_online_forever(
-                        redis_client=REDIS_WORKER_CLIENT,
-                        session=session,
-                        online=True
-                    )
-                )
-
+            if session.username:
+                PRESENCE.connect(session)
 
             if not is_subscribed_by_username and session.username:
                 await pubsub.subscribe(session.username)
@@ -850,22 +855,7 @@ async def process_websocket_messages(websocket: WebSocket) -> None:
         )
         print(traceback.format_exc())
     finally:
-        if update_online_task:
-            update_online_task.cancel()
-
-            try:
-                await update_online_task
-            except asyncio.CancelledError:
-                pass
-
-            try:
-                await update_online_once(
-                    redis_client=REDIS_WORKER_CLIENT,
-                    session=session,
-                    online=False,
-                )
-            except asyncio.CancelledError:
-                pass
+        PRESENCE.disconnect(session)
 
         if redis_forward_to_websocket_task:
             redis_forward_to_websocket_task.cancel()
@@ -875,4 +865,3 @@ async def process_websocket_messages(websocket: WebSocket) -> None:
                 pass
 
         await pubsub.close()
-        await redis_websocket_client.close()
@@ -0,0 +1,170 @@
+"""
+The chat worker's half of the authorization cache described in
+`chatauthcache`: an LRU in front of the entries in Redis which every chat
+worker shares.
+
+A lookup checks the worker's LRU, then Redis, then calls the function which
+queries Postgres, writing the answer back to both tiers. Answers are stored as
+JSON, so `None` can be cached too. The answer is only written to Redis if the
+key wasn't invalidated while Postgres was being queried (see `chatauthcache`).
+
+The worker listens for the keys which the API publishes when it changes the
+rows behind them, and evicts them from its LRU. Pub/sub messages published
+while the worker is reconnecting to Redis are lost, so the LRU's entries also
+expire after `CHAT_AUTH_LOCAL_TTL_SECONDS`, after which the worker rereads
+them from Redis.
+"""
+
+import asyncio
+import json
+import os
+import time
+import traceback
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import TypeVar, cast
+
+import redis.asyncio as redis
+
+from chatauthcache import (
+    CHAT_AUTH_CACHE_TTL_SECONDS,
+    INVALIDATION_CHANNEL,
+    SET_IF_VERSION_UNCHANGED,
+    version_key,
+)
+from redisclient import REDIS_HOST, REDIS_PORT
+from service.chat.pubsub import Multiplexer
+
+
+CHAT_AUTH_LOCAL_TTL_SECONDS = float(os.environ.get(
+    'DUO_CHAT_AUTH_LOCAL_TTL_SECONDS',
+    str(60),
+))
+
+T = TypeVar('T')
+
+
+class AuthCache:
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        maxsize: int = 8192,
+        local_ttl: float = CHAT_AUTH_LOCAL_TTL_SECONDS,
+        shared_ttl: int = CHAT_AUTH_CACHE_TTL_SECONDS,
+    ) -> None:
+        self._redis_client = redis_client
+        self._maxsize = maxsize
+        self._local_ttl = local_ttl
+        self._shared_ttl = shared_ttl
+
+        # key -> (expiry time, value)
+        self._local: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+        # Counts evictions, so that an answer read from Postgres before an
+        # eviction and returned after it isn't cached
+        self._evictions = 0
+
+        self._listener_task: asyncio.Task[None] | None = None
+
+    async def get(self, key: str, fetch: Callable[[], Awaitable[T]]) -> T:
+        now = time.monotonic()
+
+        entry = self._local.get(key)
+        if entry is not None and entry[0] > now:
+            self._local.move_to_end(key)  # Mark as recently used
+            return cast(T, entry[1])
+
+        evictions = self._evictions
+
+        try:
+            cached, version = await self._redis_client.mget(
+                key,
+                version_key(key),
+            )
+        except Exception:
+            cached, version = None, None
+
+        if cached is not None:
+            value = cast(T, json.loads(cached))
+        else:
+            value = await fetch()
+
+            if evictions == self._evictions:
+                try:
+                    await self._redis_client.eval(
+                        SET_IF_VERSION_UNCHANGED,
+                        2,
+                        key,
+                        version_key(key),
+                        version or '',
+                        json.dumps(value),
+                        self._shared_ttl,
+                    )
+                except Exception:
+                    pass
+
+        if evictions == self._evictions:
+            self._local[key] = (now + self._local_ttl, value)
+            self._local.move_to_end(key)
+
+            if len(self._local) > self._maxsize:
+                self._local.popitem(last=False)
+
+        return value
+
+    def evict(self, *keys: str) -> None:
+        self._evictions += 1
+
+        for key in keys:
+            self._local.pop(key, None)
+
+    def listen_for_invalidations(self, multiplexer: Multiplexer) -> None:
+        """
+        Starts evicting the keys which the API invalidates, unless that's
+        already happening
+        """
+        if self._listener_task is not None and not self._listener_task.done():
+            return
+
+        # asyncio.create_task requires some manual memory management!
+        # https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
+        self._listener_task = asyncio.create_task(
+            self._listen_forever(multiplexer))
+
+    async def _listen_forever(self, multiplexer: Multiplexer) -> None:
+        while True:
+            try:
+                await self._listen(multiplexer)
+            except asyncio.CancelledError:
+                raise
+            except:
+                print(traceback.format_exc())
+
+            # Invalidations published while the subscription was down were
+            # missed, so nothing cached before then can be trusted
+            self.evict(*list(self._local))
+
+            await asyncio.sleep(1)
+
+    async def _listen(self, multiplexer: Multiplexer) -> None:
+        subscription = multiplexer.subscription()
+
+        try:
+            await subscription.subscribe(INVALIDATION_CHANNEL)
+
+            async for data in subscription.listen():
+                try:
+                    self.evict(*json.loads(data))
+                except:
+                    print(traceback.format_exc())
+        finally:
+            await subscription.close()
+
+
+AUTH_CACHE = AuthCache(
+    redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        decode_responses=True,
+    ),
+)
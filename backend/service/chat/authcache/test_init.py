@@ -0,0 +1,128 @@
+import asyncio
+import json
+import unittest
+from collections.abc import AsyncIterator
+from unittest.mock import AsyncMock, MagicMock, patch
+from chatauthcache import skipped_key, version_key
+from service.chat.authcache import AuthCache
+from service.chat.pubsub import SubscriptionOverflow
+
+
+class TestAuthCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis_client = AsyncMock()
+        self.redis_client.mget.return_value = [None, None]
+
+        self.cache = AuthCache(self.redis_client, maxsize=2)
+
+        self.call_count = 0
+
+    async def _fetch(self) -> int | None:
+        self.call_count += 1
+        return None
+
+    async def test_misses_fill_both_tiers(self) -> None:
+        self.assertIsNone(await self.cache.get('key', self._fetch))
+        self.assertIsNone(await self.cache.get('key', self._fetch))
+
+        self.assertEqual(self.call_count, 1)
+        self.redis_client.mget.assert_awaited_once_with('key', version_key('key'))
+        self.redis_client.eval.assert_awaited_once()
+        self.assertEqual(
+            self.redis_client.eval.call_args.args[2:6],
+            ('key', version_key('key'), '', 'null'))
+
+    async def test_shared_tier_is_read_before_the_database(self) -> None:
+        self.redis_client.mget.return_value = [json.dumps(7), None]
+
+        self.assertEqual(await self.cache.get('key', self._fetch), 7)
+
+        self.assertEqual(self.call_count, 0)
+        self.redis_client.eval.assert_not_awaited()
+
+    async def test_writes_are_conditional_on_the_version_read(self) -> None:
+        self.redis_client.mget.return_value = [None, '3']
+
+        await self.cache.get('key', self._fetch)
+
+        self.assertEqual(self.redis_client.eval.call_args.args[4], '3')
+
+    async def test_redis_errors_fall_back_to_the_database(self) -> None:
+        self.redis_client.mget.side_effect = ConnectionError()
+        self.redis_client.eval.side_effect = ConnectionError()
+
+        self.assertIsNone(await self.cache.get('key', self._fetch))
+        self.assertEqual(self.call_count, 1)
+
+    async def test_evicted_keys_are_refetched(self) -> None:
+        await self.cache.get('key', self._fetch)
+        self.cache.evict('key')
+        await self.cache.get('key', self._fetch)
+
+        self.assertEqual(self.call_count, 2)
+
+    async def test_answers_fetched_during_an_eviction_are_not_cached(self) -> None:
+        async def fetch() -> bool:
+            self.cache.evict('key')
+            return True
+
+        self.assertTrue(await self.cache.get('key', fetch))
+
+        self.redis_client.eval.assert_not_awaited()
+        self.assertIsNone(await self.cache.get('key', self._fetch))
+
+    async def test_listener_resubscribes_after_an_error(self) -> None:
+        await self.cache.get('cached', self._fetch)
+
+        resubscribed = asyncio.Event()
+
+        async def overflowing() -> AsyncIterator[str]:
+            raise SubscriptionOverflow()
+            yield
+
+        async def invalidating() -> AsyncIterator[str]:
+            yield json.dumps(['invalidated'])
+            resubscribed.set()
+            await asyncio.Event().wait()
+
+        subscriptions = [AsyncMock(), AsyncMock()]
+        subscriptions[0].listen = overflowing
+        subscriptions[1].listen = invalidating
+
+        multiplexer = MagicMock()
+        multiplexer.subscription.side_effect = subscriptions
+
+        with patch('service.chat.authcache.asyncio.sleep', AsyncMock()):
+            self.cache.listen_for_invalidations(multiplexer)
+            await asyncio.wait_for(resubscribed.wait(), timeout=1)
+
+        subscriptions[0].close.assert_awaited_once()
+        subscriptions[1].subscribe.assert_awaited_once()
+
+        # Anything cached before the subscription dropped is refetched
+        await self.cache.get('cached', self._fetch)
+        self.assertEqual(self.call_count, 2)
+
+        assert self.cache._listener_task is not None
+        self.cache._listener_task.cancel()
+
+    async def test_least_recently_used_key_is_dropped(self) -> None:
+        await self.cache.get('a', self._fetch)
+        await self.cache.get('b', self._fetch)
+        await self.cache.get('a', self._fetch)
+        await self.cache.get('c', self._fetch)
+
+        self.redis_client.mget.reset_mock()
+
+        await self.cache.get('a', self._fetch)
+        await self.cache.get('b', self._fetch)
+
+        self.redis_client.mget.assert_awaited_once_with('b', version_key('b'))
+
+    def test_skipped_key_is_symmetric(self) -> None:
+        self.assertEqual(skipped_key(1, 2), skipped_key(2, 1))
+        self.assertNotEqual(skipped_key(1, 2), skipped_key(1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,12 @@
-from async_lru_cache import AsyncLruCache
+from chatauthcache import (
+    gold_key,
+    person_id_key,
+    public_key,
+    shadow_banned_key,
+    skipped_key,
+)
 from database.asyncdatabase import api_tx
+from service.chat.authcache import AUTH_CACHE
 
 # Re-exported from the dependency-light module so existing
 # `from service.chat.chatutil import ...` imports keep working.
@@ -47,46 +54,56 @@ SELECT public_profile FROM person WHERE id = %(person_id)s
 """
 
 
-@AsyncLruCache(ttl=5)  # 5 seconds
 async def fetch_is_skipped(from_id: int, to_id: int) -> bool:
-    async with api_tx('read committed') as tx:
-        await tx.execute(Q_IS_SKIPPED, dict(from_id=from_id, to_id=to_id))
-        row = await tx.fetchone()
+    async def fetch() -> bool:
+        async with api_tx('read committed') as tx:
+            await tx.execute(Q_IS_SKIPPED, dict(from_id=from_id, to_id=to_id))
+            row = await tx.fetchone()
+
+        return bool(row)
 
-    return bool(row)
+    return await AUTH_CACHE.get(skipped_key(from_id, to_id), fetch)
 
 
-@AsyncLruCache()
 async def fetch_id_from_username(username: str) -> int | None:
-    async with api_tx('read committed') as tx:
-        await tx.execute(Q_FETCH_PERSON_ID, dict(username=username))
-        row = await tx.fetchone()
+    async def fetch() -> int | None:
+        async with api_tx('read committed') as tx:
+            await tx.execute(Q_FETCH_PERSON_ID, dict(username=username))
+            row = await tx.fetchone()
+
+        return row.get('id') if row else None
 
-    return row.get('id') if row else None
+    return await AUTH_CACHE.get(person_id_key(username), fetch)
 
 
-@AsyncLruCache(ttl=5)  # 5 seconds
 async def fetch_is_shadow_banned(person_id: int) -> bool:
-    async with api_tx('read committed') as tx:
-        await tx.execute(Q_FETCH_IS_SHADOW_BANNED, dict(person_id=person_id))
-        row = await tx.fetchone()
+    async def fetch() -> bool:
+        async with api_tx('read committed') as tx:
+            await tx.execute(Q_FETCH_IS_SHADOW_BANNED, dict(person_id=person_id))
+            row = await tx.fetchone()
 
-    return bool(row and row.get('shadow_banned_at'))
+        return bool(row and row.get('shadow_banned_at'))
+
+    return await AUTH_CACHE.get(shadow_banned_key(person_id), fetch)
 
 
-@AsyncLruCache(ttl=5)  # 5 seconds
 async def fetch_is_public(person_id: int) -> bool:
-    async with api_tx('read committed') as tx:
-        await tx.execute(Q_FETCH_IS_PUBLIC, dict(person_id=person_id))
-        row = await tx.fetchone()
+    async def fetch() -> bool:
+        async with api_tx('read committed') as tx:
+            await tx.execute(Q_FETCH_IS_PUBLIC, dict(person_id=person_id))
+            row = await tx.fetchone()
+
+        return bool(row and row.get('public_profile'))
 
-    return bool(row and row.get('public_profile'))
+    return await AUTH_CACHE.get(public_key(person_id), fetch)
 
 
-@AsyncLruCache(ttl=60)  # 60 seconds
 async def fetch_has_gold(username: str) -> bool:
-    async with api_tx('read committed') as tx:
-        await tx.execute(Q_FETCH_HAS_GOLD, dict(username=username))
-        row = await tx.fetchone()
+    async def fetch() -> bool:
+        async with api_tx('read committed') as tx:
+            await tx.execute(Q_FETCH_HAS_GOLD, dict(username=username))
+            row = await tx.fetchone()
+
+        return bool(row and row.get('has_gold'))
 
-    return bool(row and row.get('has_gold'))
+    return await AUTH_CACHE.get(gold_key(username), fetch)
@@ -8,8 +8,8 @@ from service.chat.messagestorage.mam import (
 from service.chat.messagestorage.setmessaged import (
         process_set_messaged_batch,
         SetMessagedJob)
-from batcher import Batcher
-from database import api_tx
+from batcher import AsyncBatcher
+from database.asyncdatabase import api_tx
 from chatprotocol.timestamp import now_microseconds
 from chatprotocol.message import AudioMessage, ChatMessage
 from typing import Awaitable, Callable
@@ -42,6 +42,8 @@ def store_message(
             timestamp_microseconds=timestamp_microseconds,
             from_username=from_username,
             to_username=to_username,
+            from_id=from_id,
+            to_id=to_id,
             id=msg_id,
             message_body=message.body,
             audio_uuid=(
@@ -67,7 +69,7 @@ def store_message(
     _store_message_batcher.enqueue(job, callback)
 
 
-def _process_store_message_batch(batch: list[StoreMessageJob]) -> None:
+async def _process_store_message_batch(batch: list[StoreMessageJob]) -> None:
     store_mam_message_jobs = [
             job.store_mam_message_job
             for job in batch]
@@ -80,13 +82,13 @@ def _process_store_message_batch(batch: list[StoreMessageJob]) -> None:
             job.messaged_job
             for job in batch]
 
-    with api_tx('read committed') as tx:
-        process_store_mam_message_batch(tx, store_mam_message_jobs)
-        process_upsert_conversation_batch(tx, upsert_conversation_jobs)
-        process_set_messaged_batch(tx, messaged_jobs)
+    async with api_tx('read committed', priority='low') as tx:
+        await process_store_mam_message_batch(tx, store_mam_message_jobs)
+        await process_upsert_conversation_batch(tx, upsert_conversation_jobs)
+        await process_set_messaged_batch(tx, messaged_jobs)
 
 
-_store_message_batcher = Batcher[StoreMessageJob](
+_store_message_batcher = AsyncBatcher[StoreMessageJob](
     process_fn=_process_store_message_batch,
     flush_interval=0.5,
     min_batch_size=1,
@@ -0,0 +1,293 @@
+"""
+Times writing a batch of chat messages with the bulk statements used by
+`_process_store_message_batch`, against the per-message `executemany`
+statements they replaced. Each run is rolled back, so nothing is stored. Needs
+a database with at least two people in it:
+
+    python3 -m service.chat.messagestorage.benchmark [batch_size]
+"""
+
+import asyncio
+import random
+import sys
+import time
+from typing import Awaitable, Callable
+import psycopg
+from database.asyncdatabase import Tx, api_tx
+from chatprotocol.timestamp import now_microseconds
+from service.chat.chatutil import LSERVER
+from service.chat.messagestorage.inbox import (
+    UpsertConversationJob,
+    process_upsert_conversation_batch,
+)
+from service.chat.messagestorage.mam import (
+    StoreMamMessageJob,
+    microseconds_to_mam_message_id,
+    process_store_mam_message_batch,
+)
+from service.chat.messagestorage.setmessaged import (
+    SetMessagedJob,
+    process_set_messaged_batch,
+)
+from service.chat.messagestorage import StoreMessageJob
+
+
+_REPETITIONS = 5
+
+
+# The per-message statements which the bulk statements replaced
+_Q_INSERT_MESSAGE = """
+INSERT INTO
+    mam_message (
+        id,
+        from_jid,
+        remote_bare_jid,
+        direction,
+        audio_uuid,
+        body,
+        stanza_id,
+        person_id
+    )
+-- The sender's archive copy (direction 'O') is always stored. The recipient's
+-- copy (direction 'I') is skipped when %(deliver_to_recipient)s is false (the
+-- sender is shadow-banned), so the message never lands in the recipient's
+-- archive.
+SELECT
+    %(id)s::BIGINT,
+    '', -- from_jid is ignored
+    %(to_username)s,
+    'O'::mam_direction,
+    %(audio_uuid)s,
+    %(body)s,
+    %(stanza_id)s,
+    (SELECT id FROM person WHERE uuid = uuid_or_null(%(from_username)s))
+UNION ALL
+SELECT
+    %(id)s::BIGINT + 1,
+    '', -- from_jid is ignored
+    %(from_username)s,
+    'I'::mam_direction,
+    %(audio_uuid)s,
+    %(body)s,
+    %(stanza_id)s,
+    (SELECT id FROM person WHERE uuid = uuid_or_null(%(to_username)s))
+WHERE
+    %(deliver_to_recipient)s::BOOLEAN
+"""
+
+
+_Q_UPSERT_CONVERSATION = """
+WITH upsert_sender AS (
+    INSERT INTO inbox (
+        luser,
+        remote_bare_jid,
+        msg_id,
+        box,
+        body,
+        direction,
+        timestamp,
+        unread_count
+    )
+    VALUES (
+        %(from_username)s,
+        %(recipient_jid)s,
+        %(msg_id)s,
+        'chats',
+        %(body)s,
+        -- The sender's own copy: remote_bare_jid is the recipient (the To), so
+        -- the message is outgoing.
+        'O'::mam_direction,
+        EXTRACT(EPOCH FROM NOW()) * 1e6,
+        0
+    )
+    ON CONFLICT (luser, remote_bare_jid)
+    DO UPDATE SET
+        msg_id = EXCLUDED.msg_id,
+        box = 'chats',
+        body = EXCLUDED.body,
+        direction = EXCLUDED.direction,
+        timestamp = EXCLUDED.timestamp,
+        unread_count = 0
+), upsert_recipient AS (
+    -- Skipped (the SELECT returns no rows) when %(deliver_to_recipient)s is
+    -- false -- i.e. the sender is shadow-banned -- so the recipient's inbox
+    -- never gains an entry or unread count, and the notification cron (which
+    -- reads `inbox`) never sees it. The sender's own row above is still written.
+    INSERT INTO inbox (
+        luser,
+        remote_bare_jid,
+        msg_id,
+        box,
+        body,
+        direction,
+        timestamp,
+        unread_count
+    )
+    SELECT
+        %(to_username)s,
+        %(sender_jid)s,
+        %(msg_id)s,
+        'inbox',
+        %(body)s,
+        -- The recipient's copy: remote_bare_jid is the sender (the From), so
+        -- the message is incoming.
+        'I'::mam_direction,
+        EXTRACT(EPOCH FROM NOW()) * 1e6,
+        1
+    WHERE
+        %(deliver_to_recipient)s::BOOLEAN
+    ON CONFLICT (luser, remote_bare_jid)
+    DO UPDATE SET
+        msg_id = EXCLUDED.msg_id,
+        box = 'chats',
+        body = EXCLUDED.body,
+        direction = EXCLUDED.direction,
+        timestamp = EXCLUDED.timestamp,
+        unread_count = COALESCE(inbox.unread_count, 0) + 1
+)
+SELECT 1
+"""
+
+
+_Q_SET_MESSAGED = """
+INSERT INTO messaged (
+    subject_person_id,
+    object_person_id
+) VALUES (
+    %(from_id)s,
+    %(to_id)s
+) ON CONFLICT DO NOTHING
+"""
+
+
+Q_SELECT_PEOPLE = """
+SELECT
+    id,
+    uuid::TEXT AS uuid
+FROM
+    person
+ORDER BY
+    random()
+LIMIT
+    100
+"""
+
+
+async def _batch(tx: Tx, batch_size: int) -> list[StoreMessageJob]:
+    await tx.execute(Q_SELECT_PEOPLE)
+    people = [(row['id'], row['uuid']) for row in await tx.fetchall()]
+
+    if len(people) < 2:
+        raise Exception('The benchmark needs at least two people')
+
+    timestamp_microseconds = now_microseconds()
+
+    def job(i: int) -> StoreMessageJob:
+        (from_id, from_username), (to_id, to_username) = random.sample(people, 2)
+        msg_id = f'benchmark-{i}'
+        body = f'Benchmark message {i}'
+
+        return StoreMessageJob(
+            store_mam_message_job=StoreMamMessageJob(
+                timestamp_microseconds=timestamp_microseconds + i,
+                from_username=from_username,
+                to_username=to_username,
+                from_id=from_id,
+                to_id=to_id,
+                id=msg_id,
+                message_body=body,
+                audio_uuid=None,
+            ),
+            upsert_conversation_job=UpsertConversationJob(
+                from_username=from_username,
+                to_username=to_username,
+                msg_id=msg_id,
+                body=body,
+            ),
+            messaged_job=SetMessagedJob(from_id=from_id, to_id=to_id),
+        )
+
+    return [job(i) for i in range(batch_size)]
+
+
+async def _store_per_message(tx: Tx, batch: list[StoreMessageJob]) -> None:
+    await tx.executemany(_Q_INSERT_MESSAGE, [
+        dict(
+            id=microseconds_to_mam_message_id(m.timestamp_microseconds),
+            to_username=m.to_username,
+            from_username=m.from_username,
+            audio_uuid=m.audio_uuid,
+            body=m.message_body,
+            stanza_id=m.id,
+            deliver_to_recipient=m.deliver_to_recipient,
+        )
+        for m in (job.store_mam_message_job for job in batch)
+    ])
+
+    await tx.executemany(_Q_UPSERT_CONVERSATION, [
+        dict(
+            from_username=c.from_username,
+            to_username=c.to_username,
+            sender_jid=f"{c.from_username}@{LSERVER}",
+            recipient_jid=f"{c.to_username}@{LSERVER}",
+            msg_id=c.msg_id,
+            body=c.body,
+            deliver_to_recipient=c.deliver_to_recipient,
+        )
+        for c in (job.upsert_conversation_job for job in batch)
+    ])
+
+    await tx.executemany(_Q_SET_MESSAGED, [
+        dict(from_id=m.from_id, to_id=m.to_id)
+        for m in set(job.messaged_job for job in batch)
+    ])
+
+
+async def _store_in_bulk(tx: Tx, batch: list[StoreMessageJob]) -> None:
+    await process_store_mam_message_batch(
+            tx, [job.store_mam_message_job for job in batch])
+    await process_upsert_conversation_batch(
+            tx, [job.upsert_conversation_job for job in batch])
+    await process_set_messaged_batch(
+            tx, [job.messaged_job for job in batch])
+
+
+async def _seconds_per_batch(
+    tx: Tx,
+    batch: list[StoreMessageJob],
+    store: Callable[[Tx, list[StoreMessageJob]], Awaitable[None]],
+) -> float:
+    elapsed = 0.0
+
+    for _ in range(_REPETITIONS):
+        async with tx.connection.transaction():
+            start = time.perf_counter()
+            await store(tx, batch)
+            elapsed += time.perf_counter() - start
+
+            raise psycopg.Rollback()
+
+    return elapsed / _REPETITIONS
+
+
+async def main() -> None:
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    async with api_tx('read committed') as tx:
+        await tx.execute('SET LOCAL statement_timeout = 0')
+
+        batch = await _batch(tx, batch_size)
+
+        before = await _seconds_per_batch(tx, batch, _store_per_message)
+        after = await _seconds_per_batch(tx, batch, _store_in_bulk)
+
+    print(
+        f'{batch_size} messages per batch: '
+        f'per-message={before * 1000:.1f}ms ({batch_size / before:.0f} msg/s), '
+        f'bulk={after * 1000:.1f}ms ({batch_size / after:.0f} msg/s), '
+        f'speedup={before / after:.1f}x'
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
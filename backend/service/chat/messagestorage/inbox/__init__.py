@@ -1,101 +1,144 @@
-from batcher import Batcher
-from database import Tx, asyncdatabase
+from batcher import AsyncBatcher
+from database import asyncdatabase
+from database.asyncdatabase import Tx
 from dataclasses import dataclass
-import database
+from datetime import datetime, timezone
 from service.chat.chatutil import (
     LSERVER,
     format_timestamp,
 )
+from chatprotocol.inbound import InboxQuery
+from chatprotocol.timestamp import FMT_ISO_8601_TIMESTAMP, now_microseconds
 from chatprotocol.outbound import (
     InboxFin,
     InboxResult,
     Outbound,
 )
 
+# Pages are fetched newest-first, so that `before` walks back through older
+# conversations, but each page is returned oldest-first, like the unpaginated
+# inbox. `timestamp` isn't unique, so `remote_bare_jid` breaks ties.
+#
+# Incremental queries (`start`) return the conversations which got a message,
+# were read, or whose people skipped, unskipped or deleted each other since
+# `start`. The last kind is sent again unchanged, so that the client looks up
+# where it now belongs, like it would after fetching the whole inbox.
 Q_GET_INBOX = f"""
+WITH page AS (
+    SELECT
+        *
+    FROM
+        inbox
+    WHERE
+        luser = %(username)s
+    AND (
+        %(start)s::BIGINT IS NULL
+    OR
+        timestamp > %(start)s
+    OR
+        displayed_at > to_timestamp(%(start)s::BIGINT / 1e6) AT TIME ZONE 'UTC'
+    OR
+        relation_changed_at
+        > to_timestamp(%(start)s::BIGINT / 1e6) AT TIME ZONE 'UTC'
+    )
+    AND (
+        %(before_timestamp)s::BIGINT IS NULL
+    OR
+        (timestamp, remote_bare_jid) <
+        (%(before_timestamp)s, %(before_remote_bare_jid)s)
+    )
+    ORDER BY
+        timestamp DESC,
+        remote_bare_jid DESC
+    LIMIT
+        %(max)s
+)
 SELECT
     *
 FROM
-    inbox
-WHERE
-    luser = %(username)s
+    page
 ORDER BY
-    timestamp
+    timestamp,
+    remote_bare_jid
 """
 
 
-Q_UPSERT_CONVERSATION = f"""
-WITH upsert_sender AS (
-    INSERT INTO inbox (
-        luser,
-        remote_bare_jid,
-        msg_id,
-        box,
-        body,
-        direction,
-        timestamp,
-        unread_count
-    )
-    VALUES (
-        %(from_username)s,
-        %(recipient_jid)s,
-        %(msg_id)s,
-        'chats',
-        %(body)s,
-        -- The sender's own copy: remote_bare_jid is the recipient (the To), so
-        -- the message is outgoing.
-        'O'::mam_direction,
-        EXTRACT(EPOCH FROM NOW()) * 1e6,
-        0
-    )
-    ON CONFLICT (luser, remote_bare_jid)
-    DO UPDATE SET
-        msg_id = EXCLUDED.msg_id,
-        box = 'chats',
-        body = EXCLUDED.body,
-        direction = EXCLUDED.direction,
-        timestamp = EXCLUDED.timestamp,
-        unread_count = 0
-), upsert_recipient AS (
-    -- Skipped (the SELECT returns no rows) when %(deliver_to_recipient)s is
-    -- false -- i.e. the sender is shadow-banned -- so the recipient's inbox
-    -- never gains an entry or unread count, and the notification cron (which
-    -- reads `inbox`) never sees it. The sender's own row above is still written.
-    INSERT INTO inbox (
+# The most conversations a client can ask for in one page
+MAX_INBOX_PAGE_SIZE = 1000
+
+
+# Inbox rows are stamped with the time their transaction started, so a row
+# can be committed with a timestamp slightly older than an incremental query
+# which ran before the commit. Re-sending the conversations which changed
+# shortly before `start` means those rows aren't missed. Clients de-duplicate
+# inbox results by conversation anyway.
+INBOX_START_OVERLAP_MICROSECONDS = 60 * 1_000_000
+
+
+# Upserts one row per conversation. Callers collapse a batch's messages into
+# those rows first, because a single INSERT can't update the same row twice.
+#
+# A conversation's unread count is either replaced (when its owner sent a
+# message in the batch, which means they've read it) or incremented by the
+# number of messages they received.
+Q_UPSERT_CONVERSATIONS = f"""
+INSERT INTO inbox (
+    luser,
+    remote_bare_jid,
+    msg_id,
+    box,
+    body,
+    direction,
+    timestamp,
+    unread_count
+)
+SELECT
+    conversation.luser,
+    conversation.remote_bare_jid,
+    conversation.msg_id,
+    conversation.box,
+    conversation.body,
+    conversation.direction,
+    EXTRACT(EPOCH FROM NOW()) * 1e6,
+    conversation.unread_count
+FROM
+    unnest(
+        %(luser)s::TEXT[],
+        %(remote_bare_jid)s::TEXT[],
+        %(msg_id)s::TEXT[],
+        %(box)s::TEXT[],
+        %(body)s::TEXT[],
+        %(direction)s::mam_direction[],
+        %(unread_count)s::INT[]
+    ) AS conversation(
         luser,
         remote_bare_jid,
         msg_id,
         box,
         body,
         direction,
-        timestamp,
         unread_count
     )
-    SELECT
-        %(to_username)s,
-        %(sender_jid)s,
-        %(msg_id)s,
-        'inbox',
-        %(body)s,
-        -- The recipient's copy: remote_bare_jid is the sender (the From), so
-        -- the message is incoming.
-        'I'::mam_direction,
-        EXTRACT(EPOCH FROM NOW()) * 1e6,
-        1
-    WHERE
-        %(deliver_to_recipient)s::BOOLEAN
-    ON CONFLICT (luser, remote_bare_jid)
-    DO UPDATE SET
-        msg_id = EXCLUDED.msg_id,
-        box = 'chats',
-        body = EXCLUDED.body,
-        direction = EXCLUDED.direction,
-        timestamp = EXCLUDED.timestamp,
-        unread_count = COALESCE(inbox.unread_count, 0) + 1
-)
-SELECT 1
+ON CONFLICT (luser, remote_bare_jid)
+DO UPDATE SET
+    msg_id = EXCLUDED.msg_id,
+    box = 'chats',
+    body = EXCLUDED.body,
+    direction = EXCLUDED.direction,
+    timestamp = EXCLUDED.timestamp,
+    unread_count = [[unread_count]]
 """
 
+Q_UPSERT_READ_CONVERSATIONS = Q_UPSERT_CONVERSATIONS.replace(
+    '[[unread_count]]',
+    'EXCLUDED.unread_count',
+)
+
+Q_UPSERT_UNREAD_CONVERSATIONS = Q_UPSERT_CONVERSATIONS.replace(
+    '[[unread_count]]',
+    'COALESCE(inbox.unread_count, 0) + EXCLUDED.unread_count',
+)
+
 
 Q_MARK_DISPLAYED = f"""
 UPDATE
@@ -127,13 +170,82 @@ class MarkDisplayedJob:
     to_username: str
 
 
-async def get_inbox(query_id: str, username: str) -> list[Outbound]:
+def _parse_max(max_: str | None) -> int | None:
+    if max_ is None:
+        return None
+
+    try:
+        return max(1, min(MAX_INBOX_PAGE_SIZE, int(max_)))
+    except ValueError:
+        return None
+
+
+def _parse_start(start: str | None) -> int | None:
+    if start is None:
+        return None
+
+    try:
+        dt = datetime.strptime(start, FMT_ISO_8601_TIMESTAMP)
+    except ValueError:
+        return None
+
+    microseconds = int(dt.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+
+    return max(0, microseconds - INBOX_START_OVERLAP_MICROSECONDS)
+
+
+def _format_cursor(row: dict) -> str:
+    remote_username = row['remote_bare_jid'].split('@', 1)[0]
+
+    return f"{row['timestamp']}:{remote_username}"
+
+
+def _parse_cursor(cursor: str | None) -> tuple[int, str] | None:
+    if cursor is None:
+        return None
+
+    timestamp, _, remote_username = cursor.partition(':')
+
+    try:
+        return int(timestamp), f'{remote_username}@{LSERVER}'
+    except ValueError:
+        return None
+
+
+async def get_inbox(query: InboxQuery, username: str) -> list[Outbound]:
     """
-    Fetches the user's inbox using the query_id and builds an `InboxResult` for
-    each message, followed by a final `InboxFin`.
+    Fetches the user's inbox and builds an `InboxResult` for each message,
+    followed by a final `InboxFin`.
+
+    Queries without `max`, `before` or `start` get the whole inbox. Otherwise,
+    they get a page of at most `max` conversations, older than the `before`
+    cursor, which changed after `start`. The `InboxFin` then carries the cursor
+    for the next page, if there might be one, and the time to use as `start`
+    for the next incremental query.
     """
+    query_id = query.query_id
+
+    is_paginated = (
+        query.max is not None or
+        query.before is not None or
+        query.start is not None
+    )
+
+    stamp = format_timestamp(now_microseconds())
+
+    max_ = _parse_max(query.max)
+    before = _parse_cursor(query.before)
+
+    params = dict(
+        username=username,
+        start=_parse_start(query.start),
+        before_timestamp=before[0] if before else None,
+        before_remote_bare_jid=before[1] if before else None,
+        max=max_,
+    )
+
     async with asyncdatabase.api_tx('read committed') as tx:
-        await tx.execute(Q_GET_INBOX, dict(username=username))
+        await tx.execute(Q_GET_INBOX, params)
         rows = await tx.fetchall()
 
     messages: list[Outbound] = []
@@ -168,26 +280,105 @@ async def get_inbox(query_id: str, username: str) -> list[Outbound]:
             print(f"Error processing row: {e}")
             continue
 
-    messages.append(InboxFin(query_id=query_id))
+    if not is_paginated:
+        messages.append(InboxFin(query_id=query_id))
+    elif max_ is not None and rows and len(rows) >= max_:
+        messages.append(InboxFin(
+            query_id=query_id,
+            stamp=stamp,
+            first=_format_cursor(rows[0]),
+        ))
+    else:
+        messages.append(InboxFin(query_id=query_id, stamp=stamp))
 
     return messages
 
 
-def process_upsert_conversation_batch(tx: Tx, batch: list[UpsertConversationJob]) -> None:
-    params_seq = [
-        dict(
-            from_username=job.from_username,
-            to_username=job.to_username,
-            sender_jid=f"{job.from_username}@{LSERVER}",
-            recipient_jid=f"{job.to_username}@{LSERVER}",
+@dataclass
+class _ConversationUpsert:
+    msg_id: str
+    body: str
+    direction: str
+    box: str
+    unread_count: int
+    # Whether the conversation's owner sent a message in this batch, which
+    # resets their unread count
+    is_read: bool
+
+
+def _collapse_conversation_upserts(
+    batch: list[UpsertConversationJob],
+) -> dict[tuple[str, str], _ConversationUpsert]:
+    """
+    Folds a batch of messages into one upsert per (luser, remote_bare_jid),
+    giving the same final row as upserting once per message, in order.
+    """
+    upserts: dict[tuple[str, str], _ConversationUpsert] = {}
+
+    for job in batch:
+        # The sender's own copy: remote_bare_jid is the recipient (the To), so
+        # the message is outgoing, and the sender has read the conversation.
+        upserts[(job.from_username, f"{job.to_username}@{LSERVER}")] = (
+            _ConversationUpsert(
+                msg_id=job.msg_id,
+                body=job.body,
+                direction='O',
+                box='chats',
+                unread_count=0,
+                is_read=True,
+            )
+        )
+
+        # Skipped when the sender is shadow-banned, so the recipient's inbox
+        # never gains an entry or unread count, and the notification cron
+        # (which reads `inbox`) never sees it.
+        if not job.deliver_to_recipient:
+            continue
+
+        # The recipient's copy: remote_bare_jid is the sender (the From), so
+        # the message is incoming.
+        key = (job.to_username, f"{job.from_username}@{LSERVER}")
+        previous = upserts.get(key)
+
+        upserts[key] = _ConversationUpsert(
             msg_id=job.msg_id,
             body=job.body,
-            deliver_to_recipient=job.deliver_to_recipient,
+            direction='I',
+            # A conversation only lands in the 'inbox' box when it's created
+            # by an incoming message. Any later message moves it to 'chats'.
+            box='inbox' if previous is None else 'chats',
+            unread_count=1 if previous is None else previous.unread_count + 1,
+            is_read=previous is not None and previous.is_read,
         )
-        for job in batch
-    ]
 
-    tx.executemany(Q_UPSERT_CONVERSATION, params_seq)
+    return upserts
+
+
+async def process_upsert_conversation_batch(
+    tx: Tx,
+    batch: list[UpsertConversationJob],
+) -> None:
+    upserts = _collapse_conversation_upserts(batch)
+
+    for q, is_read in [
+        (Q_UPSERT_READ_CONVERSATIONS, True),
+        (Q_UPSERT_UNREAD_CONVERSATIONS, False),
+    ]:
+        # Sorted so that concurrent batches lock rows in the same order
+        keys = sorted(k for k, v in upserts.items() if v.is_read == is_read)
+
+        if not keys:
+            continue
+
+        await tx.execute(q, dict(
+            luser=[luser for luser, _ in keys],
+            remote_bare_jid=[remote_bare_jid for _, remote_bare_jid in keys],
+            msg_id=[upserts[k].msg_id for k in keys],
+            box=[upserts[k].box for k in keys],
+            body=[upserts[k].body for k in keys],
+            direction=[upserts[k].direction for k in keys],
+            unread_count=[upserts[k].unread_count for k in keys],
+        ))
 
 
 def mark_displayed(from_username: str, to_username: str) -> None:
@@ -202,7 +393,7 @@ def mark_displayed(from_username: str, to_username: str) -> None:
     _mark_displayed_batcher.enqueue(job)
 
 
-def _process_mark_displayed_batch(batch: list[MarkDisplayedJob]) -> None:
+async def _process_mark_displayed_batch(batch: list[MarkDisplayedJob]) -> None:
     params_seq = [
         dict(
             luser=job.from_username,
@@ -211,11 +402,11 @@ def _process_mark_displayed_batch(batch: list[MarkDisplayedJob]) -> None:
         for job in batch
     ]
 
-    with database.api_tx('read committed') as tx:
-        tx.executemany(Q_MARK_DISPLAYED, params_seq)
+    async with asyncdatabase.api_tx('read committed', priority='low') as tx:
+        await tx.executemany(Q_MARK_DISPLAYED, params_seq)
 
 
-_mark_displayed_batcher = Batcher[MarkDisplayedJob](
+_mark_displayed_batcher = AsyncBatcher[MarkDisplayedJob](
     process_fn=_process_mark_displayed_batch,
     flush_interval=1.0,
     min_batch_size=1,
@@ -0,0 +1,110 @@
+import unittest
+import itertools
+from service.chat.chatutil import LSERVER
+from service.chat.messagestorage.inbox import (
+    UpsertConversationJob,
+    _collapse_conversation_upserts,
+)
+
+
+# (box, unread_count, msg_id, direction) for each (luser, remote_bare_jid)
+Inbox = dict[tuple[str, str], tuple[str, int, str, str]]
+
+
+def _upsert_one_at_a_time(
+    inbox: Inbox,
+    batch: list[UpsertConversationJob],
+) -> Inbox:
+    """
+    The inbox after upserting each message in turn, as `Q_UPSERT_CONVERSATIONS`
+    would if it were run once per message.
+    """
+    inbox = dict(inbox)
+
+    for job in batch:
+        sender_key = (job.from_username, f'{job.to_username}@{LSERVER}')
+        inbox[sender_key] = ('chats', 0, job.msg_id, 'O')
+
+        if not job.deliver_to_recipient:
+            continue
+
+        recipient_key = (job.to_username, f'{job.from_username}@{LSERVER}')
+        if recipient_key in inbox:
+            _, unread_count, _, _ = inbox[recipient_key]
+            inbox[recipient_key] = ('chats', unread_count + 1, job.msg_id, 'I')
+        else:
+            inbox[recipient_key] = ('inbox', 1, job.msg_id, 'I')
+
+    return inbox
+
+
+def _upsert_collapsed(
+    inbox: Inbox,
+    batch: list[UpsertConversationJob],
+) -> Inbox:
+    inbox = dict(inbox)
+
+    for key, upsert in _collapse_conversation_upserts(batch).items():
+        if key not in inbox:
+            inbox[key] = (
+                upsert.box,
+                upsert.unread_count,
+                upsert.msg_id,
+                upsert.direction,
+            )
+            continue
+
+        _, unread_count, _, _ = inbox[key]
+
+        inbox[key] = (
+            'chats',
+            (
+                upsert.unread_count
+                if upsert.is_read
+                else unread_count + upsert.unread_count
+            ),
+            upsert.msg_id,
+            upsert.direction,
+        )
+
+    return inbox
+
+
+class TestCollapseConversationUpserts(unittest.TestCase):
+    def test_matches_upserting_one_at_a_time(self) -> None:
+        senders = [
+            ('alice', 'bob', True),
+            ('bob', 'alice', True),
+            ('alice', 'carol', True),
+            ('alice', 'bob', False),
+        ]
+
+        existing_inboxes: list[Inbox] = [
+            {},
+            {('bob', f'alice@{LSERVER}'): ('chats', 3, 'm0', 'I')},
+            {('alice', f'bob@{LSERVER}'): ('inbox', 1, 'm0', 'I')},
+        ]
+
+        for n in range(1, 5):
+            for combination in itertools.product(senders, repeat=n):
+                batch = [
+                    UpsertConversationJob(
+                        from_username=from_username,
+                        to_username=to_username,
+                        msg_id=f'm{i + 1}',
+                        body='hi',
+                        deliver_to_recipient=deliver_to_recipient,
+                    )
+                    for i, (from_username, to_username, deliver_to_recipient)
+                    in enumerate(combination)
+                ]
+
+                for inbox in existing_inboxes:
+                    self.assertEqual(
+                        _upsert_collapsed(inbox, batch),
+                        _upsert_one_at_a_time(inbox, batch),
+                        batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from database import Tx, asyncdatabase
+from database import asyncdatabase
+from database.asyncdatabase import Tx
 from service.chat.chatutil import (
     LSERVER,
     fetch_has_gold,
@@ -20,7 +21,10 @@ from chatprotocol.outbound import (
 import uuid
 
 
-Q_INSERT_MESSAGE = """
+# Inserts a whole batch of archive rows in one statement. Rows whose person no
+# longer exists (e.g. they deleted their account after sending) are dropped
+# rather than failing the batch.
+Q_INSERT_MESSAGES = """
 INSERT INTO
     mam_message (
         id,
@@ -32,31 +36,40 @@ INSERT INTO
         stanza_id,
         person_id
     )
--- The sender's archive copy (direction 'O') is always stored. The recipient's
--- copy (direction 'I') is skipped when %(deliver_to_recipient)s is false (the
--- sender is shadow-banned), so the message never lands in the recipient's
--- archive.
 SELECT
-    %(id)s::BIGINT,
+    message.id,
     '', -- from_jid is ignored
-    %(to_username)s,
-    'O'::mam_direction,
-    %(audio_uuid)s,
-    %(body)s,
-    %(stanza_id)s,
-    (SELECT id FROM person WHERE uuid = uuid_or_null(%(from_username)s))
-UNION ALL
-SELECT
-    %(id)s::BIGINT + 1,
-    '', -- from_jid is ignored
-    %(from_username)s,
-    'I'::mam_direction,
-    %(audio_uuid)s,
-    %(body)s,
-    %(stanza_id)s,
-    (SELECT id FROM person WHERE uuid = uuid_or_null(%(to_username)s))
-WHERE
-    %(deliver_to_recipient)s::BOOLEAN
+    message.remote_bare_jid,
+    message.direction,
+    message.audio_uuid,
+    message.body,
+    message.stanza_id,
+    person.id
+FROM
+    unnest(
+        %(id)s::BIGINT[],
+        %(remote_bare_jid)s::TEXT[],
+        %(direction)s::mam_direction[],
+        %(audio_uuid)s::TEXT[],
+        %(body)s::TEXT[],
+        %(stanza_id)s::TEXT[],
+        %(person_id)s::INT[]
+    ) AS message(
+        id,
+        remote_bare_jid,
+        direction,
+        audio_uuid,
+        body,
+        stanza_id,
+        person_id
+    )
+-- Someone who was deleted after the batch was queued has their copy stored
+-- with a NULL person_id, as when person ids were looked up by uuid, rather than
+-- failing the foreign key
+LEFT JOIN
+    person
+ON
+    person.id = message.person_id
 """
 
 
@@ -113,6 +126,8 @@ class StoreMamMessageJob:
     timestamp_microseconds: int
     from_username: str
     to_username: str
+    from_id: int
+    to_id: int
     id: str
     message_body: str
     audio_uuid: str | None
@@ -130,21 +145,63 @@ async def get_conversation(
     )
 
 
-def process_store_mam_message_batch(tx: Tx, batch: list[StoreMamMessageJob]) -> None:
-    params_seq = [
-        dict(
-            id=microseconds_to_mam_message_id(message.timestamp_microseconds),
-            to_username=message.to_username,
-            from_username=message.from_username,
-            audio_uuid=message.audio_uuid,
-            body=message.message_body,
-            stanza_id=message.id,
-            deliver_to_recipient=message.deliver_to_recipient,
+async def process_store_mam_message_batch(
+    tx: Tx,
+    batch: list[StoreMamMessageJob],
+) -> None:
+    if not batch:
+        return
+
+    params: dict[str, list[object]] = dict(
+        id=[],
+        remote_bare_jid=[],
+        direction=[],
+        audio_uuid=[],
+        body=[],
+        stanza_id=[],
+        person_id=[],
+    )
+
+    def add_row(
+        message: StoreMamMessageJob,
+        mam_message_id: int,
+        remote_bare_jid: str,
+        direction: str,
+        person_id: int,
+    ) -> None:
+        params['id'].append(mam_message_id)
+        params['remote_bare_jid'].append(remote_bare_jid)
+        params['direction'].append(direction)
+        params['audio_uuid'].append(message.audio_uuid)
+        params['body'].append(message.message_body)
+        params['stanza_id'].append(message.id)
+        params['person_id'].append(person_id)
+
+    for message in batch:
+        mam_message_id = microseconds_to_mam_message_id(
+                message.timestamp_microseconds)
+
+        # The sender's archive copy (direction 'O') is always stored
+        add_row(
+            message,
+            mam_message_id=mam_message_id,
+            remote_bare_jid=message.to_username,
+            direction='O',
+            person_id=message.from_id,
         )
-        for message in batch
-    ]
 
-    tx.executemany(Q_INSERT_MESSAGE, params_seq)
+        # The recipient's copy (direction 'I') is skipped when the sender is
+        # shadow-banned, so the message never lands in the recipient's archive
+        if message.deliver_to_recipient:
+            add_row(
+                message,
+                mam_message_id=mam_message_id + 1,
+                remote_bare_jid=message.from_username,
+                direction='I',
+                person_id=message.to_id,
+            )
+
+    await tx.execute(Q_INSERT_MESSAGES, params)
 
 
 async def _get_conversation(
@@ -8,7 +8,7 @@ as a text bubble. Reactions are keyed on the server-assigned `mam_message.id`
 
 A message is archived as two rows whose ids differ only in the low bit -- the
 sender copy is `microseconds << 8` and the recipient copy is that value `+ 1`
-(see `Q_INSERT_MESSAGE` in `service/chat/messagestorage/mam`). So the partner's
+(see `Q_INSERT_MESSAGES` in `service/chat/messagestorage/mam`). So the partner's
 copy of any message is `id ^ 1`. A reaction updates both copies by their
 `(person_id, id)` primary key.
 
@@ -21,8 +21,9 @@ reactor's own incoming copy via `fetch_reaction_partner`, never trusted from the
 client, so a reaction can't be aimed at an arbitrary third party.
 
 The target row is guaranteed to already exist: a message is delivered to the
-recipient only by the batcher's post-flush callback (see `Batcher._process_batch`),
-so no client can learn a message's `mam_id` until after its rows are committed.
+recipient only by the batcher's post-flush callback (see
+`AsyncBatcher._process_batch`), so no client can learn a message's `mam_id`
+until after its rows are committed.
 A missing target therefore means a genuinely absent or own-message reaction, not
 a not-yet-flushed one.
 """
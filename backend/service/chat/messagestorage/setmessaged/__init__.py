@@ -1,16 +1,24 @@
 from typing import List
 from dataclasses import dataclass
-from database import Tx, api_tx
-from functools import lru_cache
+from database.asyncdatabase import Tx
 
 Q_SET_MESSAGED = """
 INSERT INTO messaged (
     subject_person_id,
     object_person_id
-) VALUES (
-    %(from_id)s,
-    %(to_id)s
-) ON CONFLICT DO NOTHING
+)
+SELECT
+    subject_person_id,
+    object_person_id
+FROM
+    unnest(
+        %(from_id)s::INT[],
+        %(to_id)s::INT[]
+    ) AS messaged(
+        subject_person_id,
+        object_person_id
+    )
+ON CONFLICT DO NOTHING
 """
 
 
@@ -20,11 +28,17 @@ class SetMessagedJob:
     to_id: int
 
 
-def process_set_messaged_batch(tx: Tx, batch: List[SetMessagedJob]) -> None:
-    distinct_messaged = set(batch)
+async def process_set_messaged_batch(tx: Tx, batch: List[SetMessagedJob]) -> None:
+    # Sorted so that concurrent batches lock rows in the same order
+    distinct_messaged = sorted(
+            set(batch),
+            key=lambda m: (m.from_id, m.to_id))
+
+    if not distinct_messaged:
+        return
 
-    params_seq = [
-            dict(from_id=m.from_id, to_id=m.to_id)
-            for m in distinct_messaged]
+    params = dict(
+            from_id=[m.from_id for m in distinct_messaged],
+            to_id=[m.to_id for m in distinct_messaged])
 
-    tx.executemany(Q_SET_MESSAGED, params_seq)
+    await tx.execute(Q_SET_MESSAGED, params)
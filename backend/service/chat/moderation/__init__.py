@@ -0,0 +1,114 @@
+"""
+Runs the CPU-bound checks on incoming chat messages (see `chatmoderation`) off
+the event loop.
+
+Looking for URLs means running a regex over every known TLD, and intros are
+normalized before they're hashed for the uniqueness check. Done inline, that
+work runs on the worker's event loop, so one long message stalls every other
+websocket the worker serves. Instead, the checks run in a small process pool
+which the event loop awaits.
+
+The pool's processes are spawned rather than forked: by the time the pool
+starts, the chat worker is running threads (e.g. the database pools'), and a
+forked child can deadlock on a lock which one of them held. Spawned processes
+import `chatmoderation` rather than this module, so that they don't start the
+chat service itself, and compile its regexes themselves. That still takes a
+moment, so `start_moderation_processes` starts them when the worker starts
+rather than when its first message arrives. Setting
+`DUO_CHAT_MODERATION_PROCESSES` to 0 runs the checks inline instead.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from chatmoderation import Moderation, moderate, no_op, warm_up
+
+
+MODERATION_PROCESSES = int(os.environ.get(
+    'DUO_CHAT_MODERATION_PROCESSES',
+    '1',
+))
+
+# Moderation which takes longer than this, including time spent waiting for a
+# free process, is logged along with how long each check took
+MODERATION_SLOW_SECONDS = float(os.environ.get(
+    'DUO_CHAT_MODERATION_SLOW_SECONDS',
+    '0.1',
+))
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=MODERATION_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=warm_up,
+            )
+
+            # Processes are spawned as work arrives, so give each one some
+            for _ in range(MODERATION_PROCESSES):
+                _executor.submit(no_op)
+
+        return _executor
+
+
+def start_moderation_processes() -> None:
+    if MODERATION_PROCESSES > 0:
+        _get_executor()
+
+
+def _replace_broken_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+
+    broken.shutdown(wait=False, cancel_futures=True)
+
+    start_moderation_processes()
+
+
+async def moderate_async(text: str) -> Moderation:
+    start = time.perf_counter()
+
+    if MODERATION_PROCESSES <= 0:
+        moderation = moderate(text)
+    else:
+        executor = _get_executor()
+
+        try:
+            moderation = await asyncio.get_running_loop().run_in_executor(
+                    executor, moderate, text)
+        except BrokenProcessPool:
+            # A pool process died (e.g. it was OOM-killed). The message
+            # shouldn't be lost because of it, so it's checked inline while
+            # the next message gets a fresh pool.
+            print(traceback.format_exc())
+            _replace_broken_executor(executor)
+            moderation = moderate(text)
+
+    elapsed = time.perf_counter() - start
+
+    if elapsed > MODERATION_SLOW_SECONDS:
+        checks = ', '.join(
+            f'{check}={seconds:.4f}s'
+            for check, seconds in moderation.timings.items()
+        )
+        print(
+            f'Moderating a message of length {len(text)} took '
+            f'{elapsed:.4f}s ({checks})'
+        )
+
+    return moderation
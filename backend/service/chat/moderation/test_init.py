@@ -0,0 +1,20 @@
+import unittest
+from unittest.mock import patch
+from service.chat.moderation import moderate_async
+
+
+class TestModerateAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_process_pool_matches_inline(self) -> None:
+        text = "look at this https://mycoolsite.com"
+
+        pooled = await moderate_async(text)
+
+        with patch('service.chat.moderation.MODERATION_PROCESSES', 0):
+            inline = await moderate_async(text)
+
+        self.assertEqual(pooled.is_spam, inline.is_spam)
+        self.assertEqual(pooled.intro_hash, inline.intro_hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
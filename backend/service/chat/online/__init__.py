@@ -7,7 +7,7 @@ from service.chat.chatutil import (
 )
 from enum import Enum
 from commonsql import Q_UPDATE_LAST
-from batcher import Batcher
+from service.chat.pubsub import Subscription
 from service.chat.session import Session
 from chatprotocol.outbound import (
     OnlineEvent,
@@ -19,7 +19,7 @@ from chatprotocol.outbound import (
     from_bus,
     to_bus,
 )
-from database import api_tx
+from database.asyncdatabase import api_tx
 import asyncio
 import time
 from functools import lru_cache
@@ -76,16 +76,9 @@ WHERE
 """
 
 
-@dataclass(frozen=True)
-class UpdateLastJob:
-    session_username: str
-    session_token_hash: str
-    do_update_last_event: bool
-
-
 async def _redis_subscribe_online(
     redis_client: redis.Redis,
-    pubsub: redis.client.PubSub,
+    pubsub: Subscription,
     username: str,
 ) -> OnlineEvent:
     key = FMT_KEY.format(username=username)
@@ -108,30 +101,12 @@ async def _redis_subscribe_online(
 
 
 async def _redis_unsubscribe_online(
-    pubsub: redis.client.PubSub,
+    pubsub: Subscription,
     username: str,
 ) -> None:
     key = FMT_KEY.format(username=username)
     await pubsub.unsubscribe(key)
 
-async def redis_publish_online(
-    redis_client: redis.Redis,
-    username: str,
-    online: bool
-) -> None:
-    status = (
-        OnlineStatus.ONLINE.value
-        if online
-        else OnlineStatus.ONLINE_RECENTLY.value)
-
-    key = FMT_KEY.format(username=username)
-    val = to_bus(OnlineEvent(username=username, status=status))
-
-    async with redis_client.pipeline(transaction=True) as pipe:
-        pipe.publish(key, val)
-        pipe.set(key, val, ex=ONLINE_RECENTLY_SECONDS)
-        await pipe.execute()
-
 async def should_subscribe(from_username: str | None, to_username: str) -> bool:
     if from_username is None:
         to_id = await fetch_id_from_username(to_username)
@@ -152,7 +127,7 @@ async def should_subscribe(from_username: str | None, to_username: str) -> bool:
 
 
 async def _evict_oldest_online_subscriptions(
-    pubsub: redis.client.PubSub,
+    pubsub: Subscription,
     session: Session,
     limit: int,
 ) -> None:
@@ -170,7 +145,7 @@ async def maybe_redis_subscribe_online(
     from_username: str | None,
     to_username: str,
     redis_client: redis.Redis,
-    pubsub: redis.client.PubSub,
+    pubsub: Subscription,
     session: Session,
 ) -> list[Outbound]:
     try:
@@ -200,7 +175,7 @@ async def maybe_redis_subscribe_online(
 
 async def maybe_redis_unsubscribe_online(
     username: str,
-    pubsub: redis.client.PubSub,
+    pubsub: Subscription,
     session: Session,
 ) -> list[Outbound]:
     try:
@@ -217,92 +192,219 @@ async def maybe_redis_unsubscribe_online(
 
 
 
-def process_batch(jobs: list[UpdateLastJob]) -> None:
-    update_last_params_seq = [
-        dict(person_uuid=job.session_username)
-        for job in jobs
-    ]
+@dataclass(frozen=True)
+class PresenceBatch:
+    # Usernames whose first connection to this worker opened since the last
+    # tick
+    went_online: frozenset[str]
+    # Usernames with no connections left on this worker, including those which
+    # connected and disconnected within the tick
+    went_offline: frozenset[str]
+    # Usernames still online whose status is refreshed in Redis
+    heartbeat: frozenset[str]
+    # The rows to update, sorted so that concurrent batches lock them in the
+    # same order
+    person_uuids: list[str]
+    session_token_hashes: list[str]
+
+
+class PresenceAggregator:
+    """
+    Keeps the people connected to this worker marked as online. A tick runs
+    every `tick_seconds`, however many connections each person has. It
+    publishes only changes in status. It updates `last_online_time` once per
+    person and session for everyone who connected or disconnected since the
+    last tick. Every `heartbeat_seconds`, it does the same for everyone still
+    connected.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        tick_seconds: float = 0.5,
+        heartbeat_seconds: float = LAST_UPDATE_INTERVAL_SECONDS,
+    ) -> None:
+        self._redis_client = redis_client
+        self._tick_seconds = tick_seconds
+        self._heartbeat_seconds = heartbeat_seconds
+
+        # connection_uuid -> (username, session_token_hash)
+        self._connections: dict[str, tuple[str, str]] = {}
+        # username -> number of connections
+        self._connection_counts: dict[str, int] = {}
+
+        # Usernames this worker last published as online
+        self._published_online: frozenset[str] = frozenset()
+        # Usernames which connected at some point since the last tick
+        self._connected_since_tick: set[str] = set()
+
+        self._pending_person_uuids: set[str] = set()
+        self._pending_session_token_hashes: set[str] = set()
+
+        self._next_heartbeat = time.monotonic() + heartbeat_seconds
+
+        self._task: asyncio.Task[None] | None = None
+
+    def connect(self, session: Session) -> None:
+        if session.username is None or session.session_token_hash is None:
+            return
+
+        if session.connection_uuid in self._connections:
+            return
+
+        username = session.username
+        session_token_hash = session.session_token_hash
+
+        self._connections[session.connection_uuid] = (
+            username, session_token_hash)
+        self._connection_counts[username] = (
+            self._connection_counts.get(username, 0) + 1)
+
+        self._connected_since_tick.add(username)
+        self._pending_person_uuids.add(username)
+        self._pending_session_token_hashes.add(session_token_hash)
+
+        self._maybe_start_task()
+
+    def disconnect(self, session: Session) -> None:
+        connection = self._connections.pop(session.connection_uuid, None)
+
+        if connection is None:
+            return
+
+        username, session_token_hash = connection
+
+        self._connection_counts[username] -= 1
+        if not self._connection_counts[username]:
+            del self._connection_counts[username]
+
+        self._pending_person_uuids.add(username)
+        self._pending_session_token_hashes.add(session_token_hash)
+
+    def batch(self, now: float) -> PresenceBatch:
+        """Takes what has changed since the last tick"""
+        online = frozenset(self._connection_counts)
+
+        went_online = online - self._published_online
+        went_offline = (
+            (self._published_online | self._connected_since_tick) - online)
+
+        heartbeat: frozenset[str] = frozenset()
+
+        if now >= self._next_heartbeat:
+            heartbeat = online - went_online
+
+            for username, session_token_hash in self._connections.values():
+                self._pending_person_uuids.add(username)
+                self._pending_session_token_hashes.add(session_token_hash)
+
+            self._next_heartbeat = now + self._heartbeat_seconds
 
-    session_params_seq = [
-        dict(session_token_hash=job.session_token_hash)
-        for job in jobs
-    ]
+        batch = PresenceBatch(
+            went_online=went_online,
+            went_offline=went_offline,
+            heartbeat=heartbeat,
+            person_uuids=sorted(self._pending_person_uuids),
+            session_token_hashes=sorted(self._pending_session_token_hashes),
+        )
 
-    with api_tx('read committed') as tx:
-        tx.executemany(Q_UPDATE_LAST, update_last_params_seq)
-        tx.executemany(Q_UPDATE_SESSION_LAST_ONLINE, session_params_seq)
+        self._published_online = online
+        self._connected_since_tick.clear()
+        self._pending_person_uuids.clear()
+        self._pending_session_token_hashes.clear()
 
+        return batch
 
-def update_last_once(
-    session_username: str,
-    session_token_hash: str,
-    do_update_last_event: bool,
-) -> None:
-    _batcher.enqueue(
-        UpdateLastJob(
-            session_username=session_username,
-            session_token_hash=session_token_hash,
-            do_update_last_event=do_update_last_event,
-        )
-    )
+    async def _publish(self, batch: PresenceBatch) -> None:
+        def value(username: str, status: OnlineStatus) -> str:
+            return to_bus(OnlineEvent(username=username, status=status.value))
 
+        transitions = [
+            *((u, value(u, OnlineStatus.ONLINE)) for u in batch.went_online),
+            *((u, value(u, OnlineStatus.ONLINE_RECENTLY))
+                for u in batch.went_offline),
+        ]
 
-async def update_online_once(
-    redis_client: redis.Redis,
-    session: Session,
-    online: bool,
-    do_update_last_event: bool = False,
-) -> None:
-    if session.username is None or session.session_token_hash is None:
-        return
+        heartbeat = sorted(batch.heartbeat)
 
-    update_last_once(
-        session_username=session.username,
-        session_token_hash=session.session_token_hash,
-        do_update_last_event=do_update_last_event,
-    )
+        if not transitions and not heartbeat:
+            return
 
-    await redis_publish_online(
-        redis_client=redis_client,
-        username=session.username,
-        online=online,
-    )
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+            for username, val in transitions:
+                key = FMT_KEY.format(username=username)
+                pipe.publish(key, val)
+                pipe.set(key, val, ex=ONLINE_RECENTLY_SECONDS)
 
+            # Refreshes the status's expiry. The status only needs publishing
+            # again if something else, such as another worker, changed it.
+            for username in heartbeat:
+                pipe.set(
+                    FMT_KEY.format(username=username),
+                    value(username, OnlineStatus.ONLINE),
+                    ex=ONLINE_RECENTLY_SECONDS,
+                    get=True,
+                )
 
-async def update_online_forever(
-    redis_client: redis.Redis,
-    session: Session,
-    online: bool
-) -> None:
-    try:
-        await update_online_once(
-            redis_client=redis_client,
-            session=session,
-            online=online,
-            do_update_last_event=True,
-        )
+            results = await pipe.execute()
 
-        while True:
-            await asyncio.sleep(LAST_UPDATE_INTERVAL_SECONDS)
-
-            await update_online_once(
-                redis_client=redis_client,
-                session=session,
-                online=online,
-            )
-    except asyncio.exceptions.CancelledError:
-        pass
-    except:
-        print(traceback.format_exc())
-        raise
+        previous_values = results[2 * len(transitions):]
 
+        changed = [
+            username
+            for username, previous in zip(heartbeat, previous_values)
+            if previous != value(username, OnlineStatus.ONLINE)
+        ]
 
-_batcher = Batcher[UpdateLastJob](
-    process_fn=process_batch,
-    flush_interval=1.0,
-    min_batch_size=1,
-    max_batch_size=1000,
-    retry=False,
-)
+        if not changed:
+            return
+
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+            for username in changed:
+                pipe.publish(
+                    FMT_KEY.format(username=username),
+                    value(username, OnlineStatus.ONLINE),
+                )
+
+            await pipe.execute()
+
+    async def _update_last(self, batch: PresenceBatch) -> None:
+        if not batch.person_uuids and not batch.session_token_hashes:
+            return
+
+        async with api_tx('read committed', priority='low') as tx:
+            await tx.executemany(
+                Q_UPDATE_LAST,
+                [dict(person_uuid=u) for u in batch.person_uuids])
+            await tx.executemany(
+                Q_UPDATE_SESSION_LAST_ONLINE,
+                [
+                    dict(session_token_hash=h)
+                    for h in batch.session_token_hashes
+                ])
+
+    async def tick(self) -> None:
+        batch = self.batch(time.monotonic())
+
+        try:
+            await self._publish(batch)
+        except:
+            print(traceback.format_exc())
+
+        try:
+            await self._update_last(batch)
+        except:
+            print(traceback.format_exc())
+
+    async def _tick_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self._tick_seconds)
+            await self.tick()
+
+    def _maybe_start_task(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
 
-_batcher.start()
+        # asyncio.create_task requires some manual memory management!
+        # https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
+        self._task = asyncio.create_task(self._tick_forever())
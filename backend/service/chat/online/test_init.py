@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import redis.asyncio as redis
+from chatprotocol.outbound import OnlineEvent, to_bus
+from service.chat.online import PresenceAggregator
+from service.chat.session import Session
+
+
+def _session(username: str, session_token_hash: str) -> Session:
+    session = Session()
+    session.username = username
+    session.session_token_hash = session_token_hash
+    return session
+
+
+def _online(username: str) -> str:
+    return to_bus(OnlineEvent(username=username, status='online'))
+
+
+class _FakePipeline:
+    def __init__(self, results: list[object]) -> None:
+        self.calls: list[tuple[str, tuple[object, ...]]] = []
+        self._results = results
+
+    async def __aenter__(self) -> '_FakePipeline':
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        pass
+
+    def publish(self, *args: object) -> None:
+        self.calls.append(('publish', args))
+
+    def set(self, *args: object, **kwargs: object) -> None:
+        self.calls.append(('set', args))
+
+    async def execute(self) -> list[object]:
+        return self._results
+
+
+class TestPresenceAggregator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.presence = PresenceAggregator(
+            redis.Redis(),
+            heartbeat_seconds=60,
+        )
+
+        # Ticks are run by hand
+        self.presence._maybe_start_task = MagicMock() # type: ignore
+
+    def test_dedupes_connections_by_username_and_session(self) -> None:
+        self.presence.connect(_session('alice', 'token-1'))
+        self.presence.connect(_session('alice', 'token-1'))
+        self.presence.connect(_session('alice', 'token-2'))
+        self.presence.connect(_session('bob', 'token-3'))
+
+        batch = self.presence.batch(now=0)
+
+        self.assertEqual(batch.went_online, {'alice', 'bob'})
+        self.assertEqual(batch.went_offline, frozenset())
+        self.assertEqual(batch.person_uuids, ['alice', 'bob'])
+        self.assertEqual(
+            batch.session_token_hashes,
+            ['token-1', 'token-2', 'token-3'])
+
+        batch = self.presence.batch(now=1)
+
+        self.assertEqual(batch.went_online, frozenset())
+        self.assertEqual(batch.person_uuids, [])
+        self.assertEqual(batch.session_token_hashes, [])
+
+    def test_publishes_offline_when_the_last_connection_closes(self) -> None:
+        first = _session('alice', 'token-1')
+        second = _session('alice', 'token-2')
+
+        self.presence.connect(first)
+        self.presence.connect(second)
+        self.presence.batch(now=0)
+
+        self.presence.disconnect(first)
+        batch = self.presence.batch(now=1)
+
+        self.assertEqual(batch.went_offline, frozenset())
+        self.assertEqual(batch.session_token_hashes, ['token-1'])
+
+        self.presence.disconnect(second)
+        self.presence.disconnect(second)
+        batch = self.presence.batch(now=2)
+
+        self.assertEqual(batch.went_offline, {'alice'})
+        self.assertEqual(batch.person_uuids, ['alice'])
+        self.assertEqual(batch.session_token_hashes, ['token-2'])
+
+    def test_brief_connections_are_only_published_as_offline(self) -> None:
+        session = _session('alice', 'token-1')
+
+        self.presence.connect(session)
+        self.presence.disconnect(session)
+        batch = self.presence.batch(now=0)
+
+        self.assertEqual(batch.went_online, frozenset())
+        self.assertEqual(batch.went_offline, {'alice'})
+        self.assertEqual(batch.person_uuids, ['alice'])
+
+    def test_heartbeat_refreshes_everyone_still_connected(self) -> None:
+        self.presence.connect(_session('alice', 'token-1'))
+        self.presence.batch(now=0)
+
+        self.presence.connect(_session('bob', 'token-2'))
+        batch = self.presence.batch(now=1e9)
+
+        self.assertEqual(batch.went_online, {'bob'})
+        self.assertEqual(batch.heartbeat, {'alice'})
+        self.assertEqual(batch.person_uuids, ['alice', 'bob'])
+        self.assertEqual(batch.session_token_hashes, ['token-1', 'token-2'])
+
+        batch = self.presence.batch(now=1e9 + 1)
+
+        self.assertEqual(batch.heartbeat, frozenset())
+
+    def test_sessions_without_usernames_are_ignored(self) -> None:
+        self.presence.connect(Session())
+        self.presence.disconnect(Session())
+
+        batch = self.presence.batch(now=0)
+
+        self.assertEqual(batch.went_online, frozenset())
+        self.assertEqual(batch.went_offline, frozenset())
+        self.assertEqual(batch.person_uuids, [])
+
+
+class TestPresenceAggregatorPublish(unittest.IsolatedAsyncioTestCase):
+    async def test_heartbeat_republishes_only_changed_statuses(self) -> None:
+        redis_client = MagicMock()
+        presence = PresenceAggregator(redis_client, heartbeat_seconds=60)
+        presence._maybe_start_task = MagicMock() # type: ignore
+
+        presence.connect(_session('alice', 'token-1'))
+        presence.connect(_session('bob', 'token-2'))
+        presence.batch(now=0)
+
+        # Another worker marked bob as recently online
+        heartbeat = _FakePipeline([_online('alice'), 'online-recently'])
+        republish = _FakePipeline([1])
+        redis_client.pipeline.side_effect = [heartbeat, republish]
+
+        await presence._publish(presence.batch(now=1e9))
+
+        self.assertEqual(
+            [name for name, _ in heartbeat.calls],
+            ['set', 'set'])
+        self.assertEqual(
+            republish.calls,
+            [('publish', ('online-bob', _online('bob')))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+"""
+One Redis pub/sub connection per chat worker, shared by every websocket the
+worker serves.
+
+Giving each websocket its own Redis client and `PubSub` would cost one Redis TCP
+connection (and one read loop) per connected user. Instead, a single
+`Multiplexer` holds one `PubSub` for the whole worker and fans each message out
+in-process to the `Subscription`s interested in its channel -- the
+connection's `connection_uuid`, its username, and any `online-{username}`
+channels it follows.
+
+A channel is subscribed in Redis while at least one `Subscription` wants it and
+unsubscribed when the last one lets it go.
+
+Each `Subscription` buffers at most `SUBSCRIPTION_QUEUE_SIZE` messages. The
+reader can't wait for a websocket which isn't keeping up without holding up
+every other websocket, so a `Subscription` whose buffer fills stops receiving
+messages, and `listen()` raises `SubscriptionOverflow` for the chat service to
+close the websocket.
+"""
+
+import asyncio
+import os
+import traceback
+import uuid
+from collections.abc import AsyncIterator, Iterable
+
+import redis.asyncio as redis
+
+
+SUBSCRIPTION_QUEUE_SIZE = int(os.environ.get(
+    'DUO_SUBSCRIPTION_QUEUE_SIZE',
+    str(1000),
+))
+
+
+class SubscriptionOverflow(Exception):
+    pass
+
+
+class Subscription:
+    """
+    A websocket's view of the worker's shared pub/sub connection. Exposes the
+    subset of `redis.client.PubSub` the chat service uses, except that
+    `listen()` yields message payloads rather than Redis message dicts.
+    """
+
+    def __init__(self, multiplexer: 'Multiplexer') -> None:
+        self._multiplexer = multiplexer
+        self._channels: set[str] = set()
+        self._queue: asyncio.Queue[str] = asyncio.Queue(
+            maxsize=SUBSCRIPTION_QUEUE_SIZE)
+        self._overflowed = False
+
+    @property
+    def channels(self) -> frozenset[str]:
+        return frozenset(self._channels)
+
+    async def subscribe(self, *channels: str) -> None:
+        new_channels = [c for c in channels if c not in self._channels]
+        self._channels.update(new_channels)
+        await self._multiplexer._subscribe(self, new_channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        old_channels = [c for c in channels if c in self._channels]
+        self._channels.difference_update(old_channels)
+        await self._multiplexer._unsubscribe(self, old_channels)
+
+    async def listen(self) -> AsyncIterator[str]:
+        while True:
+            if self._overflowed:
+                raise SubscriptionOverflow()
+
+            yield await self._queue.get()
+
+    async def close(self) -> None:
+        await self.unsubscribe(*self._channels)
+
+    def _deliver(self, data: str) -> None:
+        if self._overflowed:
+            return
+
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self._overflowed = True
+
+            # Messages after the ones which didn't fit are useless, so free the
+            # buffer now rather than when the websocket closes
+            self._queue = asyncio.Queue(maxsize=1)
+
+
+class Multiplexer:
+    def __init__(self, redis_client: redis.Redis) -> None:
+        self._pubsub = redis_client.pubsub()
+
+        # Keeps the shared connection subscribed to something at all times, so
+        # that `PubSub.listen` doesn't return when the last websocket leaves.
+        self._worker_channel = f'chat-worker-{uuid.uuid4()}'
+
+        self._subscribers: dict[str, set[Subscription]] = {}
+
+        # Serializes SUBSCRIBE/UNSUBSCRIBE commands so Redis sees them in the
+        # same order as the reference counts above change.
+        self._lock = asyncio.Lock()
+
+        self._reader_task: asyncio.Task[None] | None = None
+
+    def subscription(self) -> Subscription:
+        return Subscription(self)
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._subscribers.get(channel, ()))
+
+    async def _start(self) -> None:
+        if self._reader_task is not None:
+            return
+
+        await self._pubsub.subscribe(self._worker_channel)
+
+        # asyncio.create_task requires some manual memory management!
+        # https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
+        self._reader_task = asyncio.create_task(self._read_forever())
+
+    async def _subscribe(
+        self,
+        subscription: Subscription,
+        channels: Iterable[str],
+    ) -> None:
+        async with self._lock:
+            await self._start()
+
+            to_subscribe = []
+            for channel in channels:
+                subscribers = self._subscribers.setdefault(channel, set())
+                if not subscribers:
+                    to_subscribe.append(channel)
+                subscribers.add(subscription)
+
+            if to_subscribe:
+                await self._pubsub.subscribe(*to_subscribe)
+
+    async def _unsubscribe(
+        self,
+        subscription: Subscription,
+        channels: Iterable[str],
+    ) -> None:
+        async with self._lock:
+            to_unsubscribe = []
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+                    to_unsubscribe.append(channel)
+
+            if to_unsubscribe:
+                await self._pubsub.unsubscribe(*to_unsubscribe)
+
+    def _fan_out(self, channel: str, data: str) -> None:
+        for subscription in list(self._subscribers.get(channel, ())):
+            subscription._deliver(data)
+
+    async def _read_forever(self) -> None:
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message is None or message.get("type") != "message":
+                        continue
+
+                    self._fan_out(message['channel'], message['data'])
+            except asyncio.CancelledError:
+                raise
+            except:
+                # The pub/sub connection resubscribes to every channel when it
+                # reconnects, so all that's needed here is to keep reading.
+                print(traceback.format_exc())
+                await asyncio.sleep(1)
@@ -0,0 +1,114 @@
+import unittest
+import asyncio
+from unittest.mock import AsyncMock, call, patch
+import redis.asyncio as redis
+from service.chat.pubsub import Multiplexer, SubscriptionOverflow
+
+class TestMultiplexer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.multiplexer = Multiplexer(redis.Redis())
+
+        self.redis_subscribe = AsyncMock()
+        self.redis_unsubscribe = AsyncMock()
+
+        patchers = [
+            patch.object(self.multiplexer, '_start', AsyncMock()),
+            patch.object(
+                self.multiplexer._pubsub, 'subscribe', self.redis_subscribe),
+            patch.object(
+                self.multiplexer._pubsub, 'unsubscribe', self.redis_unsubscribe),
+        ]
+
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_shared_channel_is_subscribed_once(self) -> None:
+        a = self.multiplexer.subscription()
+        b = self.multiplexer.subscription()
+
+        await a.subscribe('alice')
+        await b.subscribe('alice')
+
+        self.redis_subscribe.assert_called_once_with('alice')
+        self.assertEqual(self.multiplexer.subscriber_count('alice'), 2)
+
+    async def test_channel_is_unsubscribed_by_last_subscriber(self) -> None:
+        a = self.multiplexer.subscription()
+        b = self.multiplexer.subscription()
+
+        await a.subscribe('alice')
+        await b.subscribe('alice')
+
+        await a.unsubscribe('alice')
+        self.redis_unsubscribe.assert_not_called()
+
+        await b.unsubscribe('alice')
+        self.redis_unsubscribe.assert_called_once_with('alice')
+        self.assertEqual(self.multiplexer.subscriber_count('alice'), 0)
+
+    async def test_close_releases_every_channel(self) -> None:
+        a = self.multiplexer.subscription()
+
+        await a.subscribe('connection-uuid')
+        await a.subscribe('alice', 'online-bob')
+        await a.close()
+
+        self.assertEqual(a.channels, frozenset())
+        self.assertEqual(
+            set(self.redis_unsubscribe.call_args.args),
+            {'connection-uuid', 'alice', 'online-bob'},
+        )
+
+    async def test_messages_fan_out_to_interested_subscribers(self) -> None:
+        a = self.multiplexer.subscription()
+        b = self.multiplexer.subscription()
+
+        await a.subscribe('alice')
+        await b.subscribe('alice', 'bob')
+
+        self.multiplexer._fan_out('alice', 'message-1')
+        self.multiplexer._fan_out('bob', 'message-2')
+        self.multiplexer._fan_out('carol', 'message-3')
+
+        a_messages = a.listen()
+        b_messages = b.listen()
+
+        self.assertEqual(await anext(a_messages), 'message-1')
+        self.assertEqual(await anext(b_messages), 'message-1')
+        self.assertEqual(await anext(b_messages), 'message-2')
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(anext(a_messages), timeout=0.1)
+
+    async def test_repeated_subscribe_is_a_no_op(self) -> None:
+        a = self.multiplexer.subscription()
+
+        await a.subscribe('alice')
+        await a.subscribe('alice')
+
+        self.assertEqual(self.redis_subscribe.call_args_list, [call('alice')])
+
+    async def test_overflowing_subscriber_is_dropped(self) -> None:
+        with patch('service.chat.pubsub.SUBSCRIPTION_QUEUE_SIZE', 2):
+            a = self.multiplexer.subscription()
+        b = self.multiplexer.subscription()
+
+        await a.subscribe('alice')
+        await b.subscribe('alice')
+
+        for i in range(3):
+            self.multiplexer._fan_out('alice', f'message-{i}')
+
+        a_messages = a.listen()
+
+        with self.assertRaises(SubscriptionOverflow):
+            await anext(a_messages)
+
+        b_messages = b.listen()
+        for i in range(3):
+            self.assertEqual(await anext(b_messages), f'message-{i}')
+
+if __name__ == '__main__':
+    unittest.main()
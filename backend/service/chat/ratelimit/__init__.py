@@ -1,8 +1,21 @@
-from async_lru_cache import AsyncLruCache
-from database.asyncdatabase import api_tx
+import time
+import traceback
 from enum import Enum
 from dataclasses import dataclass
+import redis.asyncio as redis
 from chatprotocol.outbound import MessageBlocked, Outbound
+from chatratelimit import (
+    INTRO_WINDOW_SECONDS,
+    RATE_LIMIT_RECONCILE_SECONDS,
+    REPORT_WINDOW_SECONDS,
+    RUDE_MESSAGE_WINDOW_SECONDS,
+    intros_key,
+    reconciled_key,
+    reports_key,
+    rude_messages_key,
+)
+from database.asyncdatabase import api_tx, row_str
+from util.coerce import number
 
 class DefaultRateLimit(Enum):
     NONE = 0
@@ -11,10 +24,15 @@ class DefaultRateLimit(Enum):
     PHOTOS = 30
 
 
-Q_RATE_LIMIT_REASON = f"""
-WITH truncated_daily_message AS (
+# The events which `Row` counts, as they're recorded in Redis. Postgres is the
+# source of truth, so this corrects the sorted sets whenever their person's
+# reconciliation expires. Each event's time is given as its age, so that it
+# doesn't depend on the database's time zone.
+Q_RATE_LIMIT_EVENTS = f"""
+WITH intro AS (
     SELECT
-        1
+        m1.object_person_id::TEXT AS member,
+        m1.created_at
     FROM
         messaged AS m1
     WHERE
@@ -36,9 +54,10 @@ WITH truncated_daily_message AS (
         )
     LIMIT
         {max(x.value for x in DefaultRateLimit)}
-), recent_manual_report_count AS (
+), report AS (
     SELECT
-        count(*)
+        subject_person_id::TEXT AS member,
+        created_at
     FROM
         skipped
     WHERE
@@ -57,30 +76,37 @@ WITH truncated_daily_message AS (
         AND
             person.roles @> ARRAY['bot']
     )
-), recent_rude_message_count AS (
+), rude AS (
     SELECT
-        count(*)
+        created_at::TEXT AS member,
+        created_at
     FROM
         rude_message
     WHERE
         person_id = %(from_id)s
     AND
         created_at > now() - interval '1 day'
-), truncated_daily_message_count AS (
-    SELECT COUNT(*) AS x FROM truncated_daily_message
 )
 SELECT
-    person.verification_level_id,
-    truncated_daily_message_count.x AS daily_message_count,
-    recent_manual_report_count.count AS recent_manual_report_count,
-    recent_rude_message_count.count AS recent_rude_message_count
+    'intro' AS kind,
+    member,
+    EXTRACT(EPOCH FROM now() - created_at)::FLOAT AS age_seconds
+FROM
+    intro
+UNION ALL
+SELECT
+    'report' AS kind,
+    member,
+    EXTRACT(EPOCH FROM now() - created_at)::FLOAT AS age_seconds
+FROM
+    report
+UNION ALL
+SELECT
+    'rude_message' AS kind,
+    member,
+    EXTRACT(EPOCH FROM now() - created_at)::FLOAT AS age_seconds
 FROM
-    person,
-    truncated_daily_message_count,
-    recent_manual_report_count,
-    recent_rude_message_count
-WHERE
-    id = %(from_id)s
+    rude
 """
 
 
@@ -144,20 +170,106 @@ def pure_maybe_fetch_rate_limit(row: Row, stanza_id: str) -> list[Outbound]:
     return get_stanza(default_rate_limit, stanza_id)
 
 
-@AsyncLruCache(maxsize=1024, ttl=5)  # 5 seconds
-async def fetch_rate_limit_reason(from_id: int) -> Row:
+def _windows(person_id: int) -> dict[str, tuple[str, int]]:
+    """Each kind of event in `Q_RATE_LIMIT_EVENTS`: its key and its window"""
+    return {
+        'intro': (intros_key(person_id), INTRO_WINDOW_SECONDS),
+        'report': (reports_key(person_id), REPORT_WINDOW_SECONDS),
+        'rude_message': (
+            rude_messages_key(person_id),
+            RUDE_MESSAGE_WINDOW_SECONDS,
+        ),
+    }
+
+
+async def _reconcile(
+    redis_client: redis.Redis,
+    person_id: int,
+    now: float,
+) -> dict[str, int]:
+    """
+    Replaces `person_id`'s events in Redis with the ones in Postgres, returning
+    how many there are of each kind. Events recorded in Redis after `now` are
+    kept, since Postgres might not have seen them yet.
+    """
     async with api_tx('read committed') as tx:
-        row = await tx.require_one(Q_RATE_LIMIT_REASON, dict(from_id=from_id))
+        await tx.execute(Q_RATE_LIMIT_EVENTS, dict(from_id=person_id))
+        rows = await tx.fetchall()
+
+    windows = _windows(person_id)
+
+    events: dict[str, dict[str, float]] = {kind: {} for kind in windows}
+    for row in rows:
+        events[row_str(row, 'kind')][row_str(row, 'member')] = (
+            now - number(row['age_seconds'], 'age_seconds'))
+
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for kind, (key, window) in windows.items():
+                pipe.zremrangebyscore(key, '-inf', now)
+                if events[kind]:
+                    pipe.zadd(key, events[kind])
+                pipe.expire(key, window)
+            pipe.set(reconciled_key(person_id), 1, ex=RATE_LIMIT_RECONCILE_SECONDS)
+            await pipe.execute()
+    except:
+        print(traceback.format_exc())
+
+    return {kind: len(members) for kind, members in events.items()}
+
+
+async def fetch_rate_limit_row(
+    redis_client: redis.Redis,
+    person_id: int,
+    verification_level_id: int,
+) -> Row:
+    """
+    Counts `person_id`'s recent events from the sliding windows in Redis,
+    falling back to Postgres when they're due to be reconciled
+    """
+    now = time.time()
+
+    windows = _windows(person_id)
+
+    counts: dict[str, int] | None = None
+
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.exists(reconciled_key(person_id))
+            for key, window in windows.values():
+                pipe.zcount(key, now - window, '+inf')
+            is_reconciled, *window_counts = await pipe.execute()
+
+        if is_reconciled:
+            counts = dict(zip(windows, window_counts))
+    except:
+        print(traceback.format_exc())
+
+    if counts is None:
+        counts = await _reconcile(redis_client, person_id, now)
 
     return Row(
-        verification_level_id=row['verification_level_id'],
-        daily_message_count=row['daily_message_count'],
-        recent_manual_report_count=row['recent_manual_report_count'],
-        recent_rude_message_count=row['recent_rude_message_count'],
+        verification_level_id=verification_level_id,
+        daily_message_count=counts['intro'],
+        recent_manual_report_count=counts['report'],
+        recent_rude_message_count=counts['rude_message'],
     )
 
 
-async def maybe_fetch_rate_limit(from_id: int, stanza_id: str) -> list[Outbound]:
-    row = await fetch_rate_limit_reason(from_id=from_id)
+async def record_intro(
+    redis_client: redis.Redis,
+    from_id: int,
+    to_id: int,
+) -> None:
+    """Counts the first message which `from_id` sent `to_id` as an intro"""
+    now = time.time()
+    key = intros_key(from_id)
 
-    return pure_maybe_fetch_rate_limit(row, stanza_id)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {str(to_id): now}, nx=True)
+            pipe.zremrangebyscore(key, '-inf', now - INTRO_WINDOW_SECONDS)
+            pipe.expire(key, INTRO_WINDOW_SECONDS)
+            await pipe.execute()
+    except:
+        print(traceback.format_exc())
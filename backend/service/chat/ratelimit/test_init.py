@@ -1,5 +1,7 @@
 import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
 from service.chat.ratelimit import (
+    fetch_rate_limit_row,
     get_default_rate_limit,
     get_stanza,
     DefaultRateLimit,
@@ -252,5 +254,75 @@ class TestRateLimit(unittest.TestCase):
         self.assertIn('Unhandled rate limit reason', str(cm.exception))
 
 
+class _FakePipeline:
+    def __init__(self, results: list[object]) -> None:
+        self.commands: list[str] = []
+        self._results = results
+
+    async def __aenter__(self) -> '_FakePipeline':
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        pass
+
+    def __getattr__(self, name: str) -> MagicMock:
+        return MagicMock(side_effect=lambda *a, **k: self.commands.append(name))
+
+    async def execute(self) -> list[object]:
+        return self._results
+
+
+class TestFetchRateLimitRow(unittest.IsolatedAsyncioTestCase):
+    async def test_counts_sliding_windows_when_reconciled(self) -> None:
+        pipeline = _FakePipeline([1, 7, 2, 3])
+        redis_client = MagicMock()
+        redis_client.pipeline.return_value = pipeline
+
+        with patch('service.chat.ratelimit._reconcile', AsyncMock()) as reconcile:
+            row = await fetch_rate_limit_row(redis_client, 42, 3)
+
+        reconcile.assert_not_awaited()
+        self.assertEqual(
+            pipeline.commands,
+            ['exists', 'zcount', 'zcount', 'zcount'])
+        self.assertEqual(
+            row,
+            Row(
+                verification_level_id=3,
+                daily_message_count=7,
+                recent_manual_report_count=2,
+                recent_rude_message_count=3,
+            ))
+
+    async def test_reconciles_from_postgres_when_due(self) -> None:
+        redis_client = MagicMock()
+        redis_client.pipeline.return_value = _FakePipeline([0, 0, 0, 0])
+
+        reconcile = AsyncMock(
+            return_value=dict(intro=4, report=1, rude_message=0))
+
+        with patch('service.chat.ratelimit._reconcile', reconcile):
+            row = await fetch_rate_limit_row(redis_client, 42, 2)
+
+        reconcile.assert_awaited_once()
+        self.assertEqual(row.daily_message_count, 4)
+        self.assertEqual(row.recent_manual_report_count, 1)
+
+    async def test_falls_back_to_postgres_when_redis_fails(self) -> None:
+        redis_client = MagicMock()
+        redis_client.pipeline.side_effect = ConnectionError()
+
+        reconcile = AsyncMock(
+            return_value=dict(intro=0, report=0, rude_message=5))
+
+        with \
+                patch('service.chat.ratelimit._reconcile', reconcile), \
+                patch('builtins.print'):
+            row = await fetch_rate_limit_row(redis_client, 42, 1)
+
+        reconcile.assert_awaited_once()
+        self.assertEqual(row.recent_rude_message_count, 5)
+
+
 if __name__ == '__main__':
     unittest.main()
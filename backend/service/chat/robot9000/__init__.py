@@ -1,7 +1,48 @@
-from database import api_tx
-from typing import List
-from batcher import Batcher
+"""
+Tracks how many times each intro has been sent, so that intros which aren't
+unique can be rejected.
+
+Most intros are unique, so each chat worker keeps a Bloom filter of the hashes
+in `intro_hash`, and `intro_use_count` in `service.chat` only queries the table
+when the filter says the hash might be in it. The filter is loaded from the
+table in pages when the worker first needs it; until then, every hash is looked
+up. Hashes which any worker writes to the table afterwards are published on a
+Redis stream, which every worker follows. A worker which falls more than
+`_STREAM_MAXLEN` entries behind misses some, and lets the duplicates they'd
+have caught through.
+
+See `service.chat.robot9000.bloomfilter` for the memory which
+`DUO_INTRO_HASH_FILTER_CAPACITY` and `DUO_INTRO_HASH_FILTER_ERROR_RATE` cost,
+and `service.chat.robot9000.benchmark` to measure it.
+"""
+
+import asyncio
+import os
+import traceback
+from database.asyncdatabase import api_tx, row_str
+from typing import List, cast
+from batcher import AsyncBatcher
 from collections import Counter
+import redis.asyncio as redis
+from redisclient import REDIS_HOST, REDIS_PORT
+from service.chat.robot9000.bloomfilter import BloomFilter
+
+
+INTRO_HASH_FILTER_CAPACITY = int(os.environ.get(
+    'DUO_INTRO_HASH_FILTER_CAPACITY',
+    str(10_000_000),
+))
+
+INTRO_HASH_FILTER_ERROR_RATE = float(os.environ.get(
+    'DUO_INTRO_HASH_FILTER_ERROR_RATE',
+    str(0.01),
+))
+
+_STREAM = 'intro-hashes'
+
+_STREAM_MAXLEN = 100_000
+
+_PAGE_SIZE = 10_000
 
 
 Q_SELECT_INTRO_HASH = """
@@ -30,7 +71,141 @@ ON CONFLICT (hash) DO UPDATE SET
 """
 
 
-def process_batch(batch: List[str]) -> None:
+Q_SELECT_INTRO_HASHES = """
+SELECT
+    hash
+FROM
+    intro_hash
+WHERE
+    hash > %(after)s
+ORDER BY
+    hash
+LIMIT
+    %(limit)s
+"""
+
+
+class IntroHashFilter:
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        capacity: int = INTRO_HASH_FILTER_CAPACITY,
+        error_rate: float = INTRO_HASH_FILTER_ERROR_RATE,
+    ) -> None:
+        self._redis_client = redis_client
+        self._bloom_filter = BloomFilter(capacity, error_rate)
+        self._is_loaded = False
+        self._task: asyncio.Task[None] | None = None
+
+    def might_contain(self, hashed: str) -> bool:
+        self._maybe_start_task()
+
+        return not self._is_loaded or hashed in self._bloom_filter
+
+    def add(self, hashed: str) -> None:
+        self._bloom_filter.add(hashed)
+
+    async def publish(self, hashes: List[str]) -> None:
+        await self._redis_client.xadd(
+            _STREAM,
+            {'hashes': ' '.join(hashes)},
+            maxlen=_STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    def _maybe_start_task(self) -> None:
+        if self._task is not None:
+            return
+
+        # asyncio.create_task requires some manual memory management!
+        # https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
+        self._task = asyncio.create_task(self._load_and_follow())
+
+    async def _load_and_follow(self) -> None:
+        # The stream is followed from before the table is read, so that hashes
+        # written while it's being read aren't missed
+        last_id = await self._last_stream_id()
+
+        follow_task = asyncio.create_task(self._follow_stream(last_id))
+
+        await self._load_table()
+
+        self._is_loaded = True
+
+        await follow_task
+
+    async def _last_stream_id(self) -> str:
+        while True:
+            try:
+                entries = cast(
+                    list[tuple[str, dict[str, str]]],
+                    await self._redis_client.xrevrange(_STREAM, count=1))
+                return entries[0][0] if entries else '0-0'
+            except asyncio.CancelledError:
+                raise
+            except:
+                print(traceback.format_exc())
+                await asyncio.sleep(1)
+
+    async def _load_table(self) -> None:
+        after = ''
+
+        while True:
+            try:
+                async with api_tx('read committed', priority='low') as tx:
+                    await tx.execute(
+                        Q_SELECT_INTRO_HASHES,
+                        dict(after=after, limit=_PAGE_SIZE))
+                    rows = await tx.fetchall()
+            except asyncio.CancelledError:
+                raise
+            except:
+                print(traceback.format_exc())
+                await asyncio.sleep(1)
+                continue
+
+            hashes = [row_str(row, 'hash') for row in rows]
+
+            self._bloom_filter.add_many(hashes)
+
+            if len(hashes) < _PAGE_SIZE:
+                return
+
+            after = hashes[-1]
+
+    async def _follow_stream(self, last_id: str) -> None:
+        while True:
+            try:
+                response = cast(
+                    list[tuple[str, list[tuple[str, dict[str, str]]]]],
+                    await self._redis_client.xread(
+                        {_STREAM: last_id},
+                        count=1000,
+                        block=5000,
+                    ))
+            except asyncio.CancelledError:
+                raise
+            except:
+                print(traceback.format_exc())
+                await asyncio.sleep(1)
+                continue
+
+            for _, entries in response:
+                for entry_id, fields in entries:
+                    self._bloom_filter.add_many(fields['hashes'].split())
+                    last_id = entry_id
+
+
+INTRO_HASH_FILTER = IntroHashFilter(
+    redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        decode_responses=True,
+    ),
+)
+
+
+async def process_batch(batch: List[str]) -> None:
     hash_counts = Counter(batch)
 
     params_seq = [
@@ -38,11 +213,16 @@ def process_batch(batch: List[str]) -> None:
         for hash, used_count in hash_counts.items()
     ]
 
-    with api_tx('read committed') as tx:
-        tx.executemany(Q_UPSERT_INTRO_HASH, params_seq)
+    async with api_tx('read committed', priority='low') as tx:
+        await tx.executemany(Q_UPSERT_INTRO_HASH, params_seq)
+
+    try:
+        await INTRO_HASH_FILTER.publish(list(hash_counts))
+    except:
+        print(traceback.format_exc())
 
 
-_batcher = Batcher[str](
+_batcher = AsyncBatcher[str](
     process_fn=process_batch,
     flush_interval=1.0,
     min_batch_size=1,
@@ -55,4 +235,5 @@ _batcher.start()
 
 
 def upsert_intro_hash(hashed: str) -> None:
+    INTRO_HASH_FILTER.add(hashed)
     _batcher.enqueue(hashed)
@@ -0,0 +1,60 @@
+"""
+Measures the `BloomFilter` which `IntroHashFilter` keeps in each chat worker:
+how much memory it takes, how long loading `capacity` hashes takes, how many
+lookups per second it answers, and how often it answers a lookup of a hash
+which wasn't added with a false positive. Doesn't need a database:
+
+    python3 -m service.chat.robot9000.benchmark [capacity] [error_rate]
+"""
+
+import sys
+import time
+import duohash
+from service.chat.robot9000 import (
+    INTRO_HASH_FILTER_CAPACITY,
+    INTRO_HASH_FILTER_ERROR_RATE,
+)
+from service.chat.robot9000.bloomfilter import BloomFilter
+
+
+_NUM_LOOKUPS = 100_000
+
+
+def _hashes(prefix: str, n: int) -> list[str]:
+    return [duohash.md5(f'{prefix}{i}') for i in range(n)]
+
+
+def main() -> None:
+    capacity = (
+        int(sys.argv[1]) if len(sys.argv) > 1
+        else INTRO_HASH_FILTER_CAPACITY)
+
+    error_rate = (
+        float(sys.argv[2]) if len(sys.argv) > 2
+        else INTRO_HASH_FILTER_ERROR_RATE)
+
+    bloom_filter = BloomFilter(capacity, error_rate)
+
+    added = _hashes('added', capacity)
+    not_added = _hashes('not-added', _NUM_LOOKUPS)
+
+    start = time.perf_counter()
+    bloom_filter.add_many(added)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    false_positives = sum(hashed in bloom_filter for hashed in not_added)
+    lookup_seconds = time.perf_counter() - start
+
+    print(
+        f'capacity={capacity} error_rate={error_rate}: '
+        f'size={bloom_filter.size_bytes / 1e6:.1f}MB, '
+        f'num_hashes={bloom_filter.num_hashes}, '
+        f'load={load_seconds:.2f}s ({capacity / load_seconds:.0f} hashes/s), '
+        f'lookups={_NUM_LOOKUPS / lookup_seconds:.0f}/s, '
+        f'false_positive_rate={false_positives / _NUM_LOOKUPS:.4f}'
+    )
+
+
+if __name__ == '__main__':
+    main()
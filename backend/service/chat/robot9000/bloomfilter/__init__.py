@@ -0,0 +1,97 @@
+"""
+A Bloom filter of hex digests, such as the MD5s in `intro_hash`.
+
+The keys are already uniformly distributed, so rather than hashing them again,
+the first 128 bits of each key are taken as two 64-bit hashes and combined into
+the filter's `num_hashes` bit positions by double hashing:
+
+    position(i) = (h1 + i * h2) mod 2**64 mod num_bits
+
+`add_many` computes the positions of many keys at once with numpy, which is
+what makes loading millions of keys quick. Single keys take the same positions
+using Python's integers.
+
+For `capacity` keys and a false positive rate of `error_rate`, the filter needs
+
+    num_bits   = -capacity * ln(error_rate) / ln(2)**2
+    num_hashes = num_bits / capacity * ln(2)
+
+which is about 1.2 MB and 7 hashes per million keys at a 1% rate. Adding more
+than `capacity` keys still works, but the false positive rate rises.
+"""
+
+import math
+from collections.abc import Sequence
+import numpy
+import numpy.typing as npt
+
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _hashes(key: str) -> tuple[int, int]:
+    # `h2` is odd, so that no two of a key's positions coincide when
+    # `num_bits` is a power of two
+    return int(key[0:16], 16), int(key[16:32], 16) | 1
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+
+        self.num_bits = max(
+            8,
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+
+        self.num_hashes = max(
+            1,
+            round(self.num_bits / capacity * math.log(2)))
+
+        self._bits = numpy.zeros(-(-self.num_bits // 8), dtype=numpy.uint8)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bits.nbytes
+
+    def _positions(self, key: str) -> list[int]:
+        h1, h2 = _hashes(key)
+
+        return [
+            ((h1 + i * h2) & _MASK_64) % self.num_bits
+            for i in range(self.num_hashes)
+        ]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def add_many(self, keys: Sequence[str]) -> None:
+        if not keys:
+            return
+
+        hashes = numpy.array([_hashes(key) for key in keys], dtype=numpy.uint64)
+
+        # uint64 arithmetic wraps around, like `_MASK_64` in `_positions`
+        with numpy.errstate(over='ignore'):
+            positions: npt.NDArray[numpy.uint64] = (
+                hashes[:, :1] +
+                numpy.arange(self.num_hashes, dtype=numpy.uint64) * hashes[:, 1:]
+            ) % numpy.uint64(self.num_bits)
+
+        positions = positions.ravel()
+
+        numpy.bitwise_or.at(
+            self._bits,
+            (positions >> numpy.uint64(3)).astype(numpy.intp),
+            (numpy.uint64(1) << (positions & numpy.uint64(7))).astype(numpy.uint8),
+        )
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
@@ -0,0 +1,66 @@
+import unittest
+import duohash
+from service.chat.robot9000.bloomfilter import BloomFilter
+
+
+def _keys(prefix: str, n: int) -> list[str]:
+    return [duohash.md5(f'{prefix}{i}') for i in range(n)]
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_has_no_false_negatives(self) -> None:
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+
+        added = _keys('added', 1000)
+        for key in added[:500]:
+            bloom_filter.add(key)
+        bloom_filter.add_many(added[500:])
+
+        self.assertTrue(all(key in bloom_filter for key in added))
+
+    def test_add_and_add_many_set_the_same_bits(self) -> None:
+        keys = _keys('key', 100)
+
+        one_at_a_time = BloomFilter(capacity=100, error_rate=0.01)
+        for key in keys:
+            one_at_a_time.add(key)
+
+        all_at_once = BloomFilter(capacity=100, error_rate=0.01)
+        all_at_once.add_many(keys)
+
+        self.assertEqual(
+            one_at_a_time._bits.tobytes(),
+            all_at_once._bits.tobytes())
+
+    def test_false_positive_rate_is_near_error_rate(self) -> None:
+        bloom_filter = BloomFilter(capacity=10000, error_rate=0.01)
+        bloom_filter.add_many(_keys('added', 10000))
+
+        false_positives = sum(
+            key in bloom_filter
+            for key in _keys('not-added', 10000))
+
+        self.assertLess(false_positives / 10000, 0.02)
+
+    def test_is_sized_for_capacity_and_error_rate(self) -> None:
+        bloom_filter = BloomFilter(capacity=1_000_000, error_rate=0.01)
+
+        self.assertEqual(bloom_filter.num_hashes, 7)
+        self.assertAlmostEqual(bloom_filter.size_bytes / 1e6, 1.2, places=1)
+
+    def test_empty_filter_contains_nothing(self) -> None:
+        bloom_filter = BloomFilter(capacity=10, error_rate=0.01)
+        bloom_filter.add_many([])
+
+        self.assertFalse(duohash.md5('hello') in bloom_filter)
+
+    def test_rejects_invalid_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            BloomFilter(capacity=0, error_rate=0.01)
+
+        with self.assertRaises(ValueError):
+            BloomFilter(capacity=10, error_rate=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import duohash
+from service.chat.robot9000 import IntroHashFilter
+
+
+class TestIntroHashFilter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis_client = AsyncMock()
+
+        self.filter = IntroHashFilter(
+            self.redis_client,
+            capacity=1000,
+            error_rate=0.01,
+        )
+
+        self.filter._maybe_start_task = MagicMock() # type: ignore
+
+    async def test_everything_might_be_contained_until_loaded(self) -> None:
+        self.assertTrue(self.filter.might_contain(duohash.md5('hello')))
+
+        self.filter._is_loaded = True
+
+        self.assertFalse(self.filter.might_contain(duohash.md5('hello')))
+
+    async def test_added_hashes_might_be_contained(self) -> None:
+        self.filter._is_loaded = True
+        self.filter.add(duohash.md5('hello'))
+
+        self.assertTrue(self.filter.might_contain(duohash.md5('hello')))
+
+    async def test_published_hashes_are_added_from_the_stream(self) -> None:
+        hashes = [duohash.md5('hello'), duohash.md5('world')]
+
+        self.redis_client.xread.side_effect = [
+            [('intro-hashes', [('1-0', {'hashes': ' '.join(hashes)})])],
+            asyncio.CancelledError(),
+        ]
+
+        with self.assertRaises(asyncio.CancelledError):
+            await self.filter._follow_stream('0-0')
+
+        self.filter._is_loaded = True
+
+        self.assertTrue(all(self.filter.might_contain(h) for h in hashes))
+        self.assertEqual(
+            self.redis_client.xread.call_args.args[0],
+            {'intro-hashes': '1-0'})
+
+    async def test_publishing_trims_the_stream(self) -> None:
+        await self.filter.publish(['a', 'b'])
+
+        self.redis_client.xadd.assert_awaited_once_with(
+            'intro-hashes',
+            {'hashes': 'a b'},
+            maxlen=100_000,
+            approximate=True,
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
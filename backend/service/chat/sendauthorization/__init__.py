@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from async_lru_cache import AsyncLruCache
+from database.asyncdatabase import api_tx, row_bool, row_int
+
+
+# Everything which sending a message checks in Postgres, besides what's in
+# `service.chat.authcache`, in one round trip. The rate limit's counts are kept
+# in Redis by `service.chat.ratelimit`.
+#
+# Accounts are trusted after they've been around for a day. Verified accounts
+# are trusted a bit sooner.
+Q_SEND_AUTHORIZATION = """
+SELECT
+    (
+        person.verification_required
+    AND
+        person.verification_level_id <= 1
+    ) AS is_verification_required,
+    NOT EXISTS (
+        SELECT
+            1
+        FROM
+            messaged
+        WHERE
+            subject_person_id = %(to_id)s AND object_person_id = %(from_id)s
+    ) AS is_intro,
+    NOT EXISTS (
+        SELECT
+            1
+        FROM
+            messaged
+        WHERE
+            subject_person_id = %(from_id)s AND object_person_id = %(to_id)s
+    ) AS is_first_message,
+    (
+        person.sign_up_time <
+        now() - (interval '1 day') / power(person.verification_level_id, 2)
+    ) AS is_trusted_account,
+    person.verification_level_id
+FROM
+    person
+WHERE
+    person.id = %(from_id)s
+"""
+
+
+@dataclass(frozen=True)
+class SendAuthorization:
+    is_verification_required: bool
+    is_intro: bool
+    is_first_message: bool
+    is_trusted_account: bool
+    verification_level_id: int
+
+
+def _is_settled(authorization: object) -> bool:
+    # `is_intro` and `is_first_message` flip to false when either person
+    # messages the other, which the other may already have done, so they're
+    # only cached once they've flipped. The rest are fine being a bit stale.
+    return (
+        isinstance(authorization, SendAuthorization)
+        and not authorization.is_intro
+        and not authorization.is_first_message
+    )
+
+
+@AsyncLruCache(ttl=3, cache_condition=_is_settled)  # 3 seconds
+async def fetch_send_authorization(
+    from_id: int,
+    to_id: int,
+) -> SendAuthorization | None:
+    async with api_tx('read committed') as tx:
+        await tx.execute(
+            Q_SEND_AUTHORIZATION,
+            dict(from_id=from_id, to_id=to_id))
+        row = await tx.fetchone()
+
+    if row is None:
+        return None
+
+    return SendAuthorization(
+        is_verification_required=row_bool(row, 'is_verification_required'),
+        is_intro=row_bool(row, 'is_intro'),
+        is_first_message=row_bool(row, 'is_first_message'),
+        is_trusted_account=row_bool(row, 'is_trusted_account'),
+        verification_level_id=row_int(row, 'verification_level_id'),
+    )
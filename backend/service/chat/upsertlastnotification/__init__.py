@@ -1,11 +1,11 @@
 from typing import Iterable
 from dataclasses import dataclass
-from database import api_tx
+from database.asyncdatabase import api_tx
 from commonsql import (
     Q_UPSERT_LAST_INTRO_NOTIFICATION_TIME,
     Q_UPSERT_LAST_CHAT_NOTIFICATION_TIME,
 )
-from batcher import Batcher
+from batcher import AsyncBatcher
 
 
 @dataclass
@@ -14,7 +14,7 @@ class LastNotification:
     is_intro: bool
 
 
-def execute_query(usernames: Iterable[str], is_intro: bool) -> None:
+async def execute_query(usernames: Iterable[str], is_intro: bool) -> None:
     if not usernames:
         return
 
@@ -25,21 +25,21 @@ def execute_query(usernames: Iterable[str], is_intro: bool) -> None:
 
     params_seq = [dict(username=username) for username in usernames]
 
-    with api_tx('read committed') as tx:
-        tx.executemany(q, params_seq)
+    async with api_tx('read committed', priority='low') as tx:
+        await tx.executemany(q, params_seq)
 
 
-def process_batch(last_notifications: Iterable[LastNotification]) -> None:
+async def process_batch(last_notifications: Iterable[LastNotification]) -> None:
     for is_intro in (True, False):
         usernames = set(
                 n.username
                 for n in last_notifications
                 if n.is_intro is is_intro)
 
-        execute_query(usernames=usernames, is_intro=is_intro)
+        await execute_query(usernames=usernames, is_intro=is_intro)
 
 
-_batcher = Batcher[LastNotification](
+_batcher = AsyncBatcher[LastNotification](
     process_fn=process_batch,
     flush_interval=1.0,
     min_batch_size=1,
@@ -13,6 +13,7 @@ from service.cron.photocleaner import clean_photos_forever
 from service.cron.audiocleaner import clean_audio_forever
 from service.cron.verificationjobrunner import verify_forever
 from service.cron.profilereporter import report_profiles_forever
+from service.cron.searchwarmup import warm_searches_forever
 import asyncio
 from http.server import SimpleHTTPRequestHandler
 from socketserver import TCPServer
@@ -68,6 +69,8 @@ async def main() -> None:
 
         refresh_club_seo_forever(),
 
+        warm_searches_forever(),
+
         check_connections_forever(),
 
         http_server(),
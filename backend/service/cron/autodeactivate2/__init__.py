@@ -55,7 +55,7 @@ async def autodeactivate2_once() -> None:
         dry_run=DRY_RUN,
     )
 
-    async with api_tx() as tx:
+    async with api_tx(priority='low') as tx:
         cur_deactivated = await tx.execute(Q_DEACTIVATE, params)
         rows_deactivated = await cur_deactivated.fetchall()
 
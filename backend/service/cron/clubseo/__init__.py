@@ -110,7 +110,7 @@ async def refresh_club_stats_once() -> None:
     if not is_offpeak(CLUB_SEO_MAX_LOAD_PCT, 'refresh_club_stats_once'):
         return
 
-    async with api_tx('READ COMMITTED') as tx:
+    async with api_tx('READ COMMITTED', priority='low') as tx:
         await tx.execute('SET LOCAL statement_timeout = 60000')
         cur = await tx.execute(Q_CLUB_STATS_BATCH, dict(
             batch_size=CLUB_STATS_BATCH_SIZE,
@@ -133,7 +133,7 @@ async def refresh_club_top_answers_once() -> None:
     if not is_offpeak(CLUB_SEO_MAX_LOAD_PCT, 'refresh_club_top_answers_once'):
         return
 
-    async with api_tx('READ COMMITTED') as tx:
+    async with api_tx('READ COMMITTED', priority='low') as tx:
         # One popular club's answer-join alone is tens of seconds cold;
         # give the statement headroom rather than livelock the cron on it.
         await tx.execute('SET LOCAL statement_timeout = 600000')
@@ -159,7 +159,7 @@ async def refresh_club_overlap_once() -> None:
 
     # DELETE + INSERT in one transaction: readers see the previous snapshot
     # under MVCC until commit, so there's no empty window.
-    async with api_tx('READ COMMITTED') as tx:
+    async with api_tx('READ COMMITTED', priority='low') as tx:
         await tx.execute('SET LOCAL statement_timeout = 600000')
         # At the default work_mem (4 MB) both sorts and the HashAggregate
         # spill to disk and the rebuild runs ~2x slower (~22 s vs ~12 s).
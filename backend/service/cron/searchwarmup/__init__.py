@@ -0,0 +1,125 @@
+import database
+from database.asyncdatabase import api_tx
+from service.cron.cronutil import print_stacktrace, MAX_RANDOM_START_DELAY
+from service.cron.searchwarmup.sql import Q_SEARCH_WARMUP_BATCH
+from search import personalityindex
+from search.sql import (
+    Q_MARK_SEARCH_CACHE_WARM,
+    Q_UNCACHED_SEARCH_2,
+    Q_UNCACHED_SEARCH_2_FROM_INDEX,
+)
+from util import is_offpeak
+import asyncio
+import os
+import random
+
+SEARCH_WARMUP_POLL_SECONDS = int(os.environ.get(
+    'DUO_CRON_SEARCH_WARMUP_POLL_SECONDS',
+    str(60),
+))
+
+SEARCH_WARMUP_BATCH_SIZE = int(os.environ.get(
+    'DUO_CRON_SEARCH_WARMUP_BATCH_SIZE',
+    str(50),
+))
+
+SEARCH_WARMUP_MAX_LOAD_PCT = float(os.environ.get(
+    'DUO_CRON_SEARCH_WARMUP_MAX_LOAD_PCT',
+    str(50),
+))
+
+# People who haven't been online for this many days aren't expected back soon
+SEARCH_WARMUP_ACTIVE_DAYS = int(os.environ.get(
+    'DUO_CRON_SEARCH_WARMUP_ACTIVE_DAYS',
+    str(7),
+))
+
+# People who were online more recently than this may still be browsing their
+# own search results, which shouldn't change under them
+SEARCH_WARMUP_IDLE_SECONDS = int(os.environ.get(
+    'DUO_CRON_SEARCH_WARMUP_IDLE_SECONDS',
+    str(60 * 60), # 1 hour
+))
+
+# Searches are warmed again once they're this old. Should be less than the
+# API's `DUO_SEARCH_WARM_MAX_AGE_SECONDS`, so that they stay servable.
+SEARCH_WARMUP_REFRESH_SECONDS = int(os.environ.get(
+    'DUO_CRON_SEARCH_WARMUP_REFRESH_SECONDS',
+    str(6 * 60 * 60), # 6 hours
+))
+
+print(f'Hello from cron module: {__name__}')
+
+
+def _candidates(
+    person_id: int,
+    gender_preference: list[int],
+) -> personalityindex.Candidates | None:
+    with database.api_tx('READ COMMITTED') as tx:
+        return personalityindex.candidates(
+            tx=tx,
+            searcher_person_id=person_id,
+            gender_preference=gender_preference)
+
+
+async def warm_search(person_id: int, gender_preference: list[int]) -> None:
+    params = dict(
+        searcher_person_id=person_id,
+        gender_preference=gender_preference,
+    )
+
+    # The same candidates the API would rank, so that the warmed first page is
+    # the one the searcher would otherwise have waited for
+    candidates = await asyncio.to_thread(
+        _candidates,
+        person_id=person_id,
+        gender_preference=gender_preference,
+    )
+
+    async with api_tx('READ COMMITTED', priority='low') as tx:
+        await tx.execute('SET LOCAL statement_timeout = 60000')
+
+        if candidates is None:
+            await tx.execute(Q_UNCACHED_SEARCH_2, params)
+        else:
+            await tx.execute(
+                Q_UNCACHED_SEARCH_2_FROM_INDEX,
+                params | dict(prospect_ids=candidates.ids))
+
+        await tx.execute(Q_MARK_SEARCH_CACHE_WARM, params)
+
+
+async def warm_searches_once() -> None:
+    if not is_offpeak(SEARCH_WARMUP_MAX_LOAD_PCT, 'warm_searches_once'):
+        return
+
+    # Until it's built, searches would be ranked by Postgres rather than the
+    # way the API ranks them
+    if not personalityindex.is_ready():
+        return
+
+    async with api_tx('READ COMMITTED', priority='low') as tx:
+        cur = await tx.execute(Q_SEARCH_WARMUP_BATCH, dict(
+            active_days=SEARCH_WARMUP_ACTIVE_DAYS,
+            idle_seconds=SEARCH_WARMUP_IDLE_SECONDS,
+            refresh_seconds=SEARCH_WARMUP_REFRESH_SECONDS,
+            batch_size=SEARCH_WARMUP_BATCH_SIZE,
+        ))
+        rows = await cur.fetchall()
+
+    # One at a time, so that the warm-up never takes more than one connection
+    for row in rows:
+        await print_stacktrace(lambda: warm_search(
+            person_id=row['person_id'],
+            gender_preference=row['gender_preference'],
+        ))
+
+    if rows:
+        print(f'search_warmup: warmed {len(rows)} searches')
+
+
+async def warm_searches_forever() -> None:
+    await asyncio.sleep(random.randint(0, MAX_RANDOM_START_DELAY))
+    while True:
+        await print_stacktrace(warm_searches_once)
+        await asyncio.sleep(SEARCH_WARMUP_POLL_SECONDS)
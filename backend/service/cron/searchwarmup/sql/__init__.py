@@ -0,0 +1,56 @@
+# People who were online recently, but not so recently that they're still
+# browsing, whose search results are stale. Their searches are run again so
+# that the first page is waiting for them when they come back.
+Q_SEARCH_WARMUP_BATCH = """
+WITH returning_person AS (
+    SELECT
+        person_id
+    FROM
+        duo_session
+    WHERE
+        last_online_time > NOW() - INTERVAL '1 day' * %(active_days)s
+    AND
+        signed_in
+    AND
+        person_id IS NOT NULL
+    GROUP BY
+        person_id
+    HAVING
+        -- People who are online now run their own searches
+        MAX(last_online_time) < NOW() - INTERVAL '1 second' * %(idle_seconds)s
+)
+SELECT
+    person.id AS person_id,
+    ARRAY(
+        SELECT
+            gender_id
+        FROM
+            search_preference_gender
+        WHERE
+            person_id = person.id
+    ) AS gender_preference
+FROM
+    returning_person
+JOIN
+    person
+ON
+    person.id = returning_person.person_id
+LEFT JOIN
+    search_cache
+ON
+    search_cache.searcher_person_id = person.id
+WHERE
+    person.activated
+AND
+    person.shadow_banned_at IS NULL
+AND (
+        search_cache.updated_at IS NULL
+    OR
+        search_cache.updated_at <
+        NOW() - INTERVAL '1 second' * %(refresh_seconds)s
+)
+ORDER BY
+    search_cache.updated_at NULLS FIRST
+LIMIT
+    %(batch_size)s
+"""
@@ -4,11 +4,12 @@ Redis-backed cache for the per-request session lookup performed by
 
 Every authenticated request resolves its bearer token to a `SessionInfo` by
 running `Q_GET_SESSION` against Postgres. That query is a primary-key point
-read, but the Flask API funnels *all* of its database work through a single
-shared connection guarded by a process-wide lock (`_api_conn_lock` in
-database/__init__.py), so the lookup serializes every authenticated request
-behind that lock. Caching the resolved session in Redis keeps the common case
-(a valid, unchanged session) off both the lock and the database entirely.
+read, but it still costs a round trip, and a checkout from the API worker's
+bounded connection pool (see `api_tx` in database/__init__.py) which every
+authenticated request would otherwise make just for it. Requests queue for
+that pool once it's exhausted. Caching the resolved session in Redis keeps the
+common case (a valid, unchanged session) off both the pool and the database
+entirely.
 
 Correctness model
 -----------------
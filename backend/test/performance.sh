@@ -5,4 +5,5 @@ cd "$script_dir"
 
 set -e
 
-./performance/search.sh
+./performance/benchmark.sh
+./performance/normalize.sh
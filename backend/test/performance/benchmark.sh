@@ -0,0 +1,37 @@
+#!/usr/bin/env bash
+
+# Fill the database with synthetic people, then load test search, the feed,
+# prospect profiles and chat as them. Prints a JSON report of each scenario's
+# throughput and p50/p95/p99 latencies.
+#
+# Usage:
+#   ./benchmark.sh [--no-sudo] [num_persons=100000] [seed=0] [seconds=30]
+#
+# The same seed and number of people always generate the same database.
+
+script_dir="$(cd "$(dirname "${BASH_SOURCE[0]}")" >/dev/null 2>&1 && pwd)"
+cd "$script_dir"
+
+source ../util/setup.sh
+
+set -e
+
+sudos=()
+if [[ "$1" = "--no-sudo" ]]
+then
+  shift
+else
+  sudos+=(sudo)
+fi
+
+num_persons=${1:-100000}
+seed=${2:-0}
+seconds=${3:-30}
+
+api_container=$("${sudos[@]}" docker ps | grep api- | cut -d ' ' -f 1)
+
+"${sudos[@]}" docker exec "$api_container" \
+  python3 -m benchmark.generate --reset --persons "$num_persons" --seed "$seed"
+
+"${sudos[@]}" docker exec "$api_container" \
+  python3 -m benchmark.run --seed "$seed" --seconds "$seconds"
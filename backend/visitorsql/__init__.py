@@ -112,17 +112,14 @@ visited_pass_3 AS (
         SELECT
             CASE
                 WHEN verification_required_to_view IS NULL
-                THEN photo.uuid
+                THEN prospect_card.profile_photo_uuid
                 ELSE NULL
             END AS uuid,
-            photo.blurhash
+            prospect_card.profile_photo_blurhash AS blurhash
         FROM
-            photo
+            prospect_card
         WHERE
-            photo.person_id = prospect.id
-        ORDER BY
-            photo.position
-        LIMIT 1
+            prospect_card.person_id = prospect.id
     ) AS visitor_photo
     ON
         TRUE